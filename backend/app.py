@@ -1,3 +1,4 @@
+import os
 from flask import Flask
 from flask_cors import CORS  
 from routes.upload import upload_bp
@@ -5,6 +6,7 @@ from routes.analyze import analyze_bp
 from routes.forecast import forecast_bp
 from routes.reorder import reorder_bp
 from routes.history import history_bp
+from services.render_pool import start_render_schedule
 
 app = Flask(__name__)
 CORS(app)
@@ -18,5 +20,10 @@ app.register_blueprint(history_bp)
 def ping():
     return {"message": "pong"}
 
+# Vẽ lại biểu đồ định kỳ cho mọi cách chạy (python app.py, flask run, WSGI server). Khi có
+# reloader (debug), chỉ tiến trình con chạy app (WERKZEUG_RUN_MAIN) mới khởi động lịch vẽ.
+if os.environ.get("WERKZEUG_RUN_MAIN") == "true" or not (app.debug or __name__ == "__main__"):
+    start_render_schedule()
+
 if __name__ == "__main__":
     app.run(debug=True, port=8000)
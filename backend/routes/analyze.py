@@ -1,36 +1,125 @@
-from flask import Blueprint, jsonify
-from services.eda import generate_eda_summary
-from services.eda import (
-    generate_monthly_orders_chart,
-    generate_top_categories_chart,
-    generate_delivery_delay_pie,
-    generate_shipping_duration_by_seller_chart,
-    generate_shipping_cost_by_category_chart
-)
+import base64
+import re
+from flask import Blueprint, Response, jsonify, request
+from services.aggregates import ROLLUP_DIMENSIONS
+from services.charts import chart_digest, get_chart_png
+from services.eda import generate_eda_summary, query_eda, EDA_CHARTS
 
 analyze_bp = Blueprint("analyze", __name__, url_prefix="/analyze")
 
+MONTH_PATTERN = re.compile(r"^\d{4}-\d{2}$")
+
+
+def _rollup_filters():
+    """
+    Bộ lọc từ query string: start_month / end_month (YYYY-MM) và danh sách giá trị
+    phân tách bằng dấu phẩy cho category, seller, state
+    """
+    filters = {}
+    for param in ("start_month", "end_month"):
+        value = request.args.get(param)
+        if value:
+            if not MONTH_PATTERN.match(value):
+                raise ValueError(f"{param} must be in YYYY-MM format")
+            filters[param] = value
+    for param, column in ROLLUP_DIMENSIONS.items():
+        if param == "month":
+            continue
+        values = [v.strip() for v in request.args.get(param, "").split(",") if v.strip()]
+        if values:
+            filters[column] = values
+    return filters
+
+
+def _filtered(generate):
+    try:
+        filters = _rollup_filters()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(generate(filters))
+
+
+def _chart_data_response(chart_name):
+    """
+    Dữ liệu biểu đồ (không vẽ ảnh); ?include_chart=true để kèm ảnh base64 như trước
+    """
+    try:
+        filters = _rollup_filters()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    generate, render = EDA_CHARTS[chart_name]
+    result = dict(generate(filters))
+    query = request.query_string.decode()
+    result["image_url"] = f"/analyze/chart/{chart_name}.png" + (f"?{query}" if query else "")
+    if request.args.get("include_chart", "false").lower() == "true":
+        png, _ = get_chart_png(chart_name, result["data"], render)
+        result["chart"] = base64.b64encode(png).decode("utf-8")
+    return jsonify(result)
+
+
 @analyze_bp.route("/summary", methods=["GET"])
 def get_eda_summary():
-    eda_result = generate_eda_summary()
-    return jsonify(eda_result)
+    return _filtered(generate_eda_summary)
 
 @analyze_bp.route("/chart/monthly-orders", methods=["GET"])
 def get_monthly_orders_chart():
-    return jsonify(generate_monthly_orders_chart())  # ✅ Trả cả chart + data
+    return _chart_data_response("monthly-orders")
 
 @analyze_bp.route("/chart/top-categories", methods=["GET"])
 def get_top_categories_chart():
-    return jsonify(generate_top_categories_chart())  # ✅ Trả cả chart + data
+    return _chart_data_response("top-categories")
 
 @analyze_bp.route("/chart/delivery-delay", methods=["GET"])
 def get_delivery_delay_chart():
-    return jsonify(generate_delivery_delay_pie())  # ✅ Trả cả chart + data
+    return _chart_data_response("delivery-delay")
 
 @analyze_bp.route("/chart/seller-shipping", methods=["GET"])
 def get_shipping_duration_by_seller_chart():
-    return jsonify(generate_shipping_duration_by_seller_chart())  # ✅ Trả cả chart + data
+    return _chart_data_response("seller-shipping")
 
 @analyze_bp.route("/chart/shipping-cost-category", methods=["GET"])
 def get_shipping_cost_by_category_chart():
-    return jsonify(generate_shipping_cost_by_category_chart())  # ✅ Trả cả chart + data
+    return _chart_data_response("shipping-cost-category")
+
+@analyze_bp.route("/chart/<chart_name>.png", methods=["GET"])
+def get_chart_image(chart_name):
+    """
+    Ảnh PNG của biểu đồ, vẽ khi cần và lưu theo hash của dữ liệu; ETag = hash đó (hỗ trợ 304)
+    """
+    if chart_name not in EDA_CHARTS:
+        return jsonify({"error": f"Unknown chart: {chart_name}"}), 404
+    try:
+        filters = _rollup_filters()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    generate, render = EDA_CHARTS[chart_name]
+    data = generate(filters)["data"]
+    digest = chart_digest(chart_name, data)
+    if digest in request.if_none_match:
+        response = Response(status=304)
+    else:
+        png, digest = get_chart_png(chart_name, data, render)
+        response = Response(png, mimetype="image/png")
+    response.set_etag(digest)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@analyze_bp.route("/query", methods=["GET"])
+def get_eda_query():
+    """
+    Thống kê theo nhóm từ rollup, ví dụ:
+    /analyze/query?group_by=state,month&category=toys&start_month=2017-01&limit=50
+    """
+    try:
+        filters = _rollup_filters()
+        group_by = [g.strip() for g in request.args.get("group_by", "").split(",") if g.strip()]
+        unknown = [g for g in group_by if g not in ROLLUP_DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown group_by dimension(s): {unknown}; use {list(ROLLUP_DIMENSIONS)}")
+        limit = request.args.get("limit", type=int)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(query_eda([ROLLUP_DIMENSIONS[g] for g in group_by], filters, limit))
@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, request
 from services.reorder import calculate_reorder_strategy, generate_optimization_recommendations, cluster_suppliers, analyze_bottlenecks
+from services.reorder import build_top_charts, bottleneck_threshold_sweep, DEFAULT_BOTTLENECK_THRESHOLD_DAYS
 import pandas as pd
 import os
 from flask import send_file
@@ -14,12 +15,11 @@ def get_reorder_strategy():
     
     # If not specified, check data size
     if not use_spark:
-        use_spark = is_large_dataset()
+        use_spark = is_large_dataset("reorder")
         
     if use_spark:
         print("🚀 Using Spark to calculate inventory strategy")
-        from services.spark_analytics import calculate_reorder_strategy_spark
-        result = calculate_reorder_strategy_spark()
+        result = calculate_reorder_strategy(engine="spark")
     else:
         result = calculate_reorder_strategy()
         
@@ -53,180 +53,49 @@ def get_reorder_strategy():
 
     return jsonify(result)
 
-@reorder_bp.route("/charts/top-reorder", methods=["GET"])
-def get_top_reorder_points():
-    # Tạo cache key riêng cho endpoint này để tối ưu hiệu suất
-    from utils.cache import get_cache, set_cache
-    cache_key = "top_reorder_points"
-    
+def _top_chart_response(cache_key):
+    """
+    Trả về một biểu đồ top-N; cả 6 biểu đồ được tính cùng lúc từ một kết quả chiến lược
+    (services.reorder.build_top_charts) và cache riêng từng cái
+    """
+    from utils.cache import get_cache
     cached = get_cache(cache_key)
     if cached:
         return jsonify({"data": cached})
-    
+
     # Kiểm tra xem có sử dụng Spark không
     use_spark = request.args.get("use_spark", "false").lower() == "true"
     if not use_spark:
-        use_spark = is_large_dataset()
-        
+        use_spark = is_large_dataset("reorder")
     if use_spark:
-        print("🚀 Sử dụng Spark để tính toán top reorder points")
-        from services.spark_analytics import get_top_reorder_points_spark
-        data = get_top_reorder_points_spark(15)
-    else:
-        result = calculate_reorder_strategy()
-        top_reorder = sorted(result, key=lambda x: x['reorder_point'], reverse=True)[:15]
-        data = [{"category": item["category"], "value": item["reorder_point"]} for item in top_reorder]
-    
-    # Cache kết quả
-    set_cache(cache_key, data, ttl_seconds=3600)
-    
-    return jsonify({"data": data})
+        print(f"🚀 Sử dụng Spark để tính toán {cache_key}")
+
+    charts = build_top_charts(15, engine="spark" if use_spark else None)
+    return jsonify({"data": charts[cache_key]})
+
+@reorder_bp.route("/charts/top-reorder", methods=["GET"])
+def get_top_reorder_points():
+    return _top_chart_response("top_reorder_points")
 
 @reorder_bp.route("/charts/top-safety-stock", methods=["GET"])
 def get_top_safety_stock():
-    from utils.cache import get_cache, set_cache
-    cache_key = "top_safety_stock"
-    
-    cached = get_cache(cache_key)
-    if cached:
-        return jsonify({"data": cached})
-    
-    # Kiểm tra xem có sử dụng Spark không
-    use_spark = request.args.get("use_spark", "false").lower() == "true"
-    if not use_spark:
-        use_spark = is_large_dataset()
-        
-    if use_spark:
-        print("🚀 Sử dụng Spark để tính toán top safety stock")
-        from services.spark_analytics import get_top_safety_stock_spark
-        data = get_top_safety_stock_spark(15)
-    else:
-        result = calculate_reorder_strategy()
-        top_ss = sorted(result, key=lambda x: x['safety_stock'], reverse=True)[:15]
-        data = [{"category": item["category"], "value": item["safety_stock"]} for item in top_ss]
-    
-    # Cache kết quả
-    set_cache(cache_key, data, ttl_seconds=3600)
-    
-    return jsonify({"data": data})
+    return _top_chart_response("top_safety_stock")
 
 @reorder_bp.route("/charts/top-lead-time", methods=["GET"])
 def get_top_lead_time():
-    from utils.cache import get_cache, set_cache
-    cache_key = "top_lead_time"
-    
-    cached = get_cache(cache_key)
-    if cached:
-        return jsonify({"data": cached})
-    
-    # Kiểm tra xem có sử dụng Spark không
-    use_spark = request.args.get("use_spark", "false").lower() == "true"
-    if not use_spark:
-        use_spark = is_large_dataset()
-        
-    if use_spark:
-        print("🚀 Sử dụng Spark để tính toán top lead time")
-        from services.spark_analytics import get_top_lead_time_spark
-        data = get_top_lead_time_spark(15)
-    else:
-        result = calculate_reorder_strategy()
-        top_lt = sorted(result, key=lambda x: x['avg_lead_time_days'], reverse=True)[:15]
-        data = [{"category": item["category"], "value": round(item["avg_lead_time_days"], 1)} for item in top_lt]
-    
-    # Cache kết quả
-    set_cache(cache_key, data, ttl_seconds=3600)
-    
-    return jsonify({"data": data})
+    return _top_chart_response("top_lead_time")
 
 @reorder_bp.route("/charts/top-inventory", methods=["GET"])
 def get_top_optimal_inventory():
-    from utils.cache import get_cache, set_cache
-    cache_key = "top_optimal_inventory"
-    
-    cached = get_cache(cache_key)
-    if cached:
-        return jsonify({"data": cached})
-    
-    # Kiểm tra xem có sử dụng Spark không
-    use_spark = request.args.get("use_spark", "false").lower() == "true"
-    if not use_spark:
-        use_spark = is_large_dataset()
-        
-    if use_spark:
-        print("🚀 Sử dụng Spark để tính toán top optimal inventory")
-        from services.spark_analytics import get_top_optimal_inventory_spark
-        data = get_top_optimal_inventory_spark(15)
-    else:
-        result = calculate_reorder_strategy()
-        top_inventory = sorted(result, key=lambda x: x['optimal_inventory'], reverse=True)[:15]
-        data = [{"category": item["category"], "value": item["optimal_inventory"]} for item in top_inventory]
-    
-    # Cache kết quả
-    set_cache(cache_key, data, ttl_seconds=3600)
-    
-    return jsonify({"data": data})
+    return _top_chart_response("top_optimal_inventory")
 
 @reorder_bp.route("/charts/top-holding-cost", methods=["GET"])
 def get_top_holding_cost():
-    from utils.cache import get_cache, set_cache
-    cache_key = "top_holding_cost"
-    
-    cached = get_cache(cache_key)
-    if cached:
-        return jsonify({"data": cached})
-    
-    # Kiểm tra xem có sử dụng Spark không
-    use_spark = request.args.get("use_spark", "false").lower() == "true"
-    if not use_spark:
-        use_spark = is_large_dataset()
-        
-    if use_spark:
-        print("🚀 Sử dụng Spark để tính toán top holding cost")
-        from services.spark_analytics import get_top_holding_cost_spark
-        data = get_top_holding_cost_spark(15)
-    else:
-        result = calculate_reorder_strategy()
-        top_cost = sorted(result, key=lambda x: x['holding_cost'], reverse=True)[:15]
-        data = [{"category": item["category"], "value": item["holding_cost"]} for item in top_cost]
-    
-    # Cache kết quả
-    set_cache(cache_key, data, ttl_seconds=3600)
-    
-    return jsonify({"data": data})
+    return _top_chart_response("top_holding_cost")
 
 @reorder_bp.route("/charts/top-potential-saving", methods=["GET"])
 def get_top_potential_saving():
-    from utils.cache import get_cache, set_cache
-    cache_key = "top_potential_saving"
-    
-    cached = get_cache(cache_key)
-    if cached:
-        return jsonify({"data": cached})
-    
-    # Kiểm tra xem có sử dụng Spark không
-    use_spark = request.args.get("use_spark", "false").lower() == "true"
-    if not use_spark:
-        use_spark = is_large_dataset()
-        
-    if use_spark:
-        print("🚀 Sử dụng Spark để tính toán top potential saving")
-        from services.spark_analytics import get_top_potential_saving_spark
-        data = get_top_potential_saving_spark(15)
-    else:
-        strategy = calculate_reorder_strategy()
-        recommendations_df = generate_optimization_recommendations(strategy, return_df=True)
-
-        if recommendations_df.empty or "potential_saving" not in recommendations_df.columns:
-            print("⚠️ Không có cột hoặc dữ liệu potential_saving.")
-            return jsonify({"data": []})
-
-        top_save = recommendations_df.sort_values("potential_saving", ascending=False).head(15)
-        data = [{"category": row["category"], "value": row["potential_saving"]} for _, row in top_save.iterrows()]
-    
-    # Cache kết quả
-    set_cache(cache_key, data, ttl_seconds=3600)
-    
-    return jsonify({"data": data})
+    return _top_chart_response("top_potential_saving")
 
 @reorder_bp.route("/download/recommendations", methods=["GET"])
 def download_recommendations():
@@ -239,16 +108,12 @@ def download_recommendations():
         # If not, check if Spark should be used
         use_spark = request.args.get("use_spark", "false").lower() == "true"
         if not use_spark:
-            use_spark = is_large_dataset()
+            use_spark = is_large_dataset("reorder")
             
         if use_spark:
             print("🚀 Using Spark to generate recommendations file")
-            from services.spark_analytics import generate_optimization_recommendations_spark
-            generated_path = generate_optimization_recommendations_spark()
-        else:
-            strategy = calculate_reorder_strategy()
-            from services.reorder import generate_optimization_recommendations
-            generated_path = generate_optimization_recommendations(strategy)
+        strategy = calculate_reorder_strategy(engine="spark" if use_spark else None)
+        generated_path = generate_optimization_recommendations(strategy)
 
         if generated_path and os.path.exists(generated_path):
             return send_file(generated_path, as_attachment=True)
@@ -273,12 +138,11 @@ def get_supplier_clusters():
             # Check if Spark should be used
             use_spark = request.args.get("use_spark", "false").lower() == "true"
             if not use_spark:
-                use_spark = is_large_dataset()
+                use_spark = is_large_dataset("reorder")
                 
             if use_spark:
                 print("🚀 Using Spark for supplier clustering")
-                from services.spark_analytics import cluster_suppliers_spark
-                result = cluster_suppliers_spark()
+                result = cluster_suppliers(engine="spark")
             else:
                 result = cluster_suppliers()
             
@@ -287,30 +151,60 @@ def get_supplier_clusters():
         print(f"❌ Error in get_supplier_clusters: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def _threshold_days(value):
+    threshold = int(value)
+    if threshold < 0:
+        raise ValueError("threshold must be a non-negative number of days")
+    return threshold
+
 @reorder_bp.route("/analysis/bottlenecks", methods=["GET"])
 def get_shipping_bottlenecks():
     try:
-        from services.mongodb import db
-        # Query data from MongoDB
-        result = list(db["shipping_bottlenecks"].find({}, {"_id": 0}))  # ✅ Hide _id
+        threshold = _threshold_days(request.args.get("threshold", DEFAULT_BOTTLENECK_THRESHOLD_DAYS))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid threshold: {str(e)}"}), 400
+
+    try:
+        result = []
+        # MongoDB chỉ lưu kết quả với ngưỡng mặc định
+        if threshold == DEFAULT_BOTTLENECK_THRESHOLD_DAYS:
+            from services.mongodb import db
+            # Query data from MongoDB
+            result = list(db["shipping_bottlenecks"].find({}, {"_id": 0}))  # ✅ Hide _id
         
         # If no data in MongoDB, perform analysis and save results
         if not result:
-            print("⚠️ No shipping_bottlenecks data in DB, will run new analysis...")
+            print(f"⚠️ No shipping_bottlenecks data for threshold {threshold}, will run new analysis...")
             
             # Check if Spark should be used
             use_spark = request.args.get("use_spark", "false").lower() == "true"
             if not use_spark:
-                use_spark = is_large_dataset()
+                use_spark = is_large_dataset("reorder")
                 
             if use_spark:
                 print("🚀 Using Spark for bottleneck analysis")
-                from services.spark_analytics import analyze_bottlenecks_spark
-                result = analyze_bottlenecks_spark()
+                result = analyze_bottlenecks(threshold, engine="spark")
             else:
-                result = analyze_bottlenecks()
+                result = analyze_bottlenecks(threshold)
             
         return jsonify(result)
     except Exception as e:
         print(f"❌ Error in get_shipping_bottlenecks: {str(e)}")
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+@reorder_bp.route("/analysis/bottlenecks/sweep", methods=["GET"])
+def get_bottleneck_threshold_sweep():
+    """
+    Tỷ lệ trễ tổng thể và số seller bottleneck theo nhiều ngưỡng, ví dụ ?thresholds=10,15,20,25
+    """
+    try:
+        thresholds = [_threshold_days(t) for t in request.args.get("thresholds", "10,15,20,25,30").split(",") if t.strip()]
+    except ValueError as e:
+        return jsonify({"error": f"Invalid thresholds: {str(e)}"}), 400
+
+    try:
+        use_spark = request.args.get("use_spark", "false").lower() == "true"
+        return jsonify(bottleneck_threshold_sweep(thresholds, engine="spark" if use_spark else None))
+    except Exception as e:
+        print(f"❌ Error in get_bottleneck_threshold_sweep: {str(e)}")
+        return jsonify({"error": str(e)}), 500
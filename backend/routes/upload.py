@@ -1,7 +1,9 @@
 import os
+import uuid
 from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
-from utils.cache import _cache_store  # ✅ Import cache store để clear
+from services.dataset import append_batch
+from services.ingest import stage_upload, submit_ingest, get_job
 
 upload_bp = Blueprint("upload", __name__, url_prefix="/upload")
 
@@ -23,14 +25,56 @@ def upload_file():
 
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        file.save(os.path.join(UPLOAD_FOLDER, filename))
 
-        # ✅ Xóa cache sau khi upload thành công
-        for key in list(_cache_store.keys()):
-            if key.startswith("chart_") or key.startswith("eda_") or key.startswith("forecast_") or key.startswith("reorder_"):
-                del _cache_store[key]
+        # ✅ Lưu tạm file rồi giao cho job nền (validate, ghi đè, dựng snapshot, làm nóng aggregate)
+        staged_path = stage_upload(file, filename)
+        job_id = submit_ingest(staged_path, filename)
 
-        return jsonify({"message": "File uploaded successfully", "filename": filename}), 200
+        return jsonify({
+            "message": "File accepted, ingestion started",
+            "filename": filename,
+            "job_id": job_id,
+            "status_url": f"/upload/status/{job_id}",
+        }), 202
 
     return jsonify({"error": "Invalid file type"}), 400
+
+
+@upload_bp.route("/status/<job_id>", methods=["GET"])
+def get_upload_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job), 200
+
+
+@upload_bp.route("/append", methods=["POST"])
+def append_batch_files():
+    """
+    Append a delta batch: form fields "orders" and/or "order_items" (CSV, same columns
+    as df_Orders.csv / df_OrderItems.csv). Only results affected by the batch are recomputed.
+    """
+    batch_files = {field: request.files.get(field) for field in ("orders", "order_items")}
+    batch_files = {field: f for field, f in batch_files.items() if f and f.filename}
+
+    if not batch_files:
+        return jsonify({"error": "Provide an 'orders' and/or 'order_items' file"}), 400
+    if not all(allowed_file(f.filename) for f in batch_files.values()):
+        return jsonify({"error": "Invalid file type"}), 400
+
+    staging_dir = os.path.join(UPLOAD_FOLDER, ".incoming")
+    os.makedirs(staging_dir, exist_ok=True)
+    staged = {}
+    try:
+        for field, f in batch_files.items():
+            staged[field] = os.path.join(staging_dir, f"{uuid.uuid4().hex}_{field}.csv")
+            f.save(staged[field])
+
+        summary = append_batch(orders_path=staged.get("orders"), order_items_path=staged.get("order_items"))
+        return jsonify({"message": "Batch appended successfully", **summary}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        for path in staged.values():
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,163 @@
+# services/aggregates.py
+import pandas as pd
+
+# Rollup: một dòng cho mỗi (tháng, danh mục, seller, bang của khách hàng) với các đại lượng
+# cộng dồn được (count / sum / sum of squares), nên có thể xây dựng theo từng chunk rồi gộp lại,
+# lọc và nhóm lại theo bất kỳ chiều nào mà không cần dữ liệu từng dòng
+ROLLUP_KEYS = ["order_month", "product_category_name", "seller_id", "customer_state"]
+ROLLUP_MEASURES = [
+    "item_count",
+    "duration_count", "duration_sum", "duration_sumsq",
+    "delay_count", "delayed_count", "delay_sum", "delay_sumsq",
+    "freight_count", "freight_sum", "freight_sumsq",
+]
+
+# Tên tham số truy vấn -> chiều của rollup
+ROLLUP_DIMENSIONS = {
+    "month": "order_month",
+    "category": "product_category_name",
+    "seller": "seller_id",
+    "state": "customer_state",
+}
+
+
+def build_rollup(df):
+    """
+    Aggregate a merged frame (or a chunk of it) into the additive rollup
+    """
+    duration = df["shipping_duration"]
+    delay = df["delivery_delay"]
+    freight = df["shipping_charges"]
+
+    work = pd.DataFrame({key: df[key] for key in ROLLUP_KEYS})
+    work["item_count"] = 1
+    work["duration_count"] = duration.notna().astype("int64")
+    work["duration_sum"] = duration.fillna(0).astype("float64")
+    work["duration_sumsq"] = work["duration_sum"] ** 2
+    work["delay_count"] = delay.notna().astype("int64")
+    work["delayed_count"] = (delay > 0).astype("int64")
+    work["delay_sum"] = delay.fillna(0).astype("float64")
+    work["delay_sumsq"] = work["delay_sum"] ** 2
+    work["freight_count"] = freight.notna().astype("int64")
+    work["freight_sum"] = freight.fillna(0).astype("float64")
+    work["freight_sumsq"] = work["freight_sum"] ** 2
+
+    return work.groupby(ROLLUP_KEYS, observed=True, dropna=False, sort=False).sum().reset_index()
+
+
+def combine_rollups(rollups):
+    """
+    Merge partial rollups by summing their measures per key
+    """
+    combined = pd.concat(rollups, ignore_index=True)
+    return combined.groupby(ROLLUP_KEYS, observed=True, dropna=False, sort=False)[ROLLUP_MEASURES].sum().reset_index()
+
+
+def monthly_order_counts(rollup):
+    """
+    Number of order items per month, sorted by month
+    """
+    return rollup.groupby("order_month", observed=True)["item_count"].sum().sort_index()
+
+
+def monthly_category_counts(rollup):
+    """
+    Number of order items per (month, category) as a month x category table
+    """
+    counts = rollup.groupby(["order_month", "product_category_name"], observed=True)["item_count"].sum()
+    return counts.unstack(fill_value=0).sort_index()
+
+
+def category_counts(rollup):
+    """
+    Number of order items per category, largest first
+    """
+    return rollup.groupby("product_category_name", observed=True)["item_count"].sum().sort_values(ascending=False)
+
+
+def _mean_std(n, total, total_sq):
+    """
+    Mean and sample standard deviation from count / sum / sum of squares
+    """
+    mean = total / n
+    variance = (total_sq - n * mean ** 2) / (n - 1)
+    return mean, variance.clip(lower=0) ** 0.5
+
+
+def seller_duration_stats(rollup):
+    """
+    Per-seller item count and shipping duration mean / std
+    """
+    sellers = rollup.groupby("seller_id", observed=True)[
+        ["item_count", "duration_count", "duration_sum", "duration_sumsq"]
+    ].sum()
+    mean, std = _mean_std(sellers["duration_count"], sellers["duration_sum"], sellers["duration_sumsq"])
+    return pd.DataFrame({
+        "item_count": sellers["item_count"],
+        "mean": mean,
+        "std": std,
+    })
+
+
+def delay_counts(rollup):
+    """
+    Delayed / on-time counts among orders with a known delivery delay
+    """
+    delayed = int(rollup["delayed_count"].sum())
+    total = int(rollup["delay_count"].sum())
+    return {"Delayed": delayed, "On Time": total - delayed}
+
+
+def category_shipping_cost(rollup):
+    """
+    Mean shipping charge per category
+    """
+    sums = rollup.groupby("product_category_name", observed=True)[["freight_sum", "freight_count"]].sum()
+    return sums["freight_sum"] / sums["freight_count"]
+
+
+def filter_rollup(rollup, start_month=None, end_month=None, **dimensions):
+    """
+    Rows of the rollup inside [start_month, end_month] ("YYYY-MM", inclusive) whose
+    dimensions match the given values, e.g. filter_rollup(r, customer_state=["SP", "RJ"])
+    """
+    mask = pd.Series(True, index=rollup.index)
+    if start_month or end_month:
+        months = rollup["order_month"].astype(str)
+        known = months != "NaT"
+        if start_month:
+            mask &= known & (months >= start_month)
+        if end_month:
+            mask &= known & (months <= end_month)
+    for column, values in dimensions.items():
+        if values:
+            mask &= rollup[column].astype(str).isin([str(v) for v in values])
+    return rollup[mask]
+
+
+def summarize_rollup(rollup, group_by=None):
+    """
+    Item count, shipping duration / delivery delay / freight mean and std and the delay
+    rate (%) per group of `group_by` rollup keys (the whole rollup as one row when empty)
+    """
+    if group_by:
+        sums = rollup.groupby(group_by, observed=True)[ROLLUP_MEASURES].sum()
+    else:
+        sums = rollup[ROLLUP_MEASURES].sum().to_frame().T
+
+    duration_mean, duration_std = _mean_std(sums["duration_count"], sums["duration_sum"], sums["duration_sumsq"])
+    delay_mean, delay_std = _mean_std(sums["delay_count"], sums["delay_sum"], sums["delay_sumsq"])
+    freight_mean, freight_std = _mean_std(sums["freight_count"], sums["freight_sum"], sums["freight_sumsq"])
+    summary = pd.DataFrame({
+        "item_count": sums["item_count"].astype("int64"),
+        "avg_shipping_duration": duration_mean,
+        "std_shipping_duration": duration_std,
+        "delivery_delay_rate": sums["delayed_count"] / sums["delay_count"] * 100,
+        "avg_delivery_delay": delay_mean,
+        "std_delivery_delay": delay_std,
+        "avg_shipping_cost": freight_mean,
+        "std_shipping_cost": freight_std,
+    })
+    if group_by:
+        summary = summary.reset_index()
+    return summary.sort_values("item_count", ascending=False, kind="stable")
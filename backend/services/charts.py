@@ -0,0 +1,54 @@
+# services/charts.py
+import hashlib
+import json
+import os
+import threading
+from utils.plot import fig_to_png
+
+# Ảnh biểu đồ được lưu theo hash của (tên biểu đồ, dữ liệu): cùng dữ liệu thì dùng lại ảnh,
+# dữ liệu đổi thì hash đổi nên không cần xóa cache khi upload dữ liệu mới
+CHART_IMAGE_DIR = os.path.join("charts", "cache")
+
+# pyplot không an toàn khi vẽ đồng thời từ nhiều thread của Flask
+_render_lock = threading.Lock()
+
+
+def chart_digest(name, data):
+    """
+    Content hash of a chart's data, used as image file name and ETag
+    """
+    payload = json.dumps({"chart": name, "data": data}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def chart_image_path(digest):
+    return os.path.join(CHART_IMAGE_DIR, f"{digest}.png")
+
+
+def store_chart_png(digest, png):
+    """
+    Atomically write a rendered image into the content-addressed store
+    """
+    path = chart_image_path(digest)
+    os.makedirs(CHART_IMAGE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(png)
+    os.replace(tmp_path, path)
+    return path
+
+
+def get_chart_png(name, data, render):
+    """
+    PNG bytes and digest of a chart, rendering it with `render(data)` only when
+    no image for this exact data exists yet
+    """
+    digest = chart_digest(name, data)
+    path = chart_image_path(digest)
+    if not os.path.exists(path):
+        with _render_lock:
+            if not os.path.exists(path):
+                print(f"🖼️ Rendering chart {name} ({digest})")
+                store_chart_png(digest, fig_to_png(render(data)))
+    with open(path, "rb") as f:
+        return f.read(), digest
@@ -0,0 +1,289 @@
+# services/dataset.py
+import os
+import shutil
+import threading
+import pandas as pd
+from services import preprocess
+from services.preprocess import load_preprocessed, dataset_version, should_stream, stream_rollup
+from services.aggregates import build_rollup, combine_rollups
+from services.engine import select_engine
+from services.duckdb_engine import build_rollup_duckdb
+from services.spark_session import release_spark_staging
+from utils.cache import clear_cache
+
+# Bộ nhớ đệm dùng chung cho toàn process: frame đã merge + phiên bản dữ liệu tạo ra nó
+_dataset_lock = threading.Lock()
+_dataset_state = {"version": None, "df": None}
+
+# Rollup tổng hợp (services.aggregates) theo cùng phiên bản dữ liệu
+_rollup_lock = threading.Lock()
+_rollup_state = {"version": None, "rollup": None}
+
+
+def get_dataset(columns=None):
+    """
+    Return the merged, feature-engineered dataset shared by every service.
+
+    The frame is built once per dataset version (size + mtime of the source CSVs)
+    and reused across requests. Callers receive a shallow view, projected to
+    `columns` if given: adding columns is safe, but values must not be modified in place.
+    """
+    version = dataset_version()
+    with _dataset_lock:
+        if _dataset_state["df"] is None or _dataset_state["version"] != version:
+            print("🔄 Building merged dataset (cache miss)...")
+            _dataset_state["df"] = load_preprocessed()
+            _dataset_state["version"] = version
+        df = _dataset_state["df"]
+    if columns:
+        return df[columns]
+    return df.copy(deep=False)
+
+
+def get_rollup():
+    """
+    Return the additive (month, category, seller, customer state) rollup for the current dataset.
+
+    Built from the memoized frame when it is already loaded, by DuckDB or Spark when
+    the engine cost model selects it (only the aggregate reaches the driver), by
+    streaming the CSVs in chunks when the dataset is too large to merge in memory,
+    and from get_dataset() otherwise.
+    """
+    version = dataset_version()
+    with _rollup_lock:
+        if _rollup_state["rollup"] is None or _rollup_state["version"] != version:
+            with _dataset_lock:
+                df = _dataset_state["df"] if _dataset_state["version"] == version else None
+            engine = select_engine("eda")
+            if df is not None:
+                rollup = build_rollup(df)
+            elif engine == "duckdb":
+                print("🦆 Building rollup with DuckDB...")
+                rollup = build_rollup_duckdb()
+            else:
+                rollup = None
+                if engine == "spark":
+                    try:
+                        print("⚡ Building rollup with Spark...")
+                        from services.spark_analytics import build_rollup_spark
+                        rollup = build_rollup_spark()
+                    except Exception as e:
+                        print(f"⚠️ Spark rollup failed, falling back: {str(e)}")
+                if rollup is None and should_stream():
+                    print("🌊 Building rollup with streaming preprocessing...")
+                    rollup = stream_rollup()
+                elif rollup is None:
+                    rollup = build_rollup(get_dataset())
+            _rollup_state["rollup"] = rollup
+            _rollup_state["version"] = version
+        return _rollup_state["rollup"]
+
+
+def invalidate_dataset():
+    """
+    Drop the memoized dataset, rollup and Spark staging directory so the next call rebuilds them
+    """
+    with _dataset_lock:
+        _dataset_state["df"] = None
+        _dataset_state["version"] = None
+    with _rollup_lock:
+        _rollup_state["rollup"] = None
+        _rollup_state["version"] = None
+    release_spark_staging()
+
+
+# Cache key phụ thuộc vào dữ liệu đã upload (xem utils.cache)
+DATASET_CACHE_PREFIXES = [
+    "chart_", "eda_", "forecast_", "reorder_", "top_", "supplier_clusters", "shipping_bottlenecks",
+]
+
+
+def invalidate_results(categories=None):
+    """
+    Clear cached results derived from the dataset.
+
+    With `categories`, per-category forecasts of other categories are kept, since
+    their inputs did not change; every aggregate across categories is still cleared.
+    """
+    if categories is None:
+        clear_cache(DATASET_CACHE_PREFIXES)
+        return
+
+    clear_cache([prefix for prefix in DATASET_CACHE_PREFIXES if prefix != "forecast_"])
+    clear_cache(["forecast_all_categories_"])
+    clear_cache([f"forecast_category:{category}:" for category in categories])
+
+
+def _append_rows(delta_path, filename):
+    """
+    Append the raw rows of a delta CSV to the stored upload, in the stored column order
+    """
+    target_path = os.path.join(preprocess.UPLOAD_FOLDER, filename)
+    if not os.path.exists(target_path):
+        shutil.copyfile(delta_path, target_path)
+        return
+
+    header = pd.read_csv(target_path, nrows=0).columns.tolist()
+    raw = pd.read_csv(delta_path, dtype=str, keep_default_na=False)
+    missing = [column for column in header if column not in raw.columns]
+    if missing:
+        raise ValueError(f"{filename} batch is missing columns: {missing}")
+    raw[header].to_csv(target_path, mode="a", header=False, index=False)
+
+
+def _lookup_orders(delta_orders, order_ids, df):
+    """
+    Order rows for the given IDs: from the batch first, then from the loaded
+    dataset, and only as a last resort from the stored orders CSV
+    """
+    parts = []
+    missing = set(order_ids)
+    if delta_orders is not None:
+        batch = delta_orders[delta_orders["order_id"].isin(missing)]
+        parts.append(batch)
+        missing -= set(batch["order_id"].astype(str))
+
+    order_columns = preprocess.CSV_SCHEMAS["df_Orders.csv"]["usecols"]
+    if missing and df is not None:
+        known = df.loc[df["order_id"].isin(missing), [c for c in order_columns if c in df.columns]]
+        known = known.drop_duplicates("order_id")
+        parts.append(known)
+        missing -= set(known["order_id"].astype(str))
+    if missing:
+        stored = preprocess.load_csv("df_Orders.csv")
+        parts.append(stored[stored["order_id"].isin(missing)])
+
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return None
+    return preprocess.concat_frames(parts) if len(parts) > 1 else parts[0]
+
+
+def _lookup_items(order_ids):
+    """
+    Stored order items of the given order IDs: items uploaded before their orders, which
+    the merged frame does not contain yet (the orders × items join is an inner join)
+    """
+    stored = preprocess.load_csv("df_OrderItems.csv")
+    items = stored[stored["order_id"].isin(set(order_ids))]
+    return items if len(items) else None
+
+
+def _merge_delta(delta_orders, delta_items, df):
+    """
+    Merged rows added by a batch: the batch items joined with their orders (batch, loaded
+    dataset or stored CSV), plus stored items whose orders arrive in this batch.
+    Returns (merged frame or None, number of batch items whose order was not found).
+    """
+    pairs = []
+    orphan_items = 0
+    if delta_items is not None and len(delta_items):
+        orders = _lookup_orders(delta_orders, set(delta_items["order_id"].astype(str)), df)
+        known = set() if orders is None else set(orders["order_id"].astype(str))
+        orphan_items = int((~delta_items["order_id"].astype(str).isin(known)).sum())
+        if orders is not None:
+            pairs.append((orders, delta_items))
+    if delta_orders is not None and len(delta_orders):
+        stored_items = _lookup_items(delta_orders["order_id"].astype(str))
+        if stored_items is not None:
+            pairs.append((delta_orders, stored_items))
+    if not pairs:
+        return None, orphan_items
+
+    customers = preprocess.load_csv("df_Customers.csv")
+    products = preprocess.load_csv("df_Products.csv")
+    parts = [
+        preprocess.merge_tables(customers.copy(), orders.copy(), items.copy(), products.copy())
+        for orders, items in pairs
+    ]
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return None, orphan_items
+    return (preprocess.concat_frames(parts) if len(parts) > 1 else parts[0]), orphan_items
+
+
+# Các batch append được ghi lần lượt (đọc CSV, nối thêm dòng), không chặn get_dataset / get_rollup
+_append_lock = threading.Lock()
+
+
+def append_batch(orders_path=None, order_items_path=None):
+    """
+    Append a delta batch of orders and/or order items to the stored dataset.
+
+    The raw rows are appended to df_Orders.csv / df_OrderItems.csv; the loaded
+    dataset and rollup are updated in place from the merged batch instead of
+    being rebuilt, and only results whose inputs changed are invalidated. Items may
+    arrive before their orders: they are stored and merged when the orders arrive.
+    The merge and the CSV writes run outside the dataset / rollup locks, which are
+    only taken to swap in the new state.
+
+    Returns a summary of what changed.
+    """
+    if orders_path is None and order_items_path is None:
+        raise ValueError("Nothing to append")
+
+    delta_orders = preprocess.read_typed_csv(orders_path, "df_Orders.csv") if orders_path else None
+    delta_items = preprocess.read_typed_csv(order_items_path, "df_OrderItems.csv") if order_items_path else None
+
+    with _append_lock:
+        old_version = dataset_version()
+        with _dataset_lock:
+            df = _dataset_state["df"] if _dataset_state["version"] == old_version else None
+        with _rollup_lock:
+            rollup = _rollup_state["rollup"] if _rollup_state["version"] == old_version else None
+
+        rebuild = False
+        try:
+            delta_df, orphan_items = _merge_delta(delta_orders, delta_items, df)
+        except Exception as e:
+            print(f"⚠️ Could not merge the batch incrementally, the dataset will be rebuilt: {str(e)}")
+            delta_df, orphan_items, rebuild = None, 0, True
+
+        if orders_path:
+            _append_rows(orders_path, "df_Orders.csv")
+        if order_items_path:
+            _append_rows(order_items_path, "df_OrderItems.csv")
+        new_version = dataset_version()
+        if rebuild:
+            invalidate_dataset()
+
+        merged = bool(delta_df is not None and len(delta_df))
+        new_df = preprocess.concat_frames([df, delta_df]) if merged and df is not None else df
+        new_rollup = combine_rollups([rollup, build_rollup(delta_df)]) if merged and rollup is not None else rollup
+
+        # Chỉ thay state khi nó vẫn là bản đã đọc ở trên; state khác phiên bản sẽ được build lại khi cần
+        swapped = False
+        with _dataset_lock:
+            if not rebuild and df is not None and _dataset_state["df"] is df and _dataset_state["version"] == old_version:
+                _dataset_state["df"] = new_df
+                _dataset_state["version"] = new_version
+                swapped = True
+        with _rollup_lock:
+            if not rebuild and rollup is not None and _rollup_state["rollup"] is rollup and _rollup_state["version"] == old_version:
+                _rollup_state["rollup"] = new_rollup
+                _rollup_state["version"] = new_version
+
+    if merged and swapped:
+        preprocess.save_snapshot(new_df, preprocess.source_fingerprint())
+
+    categories = []
+    months = []
+    sellers = 0
+    if merged:
+        categories = sorted(delta_df["product_category_name"].dropna().astype(str).unique().tolist())
+        months = sorted(delta_df["order_month"].astype(str).unique().tolist())
+        sellers = int(delta_df["seller_id"].nunique())
+        invalidate_results(categories)
+
+    if orphan_items:
+        print(f"⚠️ {orphan_items} order items have no matching order yet; they are stored and merged when their orders arrive")
+
+    return {
+        "orders_appended": 0 if delta_orders is None else int(len(delta_orders)),
+        "order_items_appended": 0 if delta_items is None else int(len(delta_items)),
+        "rows_merged": 0 if delta_df is None else int(len(delta_df)),
+        "items_without_orders": orphan_items,
+        "affected_months": months,
+        "affected_categories": categories,
+        "affected_sellers": sellers,
+    }
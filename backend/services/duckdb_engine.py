@@ -0,0 +1,189 @@
+# services/duckdb_engine.py
+import os
+from services import preprocess
+from services.aggregates import ROLLUP_KEYS
+from utils.currency import get_exchange_rate
+
+
+def _connect():
+    """
+    In-memory DuckDB connection using every core for parallel scans
+    """
+    import duckdb
+
+    con = duckdb.connect(database=":memory:")
+    con.execute(f"PRAGMA threads={os.cpu_count() or 1}")
+    return con
+
+
+def _csv(filename):
+    path = os.path.join(preprocess.UPLOAD_FOLDER, filename).replace("'", "''")
+    return f"read_csv('{path}', header=true, auto_detect=true)"
+
+
+def _register_merged(con):
+    """
+    Create the `merged` view: the preprocessed Parquet snapshot when it is up to date,
+    otherwise the preprocess joins and feature engineering expressed in SQL over the CSVs
+    """
+    snapshot = preprocess.snapshot_path(preprocess.source_fingerprint())
+    if os.path.exists(snapshot):
+        path = snapshot.replace("'", "''")
+        con.execute(f"CREATE VIEW merged AS SELECT * FROM read_parquet('{path}')")
+        return
+
+    item_columns = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {_csv('df_OrderItems.csv')}").fetchall()]
+    freight = "oi.shipping_charges" if "shipping_charges" in item_columns else "oi.freight_value"
+    rate = get_exchange_rate("BRL", "VND")
+
+    # Giống pandas: .dt.days làm tròn xuống theo ngày, order_month = 'NaT' khi thiếu ngày đặt hàng
+    con.execute(f"""
+        CREATE VIEW merged AS
+        WITH orders AS (
+            SELECT
+                CAST(order_id AS VARCHAR) AS order_id,
+                CAST(customer_id AS VARCHAR) AS customer_id,
+                order_status,
+                CAST(order_purchase_timestamp AS TIMESTAMP) AS order_purchase_timestamp,
+                CAST(order_delivered_timestamp AS TIMESTAMP) AS order_delivered_timestamp,
+                CAST(order_estimated_delivery_date AS TIMESTAMP) AS order_estimated_delivery_date
+            FROM {_csv('df_Orders.csv')}
+        )
+        SELECT
+            CAST(oi.order_id AS VARCHAR) AS order_id,
+            CAST(oi.product_id AS VARCHAR) AS product_id,
+            CAST(oi.seller_id AS VARCHAR) AS seller_id,
+            CAST(round_even(oi.price * {rate}, 0) AS BIGINT) AS price,
+            CAST({freight} AS DOUBLE) AS shipping_charges,
+            o.customer_id,
+            o.order_status,
+            o.order_purchase_timestamp,
+            o.order_delivered_timestamp,
+            o.order_estimated_delivery_date,
+            p.product_category_name,
+            p.product_weight_g,
+            p.product_length_cm,
+            p.product_height_cm,
+            p.product_width_cm,
+            c.customer_zip_code_prefix,
+            c.customer_city,
+            c.customer_state,
+            floor((epoch(o.order_delivered_timestamp) - epoch(o.order_purchase_timestamp)) / 86400) AS shipping_duration,
+            floor((epoch(o.order_delivered_timestamp) - epoch(o.order_estimated_delivery_date)) / 86400) AS delivery_delay,
+            coalesce(strftime(o.order_purchase_timestamp, '%Y-%m'), 'NaT') AS order_month
+        FROM {_csv('df_OrderItems.csv')} oi
+        JOIN orders o ON CAST(oi.order_id AS VARCHAR) = o.order_id
+        LEFT JOIN {_csv('df_Products.csv')} p ON CAST(oi.product_id AS VARCHAR) = CAST(p.product_id AS VARCHAR)
+        LEFT JOIN {_csv('df_Customers.csv')} c ON o.customer_id = CAST(c.customer_id AS VARCHAR)
+    """)
+
+
+def preprocess_data_duckdb():
+    """
+    Run the preprocess joins in DuckDB and return the merged frame with the same
+    categorical dtypes as the pandas path
+    """
+    con = _connect()
+    try:
+        _register_merged(con)
+        df = con.execute("SELECT * FROM merged").df()
+    finally:
+        con.close()
+
+    # Áp dụng kiểu dữ liệu đã khai báo trong CSV_SCHEMAS (category, float32, ...)
+    for schema in preprocess.CSV_SCHEMAS.values():
+        for column, dtype in schema["dtype"].items():
+            if column in df.columns and column != "price":
+                df[column] = df[column].astype(dtype)
+    df["order_month"] = df["order_month"].astype("category")
+    return df
+
+
+def build_rollup_duckdb():
+    """
+    Same rollup as services.aggregates.build_rollup, aggregated by DuckDB
+    """
+    keys = ", ".join(ROLLUP_KEYS)
+    con = _connect()
+    try:
+        _register_merged(con)
+        rollup = con.execute(f"""
+            SELECT
+                {keys},
+                count(*) AS item_count,
+                count(shipping_duration) AS duration_count,
+                coalesce(sum(shipping_duration), 0) AS duration_sum,
+                coalesce(sum(shipping_duration * shipping_duration), 0) AS duration_sumsq,
+                count(delivery_delay) AS delay_count,
+                count(*) FILTER (WHERE delivery_delay > 0) AS delayed_count,
+                coalesce(sum(delivery_delay), 0) AS delay_sum,
+                coalesce(sum(delivery_delay * delivery_delay), 0) AS delay_sumsq,
+                count(shipping_charges) AS freight_count,
+                coalesce(sum(shipping_charges), 0) AS freight_sum,
+                coalesce(sum(shipping_charges * shipping_charges), 0) AS freight_sumsq
+            FROM merged
+            GROUP BY {keys}
+        """).df()
+    finally:
+        con.close()
+
+    for column in ROLLUP_KEYS:
+        rollup[column] = rollup[column].astype("category")
+    return rollup
+
+
+def supplier_features_duckdb():
+    """
+    Per-seller clustering features: distinct orders, mean shipping days, mean freight (BRL)
+    """
+    con = _connect()
+    try:
+        _register_merged(con)
+        return con.execute("""
+            SELECT
+                seller_id,
+                count(DISTINCT order_id) AS total_orders,
+                avg(shipping_duration) AS avg_shipping_days,
+                avg(shipping_charges) AS avg_freight
+            FROM merged
+            GROUP BY seller_id
+            ORDER BY seller_id
+        """).df()
+    finally:
+        con.close()
+
+
+def seller_duration_counts_duckdb():
+    """
+    Per-seller shipping-duration histogram (seller_id, shipping_duration, n; NULL durations
+    included) and each seller's top category, following pandas' mode(): most frequent
+    category, ties broken by name
+    """
+    con = _connect()
+    try:
+        _register_merged(con)
+        counts = con.execute("""
+            SELECT seller_id, shipping_duration, count(*) AS n
+            FROM merged
+            WHERE seller_id IS NOT NULL
+            GROUP BY seller_id, shipping_duration
+        """).df()
+        top_categories = con.execute("""
+            SELECT seller_id, product_category_name AS top_category
+            FROM (
+                SELECT *, row_number() OVER (
+                    PARTITION BY seller_id ORDER BY n DESC, product_category_name
+                ) AS rank
+                FROM (
+                    SELECT seller_id, product_category_name, count(*) AS n
+                    FROM merged
+                    WHERE product_category_name IS NOT NULL
+                    GROUP BY seller_id, product_category_name
+                )
+            )
+            WHERE rank = 1
+        """).df()
+    finally:
+        con.close()
+
+    return counts, top_categories
@@ -1,6 +1,15 @@
 from collections import defaultdict
-from services.preprocess import preprocess_data
-from utils.plot import fig_to_base64
+import pandas as pd
+from services.dataset import get_rollup
+from services.aggregates import (
+    monthly_order_counts,
+    category_counts,
+    delay_counts,
+    seller_duration_stats,
+    category_shipping_cost,
+    filter_rollup,
+    summarize_rollup,
+)
 from utils.cache import get_cache, set_cache
 import matplotlib
 matplotlib.use("Agg")
@@ -8,165 +17,225 @@ import matplotlib.pyplot as plt
 from utils.currency import brl_to_vnd
 from services.mongodb import save_eda_summary
 
+def eda_rollup(filters=None):
+    """
+    Shared rollup, restricted by `filters` (start_month / end_month and lists of values
+    per rollup key, see aggregates.filter_rollup)
+    """
+    rollup = get_rollup()
+    return filter_rollup(rollup, **filters) if filters else rollup
+
+
+def eda_cache_key(base, filters=None):
+    """
+    Cache key of an EDA result; filtered results get their own key per filter set
+    """
+    if not filters:
+        return base
+    parts = [f"{k}={','.join(map(str, v)) if isinstance(v, list) else v}" for k, v in sorted(filters.items())]
+    return f"{base}:{'&'.join(parts)}"
+
+
 # ✅ Tổng quan EDA
-def generate_eda_summary():
-    cache_key = "eda_summary"
+def generate_eda_summary(filters=None):
+    cache_key = eda_cache_key("eda_summary", filters)
     cached = get_cache(cache_key)
     if cached:
         return cached
 
-    df = preprocess_data()
+    # Tổng hợp từ rollup dùng chung (hỗ trợ cả chế độ streaming cho dữ liệu lớn);
+    # các biểu đồ bên dưới cũng đọc từ cùng rollup nên cả dashboard chỉ cần một lần quét dữ liệu
+    rollup = eda_rollup(filters)
     result = defaultdict(dict)
 
-    orders_by_month = df.groupby("order_month").size().sort_index()
+    orders_by_month = monthly_order_counts(rollup)
     result["orders_by_month"] = orders_by_month.to_dict()
 
-    top_categories = df["product_category_name"].value_counts().head(15)
+    top_categories = category_counts(rollup).head(15)
     result["top_categories"] = top_categories.to_dict()
 
-    delay_counts = df["delivery_delay"].dropna().apply(lambda x: x > 0).value_counts()
-    total_delays = delay_counts.sum()
-    delay_rate = (delay_counts.get(True, 0) / total_delays) * 100
+    delays = delay_counts(rollup)
+    total_delays = delays["Delayed"] + delays["On Time"]
+    delay_rate = (delays["Delayed"] / total_delays) * 100 if total_delays else 0.0
     result["delivery_delay_rate"] = round(delay_rate, 2)
 
-    seller_duration = df.groupby("seller_id")["shipping_duration"].mean().sort_values().head(10)
+    seller_duration = seller_duration_stats(rollup)["mean"].sort_index().sort_values().head(10)
     result["avg_shipping_duration_by_seller"] = seller_duration.to_dict()
 
-    shipping_cost = df.groupby("product_category_name")["shipping_charges"].mean().sort_values(ascending=False).head(15)
+    shipping_cost = category_shipping_cost(rollup).sort_index().sort_values(ascending=False).head(15)
     result["avg_shipping_cost_by_category"] = shipping_cost.to_dict()
 
-    save_eda_summary(dict(result))
+    if not filters:
+        save_eda_summary(dict(result))
 
     set_cache(cache_key, result, ttl_seconds=3600)
     return result
 
 
+# Các hàm generate_* chỉ trả về dữ liệu biểu đồ; ảnh PNG được vẽ riêng từ chính dữ liệu đó
+# (render_*) khi có yêu cầu và được lưu theo hash của dữ liệu (services.charts)
+
 # ✅ Chart 1: Đơn hàng theo tháng
-def generate_monthly_orders_chart():
-    cache_key = "chart_monthly_orders"
+def generate_monthly_orders_chart(filters=None):
+    cache_key = eda_cache_key("chart_monthly_orders", filters)
     cached = get_cache(cache_key)
     if cached:
         return cached
 
-    df = preprocess_data()
-    orders_by_month = df.groupby("order_month").size().sort_index()
+    orders_by_month = monthly_order_counts(eda_rollup(filters))
     chart_data = [{"month": k, "value": int(v)} for k, v in orders_by_month.items()]
 
+    result = {"data": chart_data}
+    set_cache(cache_key, result, ttl_seconds=3600)
+    return result
+
+
+def render_monthly_orders_chart(chart_data):
+    orders_by_month = pd.Series({d["month"]: d["value"] for d in chart_data}, dtype="int64")
+
     fig, ax = plt.subplots(figsize=(10, 4))
     orders_by_month.plot(kind="line", ax=ax, marker="o")
     ax.set_title("Số lượng đơn hàng theo tháng")
     ax.set_xlabel("Tháng")
     ax.set_ylabel("Số đơn hàng")
     ax.tick_params(axis='x', rotation=45)
-
-    result = {
-        "chart": fig_to_base64(fig),
-        "data": chart_data
-    }
-
-    set_cache(cache_key, result, ttl_seconds=3600)
-    return result
+    return fig
 
 
 # ✅ Chart 2: Top categories
-def generate_top_categories_chart():
-    cache_key = "chart_top_categories"
+def generate_top_categories_chart(filters=None):
+    cache_key = eda_cache_key("chart_top_categories", filters)
     cached = get_cache(cache_key)
     if cached:
         return cached
 
-    df = preprocess_data()
-    top_categories = df["product_category_name"].value_counts().head(15)
+    top_categories = category_counts(eda_rollup(filters)).head(15)
     chart_data = [{"category": k, "value": int(v)} for k, v in top_categories.items()]
 
+    result = {"data": chart_data}
+    set_cache(cache_key, result, ttl_seconds=3600)
+    return result
+
+
+def render_top_categories_chart(chart_data):
+    top_categories = pd.Series({d["category"]: d["value"] for d in chart_data}, dtype="int64")
+
     fig, ax = plt.subplots(figsize=(8, 4))
     top_categories.plot(kind="bar", ax=ax, color="skyblue")
     ax.set_title("Top 15 Product Categories by Order Volume")
     ax.set_ylabel("Number of Products")
     ax.set_xlabel("Category")
     ax.tick_params(axis='x', rotation=45)
-
-    result = {
-        "chart": fig_to_base64(fig),
-        "data": chart_data
-    }
-
-    set_cache(cache_key, result, ttl_seconds=3600)
-    return result
+    return fig
 
 
 # ✅ Chart 3: Delivery delay ratio
-def generate_delivery_delay_pie():
-    cache_key = "chart_delivery_delay"
+def generate_delivery_delay_pie(filters=None):
+    cache_key = eda_cache_key("chart_delivery_delay", filters)
     cached = get_cache(cache_key)
     if cached:
         return cached
 
-    df = preprocess_data()
-    delay_counts = df["delivery_delay"].dropna().apply(lambda x: "Delayed" if x > 0 else "On Time").value_counts()
-    chart_data = [{"status": k, "count": int(v)} for k, v in delay_counts.items()]
+    # Thứ tự giảm dần như value_counts() (quyết định màu của từng phần trên biểu đồ)
+    delays = pd.Series(delay_counts(eda_rollup(filters))).sort_values(ascending=False)
+    delays = delays[delays > 0]
+    chart_data = [{"status": k, "count": int(v)} for k, v in delays.items()]
+
+    result = {"data": chart_data}
+    set_cache(cache_key, result, ttl_seconds=3600)
+    return result
+
+
+def render_delivery_delay_pie(chart_data):
+    delays = pd.Series({d["status"]: d["count"] for d in chart_data}, dtype="int64")
 
     fig, ax = plt.subplots()
-    delay_counts.plot(kind="pie", autopct='%1.1f%%', ax=ax, startangle=90, colors=["salmon", "lightgreen"])
+    delays.plot(kind="pie", autopct='%1.1f%%', ax=ax, startangle=90, colors=["salmon", "lightgreen"])
     ax.set_ylabel("")
     ax.set_title("Order Delivery Delay Ratio")
-
-    result = {
-        "chart": fig_to_base64(fig),
-        "data": chart_data
-    }
-
-    set_cache(cache_key, result, ttl_seconds=3600)
-    return result
+    return fig
 
 
 # ✅ Chart 4: Thời gian giao hàng theo seller
-def generate_shipping_duration_by_seller_chart():
-    cache_key = "chart_shipping_duration_seller"
+def generate_shipping_duration_by_seller_chart(filters=None):
+    cache_key = eda_cache_key("chart_shipping_duration_seller", filters)
     cached = get_cache(cache_key)
     if cached:
         return cached
 
-    df = preprocess_data()
-    top_sellers = df["seller_id"].value_counts().head(15).index
-    seller_duration = df[df["seller_id"].isin(top_sellers)].groupby("seller_id")["shipping_duration"].mean().sort_values()
+    sellers = seller_duration_stats(eda_rollup(filters))
+    top_sellers = sellers["item_count"].sort_values(ascending=False).head(15).index
+    seller_duration = sellers.loc[top_sellers, "mean"].dropna().sort_values()
     chart_data = [{"seller": str(k), "duration": round(v, 2)} for k, v in seller_duration.items()]
 
+    result = {"data": chart_data}
+    set_cache(cache_key, result, ttl_seconds=3600)
+    return result
+
+
+def render_shipping_duration_by_seller_chart(chart_data):
+    seller_duration = pd.Series({d["seller"]: d["duration"] for d in chart_data}, dtype="float64")
+
     fig, ax = plt.subplots(figsize=(8, 4))
     seller_duration.plot(kind="barh", ax=ax, color="orange")
     ax.set_xlabel("Thời gian giao hàng (ngày)")
     ax.set_title("Thời gian giao hàng trung bình (Top 15 seller)")
-
-    result = {
-        "chart": fig_to_base64(fig),
-        "data": chart_data
-    }
-
-    set_cache(cache_key, result, ttl_seconds=3600)
-    return result
+    return fig
 
 
 # ✅ Chart 5: Shipping cost by category
-def generate_shipping_cost_by_category_chart():
-    cache_key = "chart_shipping_cost_category"
+def generate_shipping_cost_by_category_chart(filters=None):
+    cache_key = eda_cache_key("chart_shipping_cost_category", filters)
     cached = get_cache(cache_key)
     if cached:
         return cached
 
-    df = preprocess_data()
-    shipping_cost = df.groupby("product_category_name")["shipping_charges"].mean().sort_values(ascending=False).head(15)
-    chart_data = [{"category": k, "cost": brl_to_vnd(round(v, 2))} for k, v in shipping_cost.items()]
+    shipping_cost = category_shipping_cost(eda_rollup(filters)).dropna().sort_values(ascending=False).head(15)
+    # round(v, 2) của Python (làm tròn thập phân chính xác) để giữ nguyên kết quả như trước
+    shipping_cost_vnd = brl_to_vnd(shipping_cost.map(lambda v: round(v, 2)))
+    chart_data = [{"category": k, "cost": int(v)} for k, v in shipping_cost_vnd.items()]
+
+    result = {"data": chart_data}
+    set_cache(cache_key, result, ttl_seconds=3600)
+    return result
+
+
+def render_shipping_cost_by_category_chart(chart_data):
+    shipping_cost = pd.Series({d["category"]: d["cost"] for d in chart_data}, dtype="int64")
 
     fig, ax = plt.subplots(figsize=(8, 4))
     shipping_cost.plot(kind="bar", ax=ax, color="violet")
     ax.set_ylabel("Shipping Cost (VND)")
     ax.set_title("Top 15 Categories by Shipping Cost")
     ax.tick_params(axis='x', rotation=45)
+    return fig
+
+
+# Tên biểu đồ (đường dẫn /analyze/chart/<tên>) -> (hàm lấy dữ liệu, hàm vẽ từ dữ liệu)
+EDA_CHARTS = {
+    "monthly-orders": (generate_monthly_orders_chart, render_monthly_orders_chart),
+    "top-categories": (generate_top_categories_chart, render_top_categories_chart),
+    "delivery-delay": (generate_delivery_delay_pie, render_delivery_delay_pie),
+    "seller-shipping": (generate_shipping_duration_by_seller_chart, render_shipping_duration_by_seller_chart),
+    "shipping-cost-category": (generate_shipping_cost_by_category_chart, render_shipping_cost_by_category_chart),
+}
+
+
+# ✅ Truy vấn tùy chọn: lọc + nhóm theo các chiều của rollup
+def query_eda(group_by=None, filters=None, limit=None):
+    cache_key = eda_cache_key(f"eda_query:{','.join(group_by or [])}:{limit}", filters)
+    cached = get_cache(cache_key)
+    if cached:
+        return cached
+
+    summary = summarize_rollup(eda_rollup(filters), group_by)
+    if limit:
+        summary = summary.head(limit)
 
-    result = {
-        "chart": fig_to_base64(fig),
-        "data": chart_data
-    }
+    numeric = summary.select_dtypes("float").columns
+    summary[numeric] = summary[numeric].round(2)
+    rows = summary.astype(object).where(summary.notna(), None).to_dict(orient="records")
+    result = {"group_by": group_by or [], "filters": filters or {}, "rows": rows}
 
     set_cache(cache_key, result, ttl_seconds=3600)
     return result
@@ -0,0 +1,109 @@
+# services/engine.py
+import os
+import importlib.util
+from services import preprocess
+
+# Chọn engine xử lý (pandas / duckdb / spark) theo mô hình chi phí đơn giản:
+# thời gian ước lượng = khởi động + số dòng * trọng số thao tác / thông lượng,
+# loại bỏ engine không đủ bộ nhớ hoặc chưa được cài đặt.
+ENGINE_PROFILES = {
+    # rows_per_sec: thông lượng trên một core; memory_factor: byte RAM cần cho mỗi byte dữ liệu
+    "pandas": {"startup_sec": 0.0, "rows_per_sec": 2_000_000, "parallel": False, "memory_factor": 3.0},
+    "duckdb": {"startup_sec": 0.05, "rows_per_sec": 10_000_000, "parallel": True, "memory_factor": 0.3},
+    "spark": {"startup_sec": 8.0, "rows_per_sec": 3_000_000, "parallel": True, "memory_factor": 0.0},
+}
+
+# Trọng số tương đối của từng thao tác (số lần quét / độ nặng so với preprocess)
+OPERATION_WEIGHTS = {
+    "preprocess": 1.0,
+    "eda": 0.6,
+    "reorder": 0.8,
+    "forecast": 0.4,
+}
+
+# Tỷ lệ RAM còn trống được phép dùng
+MEMORY_BUDGET_RATIO = 0.6
+
+# Ước lượng số dòng theo phiên bản dữ liệu, để không phải lấy mẫu file mỗi lần
+_row_estimates = {}
+
+
+def engine_available(engine):
+    if engine == "pandas":
+        return True
+    module = {"duckdb": "duckdb", "spark": "pyspark"}[engine]
+    return importlib.util.find_spec(module) is not None
+
+
+def available_memory():
+    """
+    Available system memory in bytes (MemAvailable on Linux, free pages otherwise)
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return 4 * 1024 ** 3
+
+
+def estimate_rows(filename, sample_bytes=1024 * 1024):
+    """
+    Estimate the number of data rows of an upload CSV from the average line length of its head
+    """
+    path = os.path.join(preprocess.UPLOAD_FOLDER, filename)
+    if not os.path.exists(path):
+        return 0
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if key not in _row_estimates:
+        with open(path, "rb") as f:
+            sample = f.read(sample_bytes)
+        lines = sample.count(b"\n")
+        if len(sample) >= stat.st_size or lines <= 1:
+            _row_estimates[key] = max(lines - 1, 0)
+        else:
+            _row_estimates[key] = int(stat.st_size / (len(sample) / lines))
+    return _row_estimates[key]
+
+
+def estimate_cost(engine, operation, rows, data_bytes, memory):
+    """
+    Estimated seconds for `operation` on `engine`, or None when it does not fit in memory
+    """
+    profile = ENGINE_PROFILES[engine]
+    if data_bytes * profile["memory_factor"] > memory * MEMORY_BUDGET_RATIO:
+        return None
+    throughput = profile["rows_per_sec"] * ((os.cpu_count() or 1) if profile["parallel"] else 1)
+    return profile["startup_sec"] + OPERATION_WEIGHTS.get(operation, 1.0) * rows / throughput
+
+
+def select_engine(operation="preprocess"):
+    """
+    Pick the cheapest available engine for `operation` on the current dataset.
+    The ANALYTICS_ENGINE environment variable forces a specific engine.
+    """
+    forced = os.getenv("ANALYTICS_ENGINE")
+    if forced in ENGINE_PROFILES and engine_available(forced):
+        return forced
+
+    rows = estimate_rows("df_OrderItems.csv") + estimate_rows("df_Orders.csv")
+    data_bytes = preprocess.total_dataset_size()
+    memory = available_memory()
+
+    costs = {}
+    for engine in ENGINE_PROFILES:
+        if not engine_available(engine):
+            continue
+        cost = estimate_cost(engine, operation, rows, data_bytes, memory)
+        if cost is not None:
+            costs[engine] = cost
+
+    if not costs:
+        return "pandas"
+    return min(costs, key=costs.get)
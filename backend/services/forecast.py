@@ -1,19 +1,25 @@
 import os
+import base64
 import pandas as pd
 import matplotlib.pyplot as plt
-from services.preprocess import preprocess_data
-from utils.plot import fig_to_base64
+from services.dataset import get_dataset
+from services.charts import get_chart_png
+from services.horizon import recursive_forecast
+from services.smoothing import fit_exponential_smoothing
+from services.model_registry import MODEL_REGISTRY_DIR, lookup_model, save_model, entry_key, entry_path
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import numpy as np
 from utils.cache import get_cache, set_cache
 from utils.currency import brl_to_vnd
+import time
 import traceback
 import warnings
 import xgboost as xgb
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 from statsmodels.tsa.arima.model import ARIMA
-from statsmodels.tools.sm_exceptions import ValueWarning
+from statsmodels.tools.sm_exceptions import ValueWarning, ConvergenceWarning
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from services.mongodb import save_forecast_result  
 
 # ⚠️ Suppress known warnings
@@ -22,12 +28,73 @@ warnings.filterwarnings("ignore", message=".*Non-invertible starting MA paramete
 warnings.filterwarnings("ignore", category=UserWarning)
 warnings.filterwarnings("ignore", category=ValueWarning)
 
-
-def forecast_demand(periods=6):
-    print(f"🚀 Starting forecast_demand service with XGBoost & ARIMA ({periods} periods)...")
+# Siêu tham số của mô hình theo từng chuỗi; mô hình đã huấn luyện được lưu trong services.model_registry
+XGB_PARAMS = {"n_estimators": 100, "learning_rate": 0.1, "max_depth": 3, "objective": "reg:squarederror"}
+ARIMA_ORDER = (1, 1, 1)
+# Giới hạn số vòng lặp của bộ tối ưu ARIMA và số tiến trình fit song song nhiều chuỗi
+ARIMA_MAXITER = int(os.getenv("ARIMA_MAXITER", 50))
+ARIMA_WORKERS = int(os.getenv("ARIMA_WORKERS", min(4, os.cpu_count() or 1)))
+# Warm start khi chuỗi chỉ có thêm tháng mới: thêm số cây này, huấn luyện lại từ đầu khi vượt giới hạn
+WARM_START_ROUNDS = 20
+MAX_BOOSTED_ROUNDS = 200
+
+# Cách dự báo nhiều danh mục ở /forecast/demand/all: "category" = một mô hình cho mỗi danh mục,
+# "panel" = một mô hình XGBoost toàn cục cho mọi danh mục (services.panel_forecast)
+FORECAST_MODES = ("category", "panel")
+FORECAST_MODE = os.getenv("FORECAST_MODE", "category").strip().lower()
+# Mô hình thống kê đi kèm XGBoost: "arima" = ARIMA(1, 1, 1) fit riêng từng chuỗi,
+# "ets" = exponential smoothing vector hóa cho mọi chuỗi trong một lần (services.smoothing).
+# Response giữ nguyên dạng với cả hai: cột / metric "stat" và điểm biểu đồ type "Stat" là dự báo
+# thống kê, trường "stat_model" (và "model" của điểm biểu đồ) cho biết mô hình thực sự dùng
+# ("ARIMA" hoặc "ETS"). Cột / metric "arima" là alias cũ của "stat" (deprecated, giữ cho client cũ).
+STAT_MODELS = {"arima": "ARIMA", "ets": "ETS"}
+STAT_MODEL = os.getenv("FORECAST_STAT_MODEL", "arima").strip().lower()
+
+# Cấu hình sai thì báo lỗi ngay khi khởi động, không phải ở request / tác vụ nền đầu tiên
+if FORECAST_MODE not in FORECAST_MODES:
+    raise ValueError(f"FORECAST_MODE must be one of {list(FORECAST_MODES)}, got {FORECAST_MODE!r}")
+if STAT_MODEL not in STAT_MODELS:
+    raise ValueError(f"FORECAST_STAT_MODEL must be one of {list(STAT_MODELS)}, got {STAT_MODEL!r}")
+
+
+def resolve_stat_model(stat_model=None):
+    """
+    Normalized statistical model name (STAT_MODEL when not given); raises ValueError for unknown names
+    """
+    stat_model = (stat_model or STAT_MODEL).strip().lower()
+    if stat_model not in STAT_MODELS:
+        raise ValueError(f"Unknown stat_model: {stat_model}; use {list(STAT_MODELS)}")
+    return stat_model
+
+
+def render_forecast_chart(chart_data):
+    """
+    Actual vs XGBoost vs ARIMA / ETS figure of the overall forecast, drawn from its chart_data
+    """
+    points = pd.DataFrame(chart_data)
+    points["month"] = pd.to_datetime(points["month"])
+    series = {kind: group.set_index("month")["orders"] for kind, group in points.groupby("type", sort=False)}
+    stat_label = points.loc[points["type"] == "Stat", "model"].iloc[0]
+
+    fig, ax = plt.subplots(figsize=(10, 4))
+    series["Actual"].plot(ax=ax, label="Actual", marker="o")
+    series["XGBoost"].plot(ax=ax, label="XGBoost", linestyle="--", marker="x")
+    series["Stat"].plot(ax=ax, label=stat_label, linestyle="--", marker="s")
+    ax.set_title(f"Order Forecast Comparison: XGBoost vs {stat_label}")
+    ax.set_ylabel("Number of Orders")
+    ax.set_xlabel("Month")
+    ax.legend()
+    ax.grid(True)
+    return fig
+
+
+def forecast_demand(periods=6, render_chart=True, stat_model=None):
+    stat_model = resolve_stat_model(stat_model)
+    stat_label = STAT_MODELS[stat_model]
+    print(f"🚀 Starting forecast_demand service with XGBoost & {stat_label} ({periods} periods)...")
     try:
-        df = preprocess_data()
-        monthly_orders = df.groupby("order_month").size()
+        df = get_dataset()
+        monthly_orders = df.groupby("order_month", observed=True).size()
         monthly_orders.index = pd.to_datetime(monthly_orders.index)
 
         # 🧠 Ensure freq = MS
@@ -57,94 +124,69 @@ def forecast_demand(periods=6):
 
         X, y = df_features.drop("y", axis=1), df_features["y"]
 
-        # 🚀 Train XGBoost
-        model_xgb = xgb.XGBRegressor(n_estimators=100, learning_rate=0.1, max_depth=3, objective="reg:squarederror")
-        model_xgb.fit(X, y)
+        # 🚀 Train XGBoost (hoặc dùng lại mô hình đã lưu trong registry)
+        model_xgb = fit_xgb_model("Overall", monthly_orders, X, y)
         y_pred_xgb = model_xgb.predict(X)
         mae_xgb = mean_absolute_error(y, y_pred_xgb)
         rmse_xgb = np.sqrt(mean_squared_error(y, y_pred_xgb))
 
-        # 📈 ARIMA
-        arima_model = ARIMA(monthly_orders, order=(1, 1, 1))
-        arima_fit = arima_model.fit()
-        forecast_arima = arima_fit.forecast(steps=periods)
-        mae_arima = mean_absolute_error(y[1:], arima_fit.fittedvalues[1:])
-        rmse_arima = np.sqrt(mean_squared_error(y[1:], arima_fit.fittedvalues[1:]))
+        # 📈 ARIMA / ETS
+        forecast_stat, mae_stat, rmse_stat = fit_statistical_forecasts({"Overall": monthly_orders}, periods, stat_model)["Overall"]
 
         # 🔮 Future prediction
         last_date = monthly_orders.index[-1]
         future_index = [last_date + relativedelta(months=i) for i in range(1, periods + 1)]
-        forecast_xgb = []
-        future_features = pd.DataFrame(index=future_index)
-        future_features["month"] = [d.month for d in future_index]
-        future_features["quarter"] = [d.quarter for d in future_index]
-        future_features["trend"] = np.arange(len(df_features), len(df_features) + periods)
-        extended_y = df_features["y"].tolist()
-
-        for i in range(periods):
-            idx = future_index[i]
-            for j in range(1, 4):
-                val = forecast_xgb[i - j] if i >= j else extended_y[-j]
-                future_features.loc[idx, f"lag_{j}"] = val
-            rolling_window = (extended_y + forecast_xgb[:i])[-3:]
-            future_features.loc[idx, "rolling_mean_3"] = np.mean(rolling_window)
-            future_features.loc[idx, "rolling_std_3"] = np.std(rolling_window)
-
-            pred = model_xgb.predict(future_features.loc[idx].values.reshape(1, -1))[0]
-            forecast_xgb.append(int(max(100, pred)))
-            # ✅ Logging debug
-            print(f"\n📅 [DEBUG] Tháng dự báo: {idx.strftime('%Y-%m')}")
-            print(f"  🔹 Lag_1: {future_features.loc[idx, 'lag_1']}")
-            print(f"  🔹 Lag_2: {future_features.loc[idx, 'lag_2']}")
-            print(f"  🔹 Lag_3: {future_features.loc[idx, 'lag_3']}")
-            print(f"  🔹 Rolling Mean 3: {future_features.loc[idx, 'rolling_mean_3']:.2f}")
-            print(f"  🔹 Rolling Std 3: {future_features.loc[idx, 'rolling_std_3']:.2f}")
-            print(f"  🔸 Dự báo XGBoost: {pred:.2f}")
+        forecast_xgb = recursive_forecast(
+            model_xgb.predict, [df_features["y"].to_numpy()], [last_date], [len(df_features)], periods,
+            floor=100, labels=["Overall"],
+        )[0].tolist()
         forecast_series_xgb = pd.Series(forecast_xgb, index=future_index)
-        forecast_series_arima = pd.Series([int(val) for val in forecast_arima], index=future_index)
+        forecast_series_stat = pd.Series(forecast_stat, index=future_index)
 
         # 📊 Chart & Table
         forecast_df = pd.DataFrame({
             "month": [d.strftime("%Y-%m") for d in future_index],
             "xgboost": forecast_xgb,
-            "arima": forecast_series_arima.tolist(),
+            "stat": forecast_series_stat.tolist(),
+            "arima": forecast_series_stat.tolist(),  # deprecated alias của "stat"
         })
         chart_data = [{"month": date.strftime("%Y-%m"), "orders": int(val), "type": "Actual"} for date, val in monthly_orders.items()]
         chart_data += [{"month": date.strftime("%Y-%m"), "orders": int(val), "type": "XGBoost"} for date, val in forecast_series_xgb.items()]
-        chart_data += [{"month": date.strftime("%Y-%m"), "orders": int(val), "type": "ARIMA"} for date, val in forecast_series_arima.items()]
-
-        fig, ax = plt.subplots(figsize=(10, 4))
-        monthly_orders.plot(ax=ax, label="Actual", marker="o")
-        forecast_series_xgb.plot(ax=ax, label="XGBoost", linestyle="--", marker="x")
-        forecast_series_arima.plot(ax=ax, label="ARIMA", linestyle="--", marker="s")
-        ax.set_title("Order Forecast Comparison: XGBoost vs ARIMA")
-        ax.set_ylabel("Number of Orders")
-        ax.set_xlabel("Month")
-        ax.legend()
-        ax.grid(True)
-        charts_dir = os.path.join(os.path.dirname(__file__), "../charts/forecast")
-        os.makedirs(charts_dir, exist_ok=True)
-        fig.savefig(os.path.join(charts_dir, "forecast_chart.png"), bbox_inches="tight")
+        chart_data += [{"month": date.strftime("%Y-%m"), "orders": int(val), "type": "Stat", "model": stat_label}
+                       for date, val in forecast_series_stat.items()]
+
+        # Ảnh được lưu theo hash của chart_data: dùng lại ảnh đã vẽ sẵn (services.render_pool) nếu có
+        chart = ""
+        if render_chart:
+            png, _ = get_chart_png("forecast-overall", chart_data, render_forecast_chart)
+            charts_dir = os.path.join(os.path.dirname(__file__), "../charts/forecast")
+            os.makedirs(charts_dir, exist_ok=True)
+            with open(os.path.join(charts_dir, "forecast_chart.png"), "wb") as f:
+                f.write(png)
+            chart = base64.b64encode(png).decode("utf-8")
 
         save_forecast_result({
             "category": "Overall",
-            "model": "XGBoost + ARIMA",
+            "model": f"XGBoost + {stat_label}",
             "forecast_table": forecast_df.to_dict(orient="records"),
             "mae_rmse_comparison": {
                 "xgboost": {"mae": round(mae_xgb, 2), "rmse": round(rmse_xgb, 2)},
-                "arima": {"mae": round(mae_arima, 2), "rmse": round(rmse_arima, 2)}
+                "stat": {"mae": round(mae_stat, 2), "rmse": round(rmse_stat, 2)},
+                "arima": {"mae": round(mae_stat, 2), "rmse": round(rmse_stat, 2)}
             }
         })
 
         return {
             "status": "success",
             "category": "Overall",
+            "stat_model": stat_label,
             "forecast_table": forecast_df.to_dict(orient="records"),
             "chart_data": chart_data,
-            "chart": fig_to_base64(fig),
+            "chart": chart,
             "mae_rmse_comparison": {
                 "xgboost": {"mae": round(mae_xgb, 2), "rmse": round(rmse_xgb, 2)},
-                "arima": {"mae": round(mae_arima, 2), "rmse": round(rmse_arima, 2)}
+                "stat": {"mae": round(mae_stat, 2), "rmse": round(rmse_stat, 2)},
+                "arima": {"mae": round(mae_stat, 2), "rmse": round(rmse_stat, 2)}
             }
         }
 
@@ -160,138 +202,448 @@ def forecast_demand(periods=6):
         }
 
 
-def forecast_demand_by_category(category_name, periods=6):
-    print(f"🚀 Forecasting for category: {category_name}")
-    try:
-        df = preprocess_data()
-        df_cat = df[df["product_category_name"] == category_name]
-        if df_cat.empty or len(df_cat) < 10:
-            raise ValueError("Not enough data for category: " + category_name)
-
-        monthly_orders = df_cat.groupby("order_month").size()
-        monthly_orders.index = pd.to_datetime(monthly_orders.index)
-
-        # 🧠 Ensure freq
-        if monthly_orders.index.freq is None:
-            full_range = pd.date_range(start=monthly_orders.index.min(), end=monthly_orders.index.max(), freq="MS")
-            monthly_orders = monthly_orders.reindex(full_range).interpolate("linear").fillna(0)
-            monthly_orders.index.freq = "MS"
+def category_forecast_cache_key(category_name, periods=6, stat_model=None):
+    stat_model = resolve_stat_model(stat_model)
+    return f"forecast_category:{category_name}:{periods}" + ("" if stat_model == "arima" else f":{stat_model}")
 
-        # 🧹 Remove outliers
-        if len(monthly_orders) >= 5:
-            mean, std = monthly_orders.mean(), monthly_orders.std()
-            monthly_orders = monthly_orders[(monthly_orders > mean - 3 * std) & (monthly_orders < mean + 3 * std)]
-
-        df_features = pd.DataFrame(index=monthly_orders.index)
-        df_features["y"] = monthly_orders
-        for i in range(1, 4):
-            df_features[f"lag_{i}"] = df_features["y"].shift(i)
-        df_features["month"] = df_features.index.month
-        df_features["quarter"] = df_features.index.quarter
-        df_features["trend"] = np.arange(len(df_features))
-        df_features["rolling_mean_3"] = df_features["y"].rolling(3).mean().shift(1)
-        df_features["rolling_std_3"] = df_features["y"].rolling(3).std().shift(1)
-        df_features = df_features.bfill().fillna(0)
-
-        X, y = df_features.drop("y", axis=1), df_features["y"]
-        model = xgb.XGBRegressor(n_estimators=100, learning_rate=0.1, max_depth=3, objective="reg:squarederror")
-        model.fit(X, y)
-        y_pred_xgb = model.predict(X)
-        mae_xgb = mean_absolute_error(y, y_pred_xgb)
-        rmse_xgb = np.sqrt(mean_squared_error(y, y_pred_xgb))
-
-        last_date = monthly_orders.index[-1]
-        future_index = [last_date + relativedelta(months=i) for i in range(1, periods + 1)]
-        forecast_xgb = []
-        future_features = pd.DataFrame(index=future_index)
-        future_features["month"] = [d.month for d in future_index]
-        future_features["quarter"] = [d.quarter for d in future_index]
-        future_features["trend"] = np.arange(len(df_features), len(df_features) + periods)
-        extended_y = df_features["y"].tolist()
-
-        for i in range(periods):
-            idx = future_index[i]
-            for j in range(1, 4):
-                val = forecast_xgb[i - j] if i >= j else extended_y[-j]
-                future_features.loc[idx, f"lag_{j}"] = val
-            rolling_window = (extended_y + forecast_xgb[:i])[-3:]
-            future_features.loc[idx, "rolling_mean_3"] = np.mean(rolling_window)
-            future_features.loc[idx, "rolling_std_3"] = np.std(rolling_window)
-
-            pred = model.predict(future_features.loc[idx].values.reshape(1, -1))[0]
-            forecast_xgb.append(int(max(0, pred)))
-
-            # ✅ Debug log
-            print(f"\n📅 [DEBUG] Tháng dự báo: {idx.strftime('%Y-%m')} ({category_name})")
-            print(f"  🔹 Lag_1: {future_features.loc[idx, 'lag_1']}")
-            print(f"  🔹 Lag_2: {future_features.loc[idx, 'lag_2']}")
-            print(f"  🔹 Lag_3: {future_features.loc[idx, 'lag_3']}")
-            print(f"  🔹 Rolling Mean 3: {future_features.loc[idx, 'rolling_mean_3']:.2f}")
-            print(f"  🔹 Rolling Std 3: {future_features.loc[idx, 'rolling_std_3']:.2f}")
-            print(f"  🔸 Dự báo XGBoost: {pred:.2f}")
-
-        forecast_series_xgb = pd.Series(forecast_xgb, index=future_index)
-
-        arima_model = ARIMA(monthly_orders, order=(1, 1, 1))
-        arima_fit = arima_model.fit()
-        forecast_arima = arima_fit.forecast(steps=periods)
-        mae_arima = mean_absolute_error(y[1:], arima_fit.fittedvalues[1:])
-        rmse_arima = np.sqrt(mean_squared_error(y[1:], arima_fit.fittedvalues[1:]))
-        fallback_val = monthly_orders.iloc[-1]
-        forecast_arima_clean = [int(val) if not np.isnan(val) else int(fallback_val) for val in forecast_arima]
-        forecast_series_arima = pd.Series(forecast_arima_clean, index=future_index)
-
-        forecast_df = pd.DataFrame({
-            "month": [d.strftime("%Y-%m") for d in future_index],
-            "xgboost": forecast_xgb,
-            "arima": forecast_series_arima.tolist()
-        })
 
-        chart_data = [{"month": date.strftime("%Y-%m"), "orders": int(val), "type": "Actual", "category": category_name}
-                      for date, val in monthly_orders.items()]
-        chart_data += [{"month": date.strftime("%Y-%m"), "orders": int(val), "type": "XGBoost", "category": category_name}
-                       for date, val in forecast_series_xgb.items()]
-        chart_data += [{"month": date.strftime("%Y-%m"), "orders": int(val), "type": "ARIMA", "category": category_name}
-                       for date, val in forecast_series_arima.items()]
-
-        # ✅ Tính thêm inventory & holding cost
-        optimal_inventory = int(np.max(forecast_xgb)) if forecast_xgb else 0
-        # Chuyển đổi từ BRL sang VND (giả sử chi phí giữ kho 5 BRL/đơn vị)
-        unit_holding_cost = brl_to_vnd(5)
-        holding_cost = optimal_inventory * unit_holding_cost
-        
-        save_forecast_result({
-            "category": category_name,
-            "model": "XGBoost + ARIMA",
-            "forecast_table": forecast_df.to_dict(orient="records"),
-            "optimal_inventory": optimal_inventory,
-            "holding_cost": holding_cost,
-            "mae_rmse_comparison": {
-                "xgboost": {"mae": round(mae_xgb, 2), "rmse": round(rmse_xgb, 2)},
-                "arima": {"mae": round(mae_arima, 2), "rmse": round(rmse_arima, 2)}
-            }
-        })
+def forecast_demand_by_category(category_name, periods=6, stat_model=None):
+    stat_model = resolve_stat_model(stat_model)
+    cache_key = category_forecast_cache_key(category_name, periods, stat_model)
+    cached = get_cache(cache_key)
+    if cached:
+        return cached
 
-        return {
-            "status": "success",
-            "category": category_name,
-            "forecast_table": forecast_df.to_dict(orient="records"),
-            "chart_data": chart_data,
-            "optimal_inventory": optimal_inventory,
-            "holding_cost": holding_cost,
-            "mae_rmse_comparison": {
-                "xgboost": {"mae": round(mae_xgb, 2), "rmse": round(rmse_xgb, 2)},
-                "arima": {"mae": round(mae_arima, 2), "rmse": round(rmse_arima, 2)}
-            }
-        }
+    print(f"🚀 Forecasting for category: {category_name}")
+    try:
+        xgb_part = category_xgb_forecast(category_name, periods)
+        monthly_orders = xgb_part["history"]
+        forecast_stat, mae_stat, rmse_stat = fit_statistical_forecasts({category_name: monthly_orders}, periods, stat_model)[category_name]
+        result = category_forecast_result(
+            category_name, monthly_orders, xgb_part["future_index"], xgb_part["forecast_xgb"], forecast_stat,
+            xgb_part["xgb_metrics"], {"mae": mae_stat, "rmse": rmse_stat}, stat_model=stat_model,
+        )
+        set_cache(cache_key, result, ttl_seconds=3600)
+        return result
 
     except Exception as e:
         print(f"❌ Error in forecast_demand_by_category({category_name}): {str(e)}")
         print(traceback.format_exc())
+        return category_forecast_error(category_name, e)
+
+
+def category_xgb_forecast(category_name, periods=6):
+    """
+    History and XGBoost forecast of one category: {"history", "future_index", "forecast_xgb",
+    "xgb_metrics"}; the statistical leg is fitted separately (batched across categories
+    by forecast_all_categories)
+    """
+    df = get_dataset()
+    df_cat = df[df["product_category_name"] == category_name]
+    if df_cat.empty or len(df_cat) < 10:
+        raise ValueError("Not enough data for category: " + category_name)
+
+    monthly_orders = df_cat.groupby("order_month", observed=True).size()
+    monthly_orders.index = pd.to_datetime(monthly_orders.index)
+
+    # 🧠 Ensure freq
+    if monthly_orders.index.freq is None:
+        full_range = pd.date_range(start=monthly_orders.index.min(), end=monthly_orders.index.max(), freq="MS")
+        monthly_orders = monthly_orders.reindex(full_range).interpolate("linear").fillna(0)
+        monthly_orders.index.freq = "MS"
+
+    # 🧹 Remove outliers
+    if len(monthly_orders) >= 5:
+        mean, std = monthly_orders.mean(), monthly_orders.std()
+        monthly_orders = monthly_orders[(monthly_orders > mean - 3 * std) & (monthly_orders < mean + 3 * std)]
+
+    df_features = pd.DataFrame(index=monthly_orders.index)
+    df_features["y"] = monthly_orders
+    for i in range(1, 4):
+        df_features[f"lag_{i}"] = df_features["y"].shift(i)
+    df_features["month"] = df_features.index.month
+    df_features["quarter"] = df_features.index.quarter
+    df_features["trend"] = np.arange(len(df_features))
+    df_features["rolling_mean_3"] = df_features["y"].rolling(3).mean().shift(1)
+    df_features["rolling_std_3"] = df_features["y"].rolling(3).std().shift(1)
+    df_features = df_features.bfill().fillna(0)
+
+    X, y = df_features.drop("y", axis=1), df_features["y"]
+    model = fit_xgb_model(category_name, monthly_orders, X, y)
+    y_pred_xgb = model.predict(X)
+    mae_xgb = mean_absolute_error(y, y_pred_xgb)
+    rmse_xgb = np.sqrt(mean_squared_error(y, y_pred_xgb))
+
+    last_date = monthly_orders.index[-1]
+    future_index = [last_date + relativedelta(months=i) for i in range(1, periods + 1)]
+    forecast_xgb = recursive_forecast(
+        model.predict, [df_features["y"].to_numpy()], [last_date], [len(df_features)], periods,
+        labels=[category_name],
+    )[0].tolist()
+
+    return {
+        "history": monthly_orders,
+        "future_index": future_index,
+        "forecast_xgb": forecast_xgb,
+        "xgb_metrics": {"mae": mae_xgb, "rmse": rmse_xgb},
+    }
+
+
+def safe_forecast(category_name, stat_model=None):
+    try:
+        result = forecast_demand_by_category(category_name, stat_model=stat_model)
+        result["category"] = category_name
+        return result
+    except Exception as e:
+        print(f"⚠️ Skipping category {category_name} due to error: {str(e)}")
         return {
-            "status": "error",
-            "message": f"Cannot create forecast for category {category_name}: {str(e)}",
+            "category": category_name,
             "forecast_table": [],
             "chart_data": [],
-            "mae_rmse_comparison": {}
-        }
\ No newline at end of file
+            "status": "error",
+            "message": str(e)
+        }
+
+
+def safe_xgb_forecast(category_name, periods=6):
+    try:
+        return category_xgb_forecast(category_name, periods)
+    except Exception as e:
+        print(f"⚠️ Skipping category {category_name} due to error: {str(e)}")
+        return {"error": str(e)}
+
+
+def all_categories_cache_key(limit=15, mode=None, stat_model=None):
+    mode = mode or FORECAST_MODE
+    stat_model = resolve_stat_model(stat_model)
+    cache_key = f"forecast_all_categories_{limit}" + ("" if mode == "category" else f"_{mode}")
+    return cache_key + ("" if stat_model == "arima" else f"_{stat_model}")
+
+
+def forecast_all_categories(limit=15, mode=None, stat_model=None, use_spark=False, force_refresh=False):
+    """
+    Overall forecast followed by the forecasts of the first `limit` categories, keeping only
+    the successful ones; cached under all_categories_cache_key (shared by /forecast/demand/all,
+    the reorder strategy and the chart pre-renderer)
+    """
+    from services.preprocess import is_large_dataset
+
+    mode = mode or FORECAST_MODE
+    stat_model = resolve_stat_model(stat_model)
+    cache_key = all_categories_cache_key(limit, mode, stat_model)
+
+    # Nếu không force và có cache, sử dụng cache
+    cached_result = get_cache(cache_key) if not force_refresh else None
+    if cached_result:
+        print(f"✅ Returning cached forecast for {limit} categories")
+        return cached_result
+
+    # Nếu không chỉ định, kiểm tra kích thước dữ liệu
+    if not use_spark:
+        use_spark = is_large_dataset("forecast")
+
+    all_forecasts = []
+
+    if mode == "panel":
+        df = get_dataset(["product_category_name"])
+        limited_categories = list(dict.fromkeys(df["product_category_name"].dropna().unique().tolist()))[:limit]
+
+        print("🚀 Forecasting for Tổng thể...")
+        overall = forecast_demand(stat_model=stat_model)
+        overall["category"] = "Overall"
+        all_forecasts.append(overall)
+
+        print(f"🚀 Panel forecast for {len(limited_categories)} categories with one global model...")
+        from services.panel_forecast import forecast_categories_panel
+        all_forecasts.extend(forecast_categories_panel(limited_categories, stat_model=stat_model))
+
+    # Sử dụng Spark cho tập dữ liệu lớn
+    elif use_spark:
+        # Một Spark job dự báo song song tất cả danh mục (kèm dự báo tổng thể ở đầu danh sách)
+        print(f"🚀 Sử dụng Spark để dự báo song song cho {limit} danh mục...")
+        from services.spark_analytics import forecast_all_categories_spark
+        t0 = time.time()
+        category_forecasts = forecast_all_categories_spark(limit)
+        if category_forecasts and category_forecasts[0].get("category") == "Tổng thể":
+            category_forecasts[0]["category"] = "Overall"
+        all_forecasts.extend(category_forecasts)
+        print(f"✅ Done Spark forecasts in {round(time.time() - t0, 2)}s")
+
+    else:
+        # Sử dụng Pandas và ProcessPoolExecutor như trước
+        df = get_dataset()
+        all_categories = df["product_category_name"].dropna().unique().tolist()
+        unique_categories = list(dict.fromkeys(all_categories))
+        limited_categories = unique_categories[:limit]
+
+        print("🚀 Forecasting for Tổng thể...")
+        t0 = time.time()
+        overall = forecast_demand(stat_model=stat_model)
+        overall["category"] = "Overall"
+        all_forecasts.append(overall)
+        print(f"✅ Done Tổng thể in {round(time.time() - t0, 2)}s")
+
+        # Danh mục có dữ liệu không đổi (vẫn còn cache) thì dùng lại, chỉ dự báo lại phần còn lại
+        pending_categories = []
+        for cat in limited_categories:
+            cached_category = get_cache(category_forecast_cache_key(cat, stat_model=stat_model))
+            if cached_category:
+                all_forecasts.append(cached_category)
+            else:
+                pending_categories.append(cat)
+
+        print(f"🚀 Forecasting for {len(pending_categories)} categories in parallel "
+              f"({len(limited_categories) - len(pending_categories)} reused from cache)...")
+        # Mỗi worker chỉ huấn luyện XGBoost của một danh mục
+        xgb_parts = {}
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            futures = {executor.submit(safe_xgb_forecast, cat): cat for cat in pending_categories}
+        for future in as_completed(futures):
+            category = futures[future]
+            try:
+                xgb_parts[category] = future.result()
+            except Exception as e:
+                xgb_parts[category] = {"error": str(e)}
+
+        # 📈 ARIMA / ETS của mọi danh mục trong một lần (một ma trận ETS hoặc một pool ARIMA)
+        histories = {cat: part["history"] for cat, part in xgb_parts.items() if "error" not in part}
+        stat_forecasts = fit_statistical_forecasts(histories, 6, stat_model) if histories else {}
+
+        for category in pending_categories:
+            part = xgb_parts[category]
+            try:
+                if "error" in part:
+                    raise ValueError(part["error"])
+                forecast_stat, mae_stat, rmse_stat = stat_forecasts[category]
+                result = category_forecast_result(
+                    category, part["history"], part["future_index"], part["forecast_xgb"], forecast_stat,
+                    part["xgb_metrics"], {"mae": mae_stat, "rmse": rmse_stat}, stat_model=stat_model,
+                )
+                set_cache(category_forecast_cache_key(category, stat_model=stat_model), result, ttl_seconds=60 * 60)
+            except Exception as e:
+                print(f"❌ Forecast failed for {category}: {str(e)}")
+                result = category_forecast_error(category, e)
+            result["category"] = category
+            print(f"✅ Forecast success for {category} - status: {result.get('status')}")
+            all_forecasts.append(result)
+
+    # 👉 Lọc ra những danh mục thành công
+    successful_forecasts = [f for f in all_forecasts if f.get("status") == "success"]
+    print(f"📊 Tổng cộng {len(successful_forecasts)}/{len(all_forecasts)} danh mục có dự báo thành công")
+
+    set_cache(cache_key, successful_forecasts, ttl_seconds=60 * 60)
+    return successful_forecasts
+
+
+def category_forecast_error(category_name, error):
+    return {
+        "status": "error",
+        "message": f"Cannot create forecast for category {category_name}: {str(error)}",
+        "forecast_table": [],
+        "chart_data": [],
+        "mae_rmse_comparison": {}
+    }
+
+
+def fit_xgb_model(series_id, monthly_orders, X, y):
+    """
+    XGBoost model of a monthly series, through the model registry: reused as is when
+    the series is unchanged, warm-started with WARM_START_ROUNDS extra trees when only
+    new months were appended, trained from scratch otherwise
+    """
+    config = {"features": list(X.columns), "params": XGB_PARAMS}
+    status, entry = lookup_model("xgboost", series_id, monthly_orders, config)
+    model = xgb.XGBRegressor(**XGB_PARAMS)
+    try:
+        if status == "reuse":
+            model.load_model(entry_path(entry["key"], ".ubj"))
+            print(f"♻️ Reusing XGBoost model for {series_id}")
+            return model
+        if status == "warm" and entry["rounds"] + WARM_START_ROUNDS <= MAX_BOOSTED_ROUNDS:
+            print(f"🔥 Warm-starting XGBoost model for {series_id}")
+            model.set_params(n_estimators=WARM_START_ROUNDS)
+            model.fit(X, y, xgb_model=entry_path(entry["key"], ".ubj"))
+        else:
+            model.fit(X, y)
+    except Exception as e:
+        print(f"⚠️ Cannot reuse XGBoost model for {series_id}, training from scratch: {str(e)}")
+        model = xgb.XGBRegressor(**XGB_PARAMS)
+        model.fit(X, y)
+
+    try:
+        os.makedirs(MODEL_REGISTRY_DIR, exist_ok=True)
+        model.save_model(entry_path(entry_key("xgboost", series_id, monthly_orders, config), ".ubj"))
+        save_model("xgboost", series_id, monthly_orders, config, {"rounds": model.get_booster().num_boosted_rounds()})
+    except Exception as e:
+        print(f"⚠️ Cannot save XGBoost model for {series_id}: {str(e)}")
+    return model
+
+
+def drift_forecast(monthly_orders, periods):
+    """
+    Closed-form fallback for ARIMA: random walk with drift (the drift is the mean monthly
+    change). Returns (forecast as ints, in-sample MAE, RMSE) like fit_arima_forecast.
+    """
+    values = monthly_orders.to_numpy(dtype=float)
+    drift = (values[-1] - values[0]) / (len(values) - 1) if len(values) > 1 else 0.0
+    forecast = values[-1] + drift * np.arange(1, periods + 1)
+    errors = values[1:] - (values[:-1] + drift)
+    mae = float(np.mean(np.abs(errors))) if len(errors) else 0.0
+    rmse = float(np.sqrt(np.mean(errors ** 2))) if len(errors) else 0.0
+    return [int(val) for val in forecast], mae, rmse
+
+
+def fit_arima_forecast(monthly_orders, periods, series_id=None):
+    """
+    ARIMA(1, 1, 1) forecast of a monthly series: (forecast as ints, in-sample MAE, RMSE).
+
+    With a series_id, parameters stored in the model registry are reused without
+    re-optimizing when the series is unchanged, and used as start_params when only new
+    months were appended. The optimizer runs at most ARIMA_MAXITER iterations; when it
+    fails or does not converge, the closed-form drift_forecast is used instead.
+    """
+    config = {"order": list(ARIMA_ORDER)}
+    status, entry = lookup_model("arima", series_id, monthly_orders, config) if series_id else (None, None)
+    try:
+        arima_model = ARIMA(monthly_orders, order=ARIMA_ORDER)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", ConvergenceWarning)
+            if status == "reuse":
+                arima_fit = arima_model.filter(np.array(entry["params"]))
+            else:
+                start_params = np.array(entry["params"]) if status == "warm" else None
+                arima_fit = arima_model.fit(start_params=start_params, method_kwargs={"maxiter": ARIMA_MAXITER})
+        forecast_arima = np.asarray(arima_fit.forecast(steps=periods), dtype=float)
+
+        converged = status == "reuse" or (arima_fit.mle_retvals or {}).get("converged", True)
+        if not converged or not np.isfinite(forecast_arima).all():
+            raise ValueError("optimizer did not converge" if not converged else "non-finite forecast")
+    except Exception as e:
+        print(f"⚠️ ARIMA failed for {series_id or 'series'} ({str(e)}), using drift forecast")
+        return drift_forecast(monthly_orders, periods)
+
+    if series_id and status != "reuse":
+        try:
+            save_model("arima", series_id, monthly_orders, config, {"params": arima_fit.params.tolist()})
+        except Exception as e:
+            print(f"⚠️ Cannot save ARIMA parameters for {series_id}: {str(e)}")
+    mae_arima = mean_absolute_error(monthly_orders[1:], arima_fit.fittedvalues[1:])
+    rmse_arima = np.sqrt(mean_squared_error(monthly_orders[1:], arima_fit.fittedvalues[1:]))
+    return [int(val) for val in forecast_arima], mae_arima, rmse_arima
+
+
+def _fit_arima_job(args):
+    return fit_arima_forecast(*args)
+
+
+def fit_arima_forecasts(series_by_id, periods):
+    """
+    fit_arima_forecast for many series ({series_id: monthly_orders}) through a pool of
+    ARIMA_WORKERS processes; returns {series_id: (forecast, mae, rmse)}
+    """
+    if len(series_by_id) <= 1 or ARIMA_WORKERS <= 1:
+        return {series_id: fit_arima_forecast(series, periods, series_id) for series_id, series in series_by_id.items()}
+
+    ids = list(series_by_id)
+    with ProcessPoolExecutor(max_workers=min(ARIMA_WORKERS, len(ids))) as executor:
+        results = executor.map(_fit_arima_job, [(series_by_id[i], periods, i) for i in ids])
+        return dict(zip(ids, results))
+
+
+def fit_ets_forecasts(series_by_id, periods):
+    """
+    Exponential-smoothing forecasts of many monthly series ({series_id: monthly_orders})
+    in one vectorized pass of services.smoothing; returns {series_id: (forecast, mae, rmse)}
+    like fit_arima_forecasts, falling back to drift_forecast for a non-finite forecast
+    """
+    ids = list(series_by_id)
+    if not ids:
+        return {}
+    matrix = np.full((len(ids), max(len(s) for s in series_by_id.values())), np.nan)
+    for i, series_id in enumerate(ids):
+        values = series_by_id[series_id].to_numpy(dtype=float)
+        matrix[i, :len(values)] = values
+
+    t0 = time.time()
+    fitted = fit_exponential_smoothing(matrix, periods)
+    print(f"✅ ETS fitted {len(ids)} series in {round(time.time() - t0, 3)}s")
+
+    results = {}
+    for i, series_id in enumerate(ids):
+        forecast = fitted["forecast"][i]
+        if not np.isfinite(forecast).all():
+            print(f"⚠️ ETS failed for {series_id}, using drift forecast")
+            results[series_id] = drift_forecast(series_by_id[series_id], periods)
+        else:
+            results[series_id] = ([int(val) for val in forecast], float(fitted["mae"][i]), float(np.sqrt(fitted["mse"][i])))
+    return results
+
+
+def fit_statistical_forecasts(series_by_id, periods, stat_model=None):
+    """
+    Forecasts of the statistical model (STAT_MODELS) of many series:
+    {series_id: (forecast, mae, rmse)}
+    """
+    stat_model = resolve_stat_model(stat_model)
+    if stat_model == "ets":
+        return fit_ets_forecasts(series_by_id, periods)
+    return fit_arima_forecasts(series_by_id, periods)
+
+
+def category_forecast_result(category_name, monthly_orders, future_index, forecast_xgb, forecast_stat,
+                             xgb_metrics, stat_metrics, model=None, stat_model=None):
+    """
+    Per-category forecast response (also saved to MongoDB) from the history, the
+    XGBoost / ARIMA (or ETS) forecasts and their in-sample {"mae", "rmse"}
+    """
+    stat_model = resolve_stat_model(stat_model)
+    stat_label = STAT_MODELS[stat_model]
+    model = model or f"XGBoost + {stat_label}"
+    forecast_series_xgb = pd.Series(forecast_xgb, index=future_index)
+    forecast_series_stat = pd.Series(forecast_stat, index=future_index)
+    mae_rmse_comparison = {
+        "xgboost": {"mae": round(xgb_metrics["mae"], 2), "rmse": round(xgb_metrics["rmse"], 2)},
+        "stat": {"mae": round(stat_metrics["mae"], 2), "rmse": round(stat_metrics["rmse"], 2)},
+        "arima": {"mae": round(stat_metrics["mae"], 2), "rmse": round(stat_metrics["rmse"], 2)},  # deprecated alias
+    }
+
+    forecast_df = pd.DataFrame({
+        "month": [d.strftime("%Y-%m") for d in future_index],
+        "xgboost": forecast_xgb,
+        "stat": forecast_series_stat.tolist(),
+        "arima": forecast_series_stat.tolist(),  # deprecated alias của "stat"
+    })
+
+    chart_data = [{"month": date.strftime("%Y-%m"), "orders": int(val), "type": "Actual", "category": category_name}
+                  for date, val in monthly_orders.items()]
+    chart_data += [{"month": date.strftime("%Y-%m"), "orders": int(val), "type": "XGBoost", "category": category_name}
+                   for date, val in forecast_series_xgb.items()]
+    chart_data += [{"month": date.strftime("%Y-%m"), "orders": int(val), "type": "Stat", "model": stat_label,
+                    "category": category_name}
+                   for date, val in forecast_series_stat.items()]
+
+    # ✅ Tính thêm inventory & holding cost
+    optimal_inventory = int(np.max(forecast_xgb)) if forecast_xgb else 0
+    # Chuyển đổi từ BRL sang VND (giả sử chi phí giữ kho 5 BRL/đơn vị)
+    unit_holding_cost = brl_to_vnd(5)
+    holding_cost = optimal_inventory * unit_holding_cost
+
+    save_forecast_result({
+        "category": category_name,
+        "model": model,
+        "forecast_table": forecast_df.to_dict(orient="records"),
+        "optimal_inventory": optimal_inventory,
+        "holding_cost": holding_cost,
+        "mae_rmse_comparison": mae_rmse_comparison
+    })
+
+    return {
+        "status": "success",
+        "category": category_name,
+        "stat_model": stat_label,
+        "forecast_table": forecast_df.to_dict(orient="records"),
+        "chart_data": chart_data,
+        "optimal_inventory": optimal_inventory,
+        "holding_cost": holding_cost,
+        "mae_rmse_comparison": mae_rmse_comparison
+    }
@@ -0,0 +1,59 @@
+# services/horizon.py
+import logging
+import os
+import numpy as np
+
+# Log chi tiết từng bước dự báo (lag, rolling, giá trị dự báo): bật bằng FORECAST_LOG_LEVEL=DEBUG
+logger = logging.getLogger("forecast")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+logger.setLevel(os.getenv("FORECAST_LOG_LEVEL", "INFO").upper())
+
+# Thứ tự feature của các mô hình XGBoost dự báo theo tháng (services.forecast, services.panel_forecast)
+HORIZON_FEATURES = ["lag_1", "lag_2", "lag_3", "month", "quarter", "trend", "rolling_mean_3", "rolling_std_3"]
+
+
+def recursive_forecast(predict, history, last_dates, lengths, periods, floor=0, labels=None):
+    """
+    Recursive multi-step forecast of many monthly series in lock-step.
+
+    history holds the observed values of each series (series × months, at least the last
+    3 months); last_dates and lengths are each series' last month and number of months.
+    The lag / rolling state stays in NumPy arrays and `predict` is called once per step
+    with a (series × HORIZON_FEATURES) matrix; rolling_std_3 is the sample std (ddof=1),
+    like rolling(3).std() in training. Forecasts are clipped at `floor` and
+    truncated to ints, and feed the lags of the next step.
+
+    Returns an int array of shape (series, periods).
+    """
+    history = np.atleast_2d(np.asarray(history, dtype=float))
+    if history.shape[1] < 3 or np.isnan(history[:, -3:]).any():
+        raise ValueError("At least 3 months of history are required to forecast")
+
+    window = history[:, -3:].copy()
+    month_index = np.asarray(last_dates, dtype="datetime64[M]").astype(np.int64).reshape(-1)
+    lengths = np.asarray(lengths, dtype=float).reshape(-1)
+    forecasts = np.zeros((len(window), periods), dtype=np.int64)
+
+    for step in range(periods):
+        month = (month_index + step + 1) % 12 + 1
+        features = np.column_stack([
+            window[:, 2], window[:, 1], window[:, 0],
+            month, (month - 1) // 3 + 1, lengths + step,
+            window.mean(axis=1), window.std(axis=1, ddof=1),
+        ])
+        pred = np.asarray(predict(features), dtype=float).reshape(-1)
+        forecasts[:, step] = np.maximum(floor, pred).astype(np.int64)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, row in enumerate(features):
+                label = f" ({labels[i]})" if labels is not None else ""
+                logger.debug(
+                    f"📅 Step {step + 1}{label}: lag_1={row[0]:.0f} lag_2={row[1]:.0f} lag_3={row[2]:.0f} "
+                    f"rolling_mean_3={row[6]:.2f} rolling_std_3={row[7]:.2f} → {pred[i]:.2f}"
+                )
+
+        window = np.column_stack([window[:, 1:], forecasts[:, step]])
+    return forecasts
@@ -0,0 +1,149 @@
+# services/ingest.py
+import os
+import time
+import uuid
+import shutil
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from services import preprocess
+
+# Một worker duy nhất: các lần upload được xử lý tuần tự, không chiếm request worker của Flask
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+_jobs_lock = threading.Lock()
+_jobs = {}
+
+INGEST_CHUNKSIZE = 100_000
+STAGING_DIRNAME = ".incoming"
+
+
+class _CountingReader:
+    """
+    File wrapper that counts bytes read, so the parse can report progress
+    """
+
+    def __init__(self, f, on_read):
+        self._f = f
+        self._on_read = on_read
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self._on_read(len(data))
+        return data
+
+    def __iter__(self):
+        return iter(self._f)
+
+
+def _update_job(job_id, **fields):
+    with _jobs_lock:
+        _jobs[job_id].update(fields)
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job, stage_timings=dict(job["stage_timings"])) if job else None
+
+
+def _pending_jobs(exclude_job_id):
+    with _jobs_lock:
+        return [
+            job_id for job_id, job in _jobs.items()
+            if job_id != exclude_job_id and job["status"] in ("queued", "running")
+        ]
+
+
+def stage_upload(file_storage, filename):
+    """
+    Spool the uploaded file into the staging folder (no parsing) and return its path
+    """
+    staging_dir = os.path.join(preprocess.UPLOAD_FOLDER, STAGING_DIRNAME)
+    os.makedirs(staging_dir, exist_ok=True)
+    staged_path = os.path.join(staging_dir, f"{uuid.uuid4().hex}_{filename}")
+    with open(staged_path, "wb") as out:
+        shutil.copyfileobj(file_storage.stream, out, length=1024 * 1024)
+    return staged_path
+
+
+def submit_ingest(staged_path, filename):
+    """
+    Queue a background ingest job for a staged upload and return its id
+    """
+    job_id = uuid.uuid4().hex
+    with _jobs_lock:
+        _jobs[job_id] = {
+            "job_id": job_id,
+            "filename": filename,
+            "status": "queued",
+            "stage": "queued",
+            "bytes_total": os.path.getsize(staged_path),
+            "bytes_processed": 0,
+            "rows_parsed": 0,
+            "stage_timings": {},
+            "error": None,
+            "created_at": time.time(),
+        }
+    _executor.submit(_run_ingest, job_id, staged_path, filename)
+    return job_id
+
+
+def _run_stage(job_id, stage, func):
+    _update_job(job_id, stage=stage)
+    t0 = time.time()
+    result = func()
+    with _jobs_lock:
+        _jobs[job_id]["stage_timings"][stage] = round(time.time() - t0, 3)
+    return result
+
+
+def _validate(job_id, staged_path, filename):
+    """
+    Stream the staged file in chunks: check the schema and count bytes / rows
+    """
+    def on_read(n):
+        with _jobs_lock:
+            _jobs[job_id]["bytes_processed"] += n
+
+    with open(staged_path, "rb") as raw:
+        reader = preprocess.read_typed_csv(_CountingReader(raw, on_read), filename, chunksize=INGEST_CHUNKSIZE)
+        for i, chunk in enumerate(reader):
+            if i == 0:
+                missing = preprocess.missing_columns(filename, chunk.columns)
+                if missing:
+                    raise ValueError(f"{filename} is missing required columns: {missing}")
+            with _jobs_lock:
+                _jobs[job_id]["rows_parsed"] += len(chunk)
+
+
+def _run_ingest(job_id, staged_path, filename):
+    from services.dataset import get_dataset, get_rollup, invalidate_dataset, invalidate_results
+    from services.render_pool import submit_prerender
+
+    _update_job(job_id, status="running")
+    try:
+        _run_stage(job_id, "validate", lambda: _validate(job_id, staged_path, filename))
+
+        def store():
+            os.replace(staged_path, os.path.join(preprocess.UPLOAD_FOLDER, filename))
+            invalidate_dataset()
+            invalidate_results()
+        _run_stage(job_id, "store", store)
+
+        # Chỉ dựng snapshot / làm nóng aggregate khi đã đủ 4 bảng và không còn upload nào đang chờ
+        complete = all(os.path.exists(os.path.join(preprocess.UPLOAD_FOLDER, f)) for f in preprocess.DATA_FILES)
+        if filename in preprocess.DATA_FILES and complete and not _pending_jobs(job_id):
+            _run_stage(job_id, "snapshot", lambda: get_dataset().shape)
+            _run_stage(job_id, "prewarm", get_rollup)
+            # Vẽ sẵn biểu đồ dashboard ở nền (services.render_pool), không giữ job upload chờ
+            _run_stage(job_id, "render", submit_prerender)
+
+        _update_job(job_id, status="done", stage="done")
+        print(f"✅ Ingest job {job_id} ({filename}) done")
+    except Exception as e:
+        print(f"❌ Ingest job {job_id} ({filename}) failed: {str(e)}")
+        traceback.print_exc()
+        _update_job(job_id, status="error", error=str(e))
+    finally:
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
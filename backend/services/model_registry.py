@@ -0,0 +1,115 @@
+# services/model_registry.py
+import hashlib
+import json
+import os
+import threading
+
+# Kho mô hình đã huấn luyện trên đĩa (XGBoost booster, tham số ARIMA), giữ qua các lần khởi động lại.
+# Mỗi entry được khóa theo hash của (loại mô hình, id chuỗi, cấu hình feature + siêu tham số, chuỗi đầu vào),
+# nên hai chuỗi có lịch sử trùng nhau vẫn có entry riêng (xóa entry cũ của chuỗi này không ảnh hưởng chuỗi kia):
+# cùng chuỗi thì dùng lại mô hình, chuỗi chỉ có thêm tháng mới thì warm start từ entry gần nhất.
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", os.path.join("models", "registry"))
+LATEST_DIRNAME = "latest"
+
+_registry_lock = threading.Lock()
+
+
+def _digest(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:32]
+
+
+def _series_payload(series):
+    return {
+        "months": [d.strftime("%Y-%m") for d in series.index],
+        "values": [float(v) for v in series.values],
+    }
+
+
+def entry_key(kind, series_id, series, config):
+    """
+    Registry key of a model: hash of the model kind, the series id, its configuration and the input series
+    """
+    return _digest({"kind": kind, "series_id": series_id, "config": config, "series": _series_payload(series)})
+
+
+def entry_path(key, suffix=".json"):
+    return os.path.join(MODEL_REGISTRY_DIR, f"{key}{suffix}")
+
+
+def _latest_path(kind, series_id, config):
+    slot = _digest({"kind": kind, "series_id": series_id, "config": config})
+    return os.path.join(MODEL_REGISTRY_DIR, LATEST_DIRNAME, f"{slot}.json")
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, payload):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+
+def _extends(previous, current):
+    """
+    True when `current` is `previous` with new months appended
+    """
+    n = len(previous["months"])
+    return (
+        len(current["months"]) > n
+        and current["months"][:n] == previous["months"]
+        and current["values"][:n] == previous["values"]
+    )
+
+
+def lookup_model(kind, series_id, series, config):
+    """
+    Find a fitted model for this series.
+
+    Returns ("reuse", entry) when a model was fitted on exactly these inputs,
+    ("warm", entry) when the latest model of `series_id` was fitted on an earlier
+    prefix of the series (only new months were appended), and (None, None) otherwise.
+    entry is the stored metadata; entry["key"] locates its files (entry_path).
+    """
+    key = entry_key(kind, series_id, series, config)
+    entry = _read_json(entry_path(key))
+    if entry is not None:
+        return "reuse", entry
+
+    latest = _read_json(_latest_path(kind, series_id, config))
+    if latest is not None and _extends(latest, _series_payload(series)):
+        entry = _read_json(entry_path(latest["key"]))
+        if entry is not None:
+            return "warm", entry
+    return None, None
+
+
+def save_model(kind, series_id, series, config, meta):
+    """
+    Record a fitted model: its metadata (plus files written at entry_path(key, ...) by the
+    caller beforehand) and the latest-model pointer of `series_id`. Returns the key.
+    """
+    key = entry_key(kind, series_id, series, config)
+    payload = _series_payload(series)
+    latest_path = _latest_path(kind, series_id, config)
+    with _registry_lock:
+        previous = _read_json(latest_path)
+        _write_json(entry_path(key), dict(meta, key=key, kind=kind, series_id=series_id))
+        _write_json(latest_path, dict(payload, key=key))
+
+    # Entry cũ của cùng chuỗi đã được thay thế (warm start / dữ liệu đổi): xóa file của nó
+    if previous is not None and previous["key"] != key:
+        for name in os.listdir(MODEL_REGISTRY_DIR):
+            if name.startswith(previous["key"] + "."):
+                try:
+                    os.remove(os.path.join(MODEL_REGISTRY_DIR, name))
+                except OSError:
+                    pass
+    return key
@@ -0,0 +1,199 @@
+# services/panel_forecast.py
+import time
+import traceback
+import warnings
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from services.dataset import get_rollup
+from services.forecast import STAT_MODELS, resolve_stat_model, fit_statistical_forecasts, category_forecast_result, category_forecast_error
+from services.horizon import HORIZON_FEATURES, recursive_forecast
+
+# Chế độ "panel": một mô hình XGBoost toàn cục học trên chuỗi tháng của mọi danh mục
+# (danh mục là một feature), thay vì một mô hình riêng cho mỗi danh mục.
+# Feature giống forecast_demand_by_category: lag 1-3, tháng, quý, trend, rolling mean / std 3 tháng.
+PANEL_FEATURES = HORIZON_FEATURES
+PANEL_XGB_PARAMS = {
+    "n_estimators": 300,
+    "learning_rate": 0.1,
+    "max_depth": 4,
+    "objective": "reg:squarederror",
+    "tree_method": "hist",
+    "enable_categorical": True,
+}
+
+# Danh mục có ít hơn số dòng này thì không dự báo (giống forecast_demand_by_category)
+MIN_CATEGORY_ROWS = 10
+
+# Quy mô các danh mục chênh nhau hàng chục lần: mô hình học trên chuỗi đã chia cho trung bình
+# của từng chuỗi, nên lag của danh mục lớn không nằm ngoài vùng giá trị lúc train.
+# Các feature tỉ lệ với giá trị chuỗi (chia cho hệ số này khi dự báo):
+SCALED_FEATURES = ["lag_1", "lag_2", "lag_3", "rolling_mean_3", "rolling_std_3"]
+
+
+def category_series_matrix(categories):
+    """
+    Monthly order counts of every category as one right-aligned (category × month) matrix,
+    prepared like forecast_demand_by_category: gaps inside each category's date range are
+    linearly interpolated and 3-sigma outliers removed (for series of 5+ months).
+
+    Returns (values, dates, rows): values and dates are NaN / NaT-padded on the left,
+    rows is the number of order items of each category.
+    """
+    rollup = get_rollup()
+    rollup = rollup[rollup["product_category_name"].isin(categories)]
+    counts = rollup.groupby(["product_category_name", "order_month"], observed=True)["item_count"].sum()
+    wide = counts.unstack("order_month").reindex(categories)
+    rows = wide.sum(axis=1).to_numpy()
+
+    months = pd.to_datetime(pd.Index(wide.columns.astype(str)), format="%Y-%m", errors="coerce")
+    wide = wide.loc[:, np.asarray(months.notna())]
+    wide.columns = months[months.notna()]
+    full_range = pd.date_range(start=wide.columns.min(), end=wide.columns.max(), freq="MS")
+    wide = wide.reindex(columns=full_range).astype(float)
+
+    # Nội suy tuyến tính các tháng trống nằm giữa tháng đầu và tháng cuối của từng danh mục
+    wide = wide.interpolate(axis=1, limit_area="inside")
+    values = wide.to_numpy()
+    valid = ~np.isnan(values)
+
+    # 🧹 Remove outliers (3 sigma) cho các chuỗi từ 5 tháng trở lên
+    n_valid = valid.sum(axis=1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(values, axis=1, keepdims=True)
+        std = np.nanstd(values, axis=1, ddof=1, keepdims=True)
+        inside = (values > mean - 3 * std) & (values < mean + 3 * std)
+    keep = valid & (inside | (n_valid < 5)[:, None])
+
+    # Dồn các tháng còn lại về bên phải (giữ thứ tự thời gian), phần trống ở bên trái
+    order = np.argsort(keep, axis=1, kind="stable")
+    keep = np.take_along_axis(keep, order, axis=1)
+    values = np.where(keep, np.take_along_axis(values, order, axis=1), np.nan)
+    dates = np.take_along_axis(np.broadcast_to(full_range.values, values.shape), order, axis=1)
+    dates = np.where(keep, dates, np.datetime64("NaT"))
+    return values, dates, rows
+
+
+def _lag(values, k):
+    lagged = np.full_like(values, np.nan)
+    lagged[:, k:] = values[:, :-k]
+    return lagged
+
+
+def panel_features(values, dates):
+    """
+    Lag / calendar / trend / rolling features of every series in one vectorized pass,
+    as {feature: (series × month) matrix}; leading NaNs are back-filled then set to 0
+    """
+    lags = [_lag(values, k) for k in (1, 2, 3)]
+    window = np.stack(lags)
+    months = pd.DatetimeIndex(dates.ravel())
+    features = {
+        "lag_1": lags[0],
+        "lag_2": lags[1],
+        "lag_3": lags[2],
+        "month": months.month.to_numpy(dtype=float).reshape(values.shape),
+        "quarter": months.quarter.to_numpy(dtype=float).reshape(values.shape),
+        "trend": np.cumsum(~np.isnan(values), axis=1) - 1.0,
+        "rolling_mean_3": window.mean(axis=0),
+        "rolling_std_3": window.std(axis=0, ddof=1),
+    }
+    for name in ["lag_1", "lag_2", "lag_3", "rolling_mean_3", "rolling_std_3"]:
+        features[name] = pd.DataFrame(features[name]).bfill(axis=1).fillna(0).to_numpy()
+    return features
+
+
+def series_scale(values):
+    """
+    Per-series normalization factor: the mean of its observed values (at least 1)
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        scale = np.nanmean(values, axis=1)
+    return np.where(np.isfinite(scale) & (scale > 1), scale, 1.0)
+
+
+def _design_matrix(columns, series, categories):
+    X = pd.DataFrame(columns, columns=PANEL_FEATURES)
+    X["category"] = pd.Categorical.from_codes(series, categories=categories)
+    return X
+
+
+def forecast_categories_panel(categories, periods=6, stat_model=None):
+    """
+    Forecast every category with one global XGBoost model (category identity is a
+    feature) plus a per-category ARIMA (or ETS); returns results in the shape of
+    forecast_demand_by_category, in the order of `categories`
+    """
+    stat_model = resolve_stat_model(stat_model)
+    t0 = time.time()
+    categories = list(categories)
+    values, dates, rows = category_series_matrix(categories)
+    lengths = (~np.isnan(values)).sum(axis=1)
+
+    results = {}
+    for i, category in enumerate(categories):
+        if not rows[i] >= MIN_CATEGORY_ROWS:
+            results[category] = category_forecast_error(category, "Not enough data for category: " + category)
+        elif lengths[i] < 3:
+            results[category] = category_forecast_error(category, "Not enough months to forecast category: " + category)
+    eligible = np.array([category not in results for category in categories])
+    if not eligible.any():
+        return [results[category] for category in categories]
+
+    values, dates, lengths = values[eligible], dates[eligible], lengths[eligible]
+    names = [category for category, ok in zip(categories, eligible) if ok]
+    series = np.arange(len(names))
+
+    # 🔧 Feature của mọi chuỗi (đã chuẩn hóa theo trung bình) trong một lần,
+    # 🚀 một mô hình XGBoost cho tất cả danh mục, học trên target đã chuẩn hóa
+    scale = series_scale(values)
+    features = panel_features(values / scale[:, None], dates)
+    observed = ~np.isnan(values)
+    train_series = np.broadcast_to(series[:, None], values.shape)[observed]
+    X = _design_matrix(np.column_stack([features[name][observed] for name in PANEL_FEATURES]), train_series, names)
+    y = values[observed]
+    model = xgb.XGBRegressor(**PANEL_XGB_PARAMS)
+    model.fit(X, y / scale[train_series])
+
+    # Sai số trong mẫu theo từng danh mục (theo đơn vị gốc)
+    errors = model.predict(X) * scale[train_series] - y
+    counts = np.bincount(train_series, minlength=len(names))
+    mae_xgb = np.bincount(train_series, weights=np.abs(errors), minlength=len(names)) / counts
+    rmse_xgb = np.sqrt(np.bincount(train_series, weights=errors ** 2, minlength=len(names)) / counts)
+
+    # recursive_forecast giữ trạng thái theo đơn vị gốc: chuẩn hóa feature trước khi dự báo, nhân lại sau
+    scaled_columns = [PANEL_FEATURES.index(name) for name in SCALED_FEATURES]
+
+    def predict(columns):
+        columns = columns.copy()
+        columns[:, scaled_columns] /= scale[:, None]
+        return model.predict(_design_matrix(columns, series, names)) * scale
+
+    forecasts = recursive_forecast(predict, values, dates[:, -1], lengths, periods, labels=names)
+    print(f"✅ Panel XGBoost trained and forecast {len(names)} categories in {round(time.time() - t0, 2)}s")
+
+    # 📈 ARIMA của các danh mục được fit song song (warm start từ tham số đã lưu), ETS thì vector hóa một lần
+    history = {
+        category: pd.Series(values[i][observed[i]], index=pd.DatetimeIndex(dates[i][observed[i]]))
+        for i, category in enumerate(names)
+    }
+    stat_forecasts = fit_statistical_forecasts(history, periods, stat_model)
+
+    for i, category in enumerate(names):
+        try:
+            monthly_orders = history[category]
+            future_index = [monthly_orders.index[-1] + pd.DateOffset(months=step) for step in range(1, periods + 1)]
+            forecast_stat, mae_stat, rmse_stat = stat_forecasts[category]
+            results[category] = category_forecast_result(
+                category, monthly_orders, future_index, forecasts[i].tolist(), forecast_stat,
+                {"mae": float(mae_xgb[i]), "rmse": float(rmse_xgb[i])}, {"mae": mae_stat, "rmse": rmse_stat},
+                model=f"Panel XGBoost + {STAT_MODELS[stat_model]}", stat_model=stat_model,
+            )
+        except Exception as e:
+            print(f"❌ Error in panel forecast for {category}: {str(e)}")
+            print(traceback.format_exc())
+            results[category] = category_forecast_error(category, e)
+
+    return [dict(results[category], category=category) for category in categories]
@@ -1,129 +1,389 @@
 # services/preprocess.py
 import os
+import hashlib
 import pandas as pd
 from utils.currency import brl_to_vnd
 
 UPLOAD_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "uploads"))
+DATA_FILES = ["df_Customers.csv", "df_Orders.csv", "df_OrderItems.csv", "df_Products.csv"]
+SNAPSHOT_DIRNAME = ".snapshots"
+# Tăng khi schema / feature engineering thay đổi để vô hiệu hóa snapshot cũ
+SNAPSHOT_VERSION = 2
+# Số dòng mỗi chunk khi xử lý streaming (out-of-core)
+STREAMING_CHUNKSIZE = 250_000
+ID_COLUMNS = ["order_id", "customer_id", "product_id", "seller_id"]
 
-def load_csv(filename):
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-    return pd.read_csv(file_path)
+# Schema khai báo cho 4 bảng Olist: chỉ đọc các cột cần dùng, với kiểu dữ liệu gọn
+CSV_SCHEMAS = {
+    "df_Customers.csv": {
+        "usecols": ["customer_id", "customer_zip_code_prefix", "customer_city", "customer_state"],
+        "dtype": {
+            "customer_id": "category",
+            "customer_zip_code_prefix": "Int32",
+            "customer_city": "category",
+            "customer_state": "category",
+        },
+        "parse_dates": [],
+    },
+    "df_Orders.csv": {
+        "usecols": [
+            "order_id", "customer_id", "order_status", "order_purchase_timestamp",
+            "order_delivered_timestamp", "order_estimated_delivery_date",
+        ],
+        "dtype": {
+            "order_id": "category",
+            "customer_id": "category",
+            "order_status": "category",
+        },
+        "parse_dates": ["order_purchase_timestamp", "order_delivered_timestamp", "order_estimated_delivery_date"],
+    },
+    "df_OrderItems.csv": {
+        "usecols": ["order_id", "product_id", "seller_id", "price", "shipping_charges", "freight_value"],
+        "dtype": {
+            "order_id": "category",
+            "product_id": "category",
+            "seller_id": "category",
+            "price": "float64",
+            "shipping_charges": "float64",
+            "freight_value": "float64",
+        },
+        "parse_dates": [],
+    },
+    "df_Products.csv": {
+        "usecols": [
+            "product_id", "product_category_name", "product_weight_g",
+            "product_length_cm", "product_height_cm", "product_width_cm",
+        ],
+        "dtype": {
+            "product_id": "category",
+            "product_category_name": "category",
+            "product_weight_g": "float32",
+            "product_length_cm": "float32",
+            "product_height_cm": "float32",
+            "product_width_cm": "float32",
+        },
+        "parse_dates": [],
+    },
+}
 
-def preprocess_data(use_spark=False):
+# Hash nội dung theo (path, size, mtime) để không phải đọc lại file khi chưa thay đổi
+_content_hashes = {}
+
+def missing_columns(filename, columns):
+    """
+    Schema validation for an uploaded Olist table: required columns absent from `columns`
+    (unknown tables are not validated)
+    """
+    schema = CSV_SCHEMAS.get(filename)
+    if schema is None:
+        return []
+    columns = set(columns)
+    required = [c for c in schema["usecols"] if c not in ("shipping_charges", "freight_value")]
+    missing = [c for c in required if c not in columns]
+    if filename == "df_OrderItems.csv" and not columns & {"shipping_charges", "freight_value"}:
+        missing.append("shipping_charges")
+    return missing
+
+def _parse_date_columns(df, schema):
+    for column in schema["parse_dates"]:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column])
+    return df
+
+def load_csv(filename, chunksize=None, categorical_ids=True):
+    """
+    Read an upload CSV. Known Olist tables are read with their declared schema:
+    only the listed columns, categorical IDs / labels and compact numeric types.
+
+    With `chunksize`, returns an iterator of typed chunks instead of one frame.
+    `categorical_ids=False` keeps ID columns as plain strings, which chunks need
+    since each chunk would otherwise get its own category set.
+    """
+    return read_typed_csv(os.path.join(UPLOAD_FOLDER, filename), filename, chunksize, categorical_ids)
+
+def read_typed_csv(file_path, filename, chunksize=None, categorical_ids=True):
+    """
+    Read any CSV path with the schema declared for `filename` (see load_csv)
     """
-    Process input data, with the option to use Spark for large datasets
-    or Pandas for small datasets
+    schema = CSV_SCHEMAS.get(filename)
+    if schema is None:
+        return pd.read_csv(file_path, chunksize=chunksize)
+
+    usecols = set(schema["usecols"])
+    dtype = dict(schema["dtype"])
+    if not categorical_ids:
+        dtype.update({c: "str" for c in ID_COLUMNS if c in dtype})
+
+    reader = pd.read_csv(file_path, usecols=lambda c: c in usecols, dtype=dtype, chunksize=chunksize)
+    if chunksize is None:
+        return _parse_date_columns(reader, schema)
+    return (_parse_date_columns(chunk, schema) for chunk in reader)
+
+def align_categories(left, right, column):
+    """
+    Give a join key the same categorical dtype on both sides, so the merge
+    runs on the integer codes instead of the strings
+    """
+    categories = left[column].cat.categories.union(right[column].cat.categories)
+    dtype = pd.CategoricalDtype(categories)
+    left[column] = left[column].astype(dtype)
+    right[column] = right[column].astype(dtype)
+
+def preprocess_data(use_spark=False, engine=None):
     """
-    if use_spark:
+    Process input data with the given engine ("pandas", "duckdb" or "spark");
+    use_spark=True is kept as a shortcut for engine="spark"
+    """
+    if use_spark or engine == "spark":
         return preprocess_data_spark()
-    else:
-        return preprocess_data_pandas()
+    if engine == "duckdb":
+        try:
+            from services.duckdb_engine import preprocess_data_duckdb
+            return preprocess_data_duckdb()
+        except Exception as e:
+            print(f"⚠️ DuckDB preprocessing failed, falling back to pandas: {str(e)}")
+    return preprocess_data_pandas()
 
 def preprocess_data_pandas():
-    # Current code
     customers = load_csv("df_Customers.csv")
     orders = load_csv("df_Orders.csv")
     order_items = load_csv("df_OrderItems.csv")
     products = load_csv("df_Products.csv")
-    
-    # Process data as before...
-    orders["order_purchase_timestamp"] = pd.to_datetime(orders["order_purchase_timestamp"])
-    orders["order_delivered_timestamp"] = pd.to_datetime(orders["order_delivered_timestamp"])
-    orders["order_estimated_delivery_date"] = pd.to_datetime(orders["order_estimated_delivery_date"])
-    
+    return merge_tables(customers, orders, order_items, products)
+
+def merge_tables(customers, orders, order_items, products):
+    """
+    Join the four typed Olist tables and add the engineered features
+    """
     # Currency conversion...
     if "price" in order_items.columns:
-        order_items["price"] = order_items["price"].apply(brl_to_vnd)
+        order_items["price"] = brl_to_vnd(order_items["price"])
     
-    # Merge data...
+    # Merge data on dictionary-encoded keys...
+    align_categories(order_items, orders, "order_id")
     df = pd.merge(order_items, orders, on="order_id", how="inner")
+    align_categories(df, products, "product_id")
     df = pd.merge(df, products, on="product_id", how="left")
+    align_categories(df, customers, "customer_id")
     df = pd.merge(df, customers, on="customer_id", how="left")
     
     # Feature engineering...
-    df["shipping_duration"] = (df["order_delivered_timestamp"] - df["order_purchase_timestamp"]).dt.days
-    df["delivery_delay"] = (df["order_delivered_timestamp"] - df["order_estimated_delivery_date"]).dt.days
-    df["order_month"] = df["order_purchase_timestamp"].dt.to_period("M").astype(str)
+    add_order_features(df)
     
     # Rename columns...
     if "freight_value" in df.columns and "shipping_charges" not in df.columns:
         df["shipping_charges"] = df["freight_value"]
+
+    # Keep only categories that survived the joins so groupby/value_counts see observed values only
+    for column in df.select_dtypes(include="category").columns:
+        df[column] = df[column].cat.remove_unused_categories()
     
     return df
 
+def concat_frames(frames):
+    """
+    Concatenate preprocessed frames, unioning categorical dtypes so categorical
+    columns stay categorical instead of falling back to strings
+    """
+    frames = [frame.copy(deep=False) for frame in frames]
+    columns = frames[0].columns
+    for column in frames[0].select_dtypes(include="category").columns:
+        categories = frames[0][column].cat.categories
+        for frame in frames[1:]:
+            categories = categories.union(frame[column].astype("category").cat.categories)
+        dtype = pd.CategoricalDtype(categories)
+        for frame in frames:
+            frame[column] = frame[column].astype(dtype)
+    return pd.concat([frame[columns] for frame in frames], ignore_index=True)
+
+def add_order_features(df):
+    """
+    Add shipping_duration, delivery_delay and order_month from the order timestamps
+    """
+    df["shipping_duration"] = (df["order_delivered_timestamp"] - df["order_purchase_timestamp"]).dt.days
+    df["delivery_delay"] = (df["order_delivered_timestamp"] - df["order_estimated_delivery_date"]).dt.days
+    df["order_month"] = df["order_purchase_timestamp"].dt.to_period("M").astype(str).astype("category")
+    return df
+
+def iter_preprocessed_chunks(chunksize=STREAMING_CHUNKSIZE):
+    """
+    Streaming (out-of-core) preprocessing: yield merged, feature-engineered chunks
+    of order items without materializing the full merged frame.
+
+    Orders are streamed once and reduced to a compact per-order table (IDs + the
+    engineered features); order items are then streamed in chunks and joined
+    against it and the in-memory dimension tables (products, customers).
+    """
+    products = load_csv("df_Products.csv", categorical_ids=False)
+    customers = load_csv("df_Customers.csv", categorical_ids=False)
+
+    order_parts = []
+    for orders in load_csv("df_Orders.csv", chunksize=chunksize, categorical_ids=False):
+        add_order_features(orders)
+        order_parts.append(orders[[
+            "order_id", "customer_id", "shipping_duration", "delivery_delay", "order_month",
+        ]])
+    orders = pd.concat(order_parts, ignore_index=True)
+    orders["order_month"] = orders["order_month"].astype("category")
+    del order_parts
+
+    for items in load_csv("df_OrderItems.csv", chunksize=chunksize, categorical_ids=False):
+        if "price" in items.columns:
+            items["price"] = brl_to_vnd(items["price"])
+        if "freight_value" in items.columns and "shipping_charges" not in items.columns:
+            items["shipping_charges"] = items["freight_value"]
+
+        chunk = pd.merge(items, orders, on="order_id", how="inner")
+        chunk = pd.merge(chunk, products, on="product_id", how="left")
+        chunk = pd.merge(chunk, customers, on="customer_id", how="left")
+        yield chunk
+
+def stream_rollup(chunksize=STREAMING_CHUNKSIZE):
+    """
+    Build the aggregate rollup (see services.aggregates) chunk by chunk,
+    keeping memory bounded by the rollup size instead of the merged frame
+    """
+    from services.aggregates import build_rollup, combine_rollups
+
+    rollup = None
+    for i, chunk in enumerate(iter_preprocessed_chunks(chunksize)):
+        partial = build_rollup(chunk)
+        rollup = partial if rollup is None else combine_rollups([rollup, partial])
+        print(f"📦 Streamed chunk {i + 1} ({len(chunk)} rows)")
+    return rollup
+
 def preprocess_data_spark():
     """
-    Process data using Apache Spark for large datasets
+    Process data using Apache Spark and collect the full row-level frame.
+    Services aggregate large datasets in Spark instead (spark_analytics.build_rollup_spark).
     """
-    from pyspark.sql import SparkSession
-    from pyspark.sql.functions import col, datediff, to_date, lit, when
+    from services.spark_session import get_spark, read_staged
+
+    # Joins + feature engineering đã chạy một lần khi stage Parquet (services.spark_session)
+    df = read_staged(get_spark(), "merged")
 
-    # Initialize Spark session
-    spark = SparkSession.builder \
-        .appName("SupplyChainPreprocessing") \
-        .config("spark.executor.memory", "2g") \
-        .getOrCreate()
-    
-    # Load data
-    customers = spark.read.csv(os.path.join(UPLOAD_FOLDER, "df_Customers.csv"), 
-                             header=True, inferSchema=True)
-    orders = spark.read.csv(os.path.join(UPLOAD_FOLDER, "df_Orders.csv"), 
-                          header=True, inferSchema=True)
-    order_items = spark.read.csv(os.path.join(UPLOAD_FOLDER, "df_OrderItems.csv"), 
-                               header=True, inferSchema=True)
-    products = spark.read.csv(os.path.join(UPLOAD_FOLDER, "df_Products.csv"), 
-                            header=True, inferSchema=True)
-    
-    # Convert timestamp data types
-    orders = orders.withColumn("order_purchase_timestamp", 
-                             to_date(col("order_purchase_timestamp")))
-    orders = orders.withColumn("order_delivered_timestamp", 
-                             to_date(col("order_delivered_timestamp")))
-    orders = orders.withColumn("order_estimated_delivery_date", 
-                             to_date(col("order_estimated_delivery_date")))
-    
-    # Currency conversion (e.g., price -> VND)
-    BRL_TO_VND_RATE = 5200
-    if "price" in order_items.columns:
-        order_items = order_items.withColumn("price", 
-                                          col("price") * lit(BRL_TO_VND_RATE))
-    
-    # Join data
-    df = order_items.join(orders, "order_id", "inner") \
-                  .join(products, "product_id", "left") \
-                  .join(customers, "customer_id", "left")
-    
-    # Feature engineering
-    df = df.withColumn("shipping_duration", 
-                     datediff(col("order_delivered_timestamp"), 
-                              col("order_purchase_timestamp")))
-    df = df.withColumn("delivery_delay", 
-                     datediff(col("order_delivered_timestamp"), 
-                              col("order_estimated_delivery_date")))
-    df = df.withColumn("order_month", 
-                     date_format(col("order_purchase_timestamp"), "yyyy-MM"))
-    
-    # Rename columns
-    if "freight_value" in df.columns and "shipping_charges" not in df.columns:
-        df = df.withColumnRenamed("freight_value", "shipping_charges")
-    
     # Convert to pandas for compatibility with current code
-    df_pandas = df.toPandas()
-    
-    # Close Spark session
-    spark.stop()
-    
-    return df_pandas
+    return df.toPandas()
 
-def is_large_dataset():
+def dataset_version():
     """
-    Check if dataset is large to decide whether to use Spark or Pandas
+    Identify the current dataset by the size and mtime of each source CSV
     """
-    total_size = 0
-    for filename in ["df_Customers.csv", "df_Orders.csv", "df_OrderItems.csv", "df_Products.csv"]:
+    version = []
+    for filename in DATA_FILES:
         path = os.path.join(UPLOAD_FOLDER, filename)
         if os.path.exists(path):
-            total_size += os.path.getsize(path)
-    
-    # If total size > 500MB, use Spark
-    return total_size > 500 * 1024 * 1024
\ No newline at end of file
+            stat = os.stat(path)
+            version.append((filename, stat.st_size, stat.st_mtime_ns))
+        else:
+            version.append((filename, None, None))
+    return tuple(version)
+
+def total_dataset_size():
+    """
+    Total size in bytes of the source CSVs
+    """
+    return sum(
+        os.path.getsize(os.path.join(UPLOAD_FOLDER, filename))
+        for filename in DATA_FILES
+        if os.path.exists(os.path.join(UPLOAD_FOLDER, filename))
+    )
+
+def should_stream():
+    """
+    Use streaming preprocessing when the merged frame would not comfortably fit in memory
+    """
+    threshold_mb = float(os.getenv("STREAMING_THRESHOLD_MB", 500))
+    return total_dataset_size() > threshold_mb * 1024 * 1024
+
+def is_large_dataset(operation="preprocess"):
+    """
+    Check whether Spark should handle `operation`, using the engine cost model
+    (row counts, available memory, operation) rather than file size alone
+    """
+    from services.engine import select_engine
+    return select_engine(operation) == "spark"
+
+def _file_content_hash(path, size, mtime_ns):
+    key = (path, size, mtime_ns)
+    if key not in _content_hashes:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        _content_hashes[key] = digest.hexdigest()
+    return _content_hashes[key]
+
+def source_fingerprint():
+    """
+    Fingerprint of the source CSVs (size, mtime and content hash), used to key snapshots
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"v{SNAPSHOT_VERSION};".encode())
+    for filename in DATA_FILES:
+        path = os.path.join(UPLOAD_FOLDER, filename)
+        if not os.path.exists(path):
+            digest.update(f"{filename}:missing;".encode())
+            continue
+        stat = os.stat(path)
+        content_hash = _file_content_hash(path, stat.st_size, stat.st_mtime_ns)
+        digest.update(f"{filename}:{stat.st_size}:{stat.st_mtime_ns}:{content_hash};".encode())
+    return digest.hexdigest()
+
+def snapshot_path(fingerprint):
+    return os.path.join(UPLOAD_FOLDER, SNAPSHOT_DIRNAME, f"preprocessed_{fingerprint}.parquet")
+
+def load_snapshot(fingerprint, columns=None):
+    """
+    Load the preprocessed Parquet snapshot for a fingerprint, reading only `columns` if given.
+    Returns None when there is no usable snapshot.
+    """
+    path = snapshot_path(fingerprint)
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path, columns=columns)
+    except Exception as e:
+        print(f"⚠️ Cannot read snapshot {path}: {str(e)}")
+        return None
+
+def save_snapshot(df, fingerprint):
+    """
+    Write the preprocessed frame as a Parquet snapshot and drop snapshots of older data
+    """
+    path = snapshot_path(fingerprint)
+    snapshot_dir = os.path.dirname(path)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"⚠️ Cannot write snapshot {path}: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+    for name in os.listdir(snapshot_dir):
+        old_path = os.path.join(snapshot_dir, name)
+        if name.startswith("preprocessed_") and name.endswith(".parquet") and old_path != path:
+            os.remove(old_path)
+    return path
+
+def load_preprocessed(columns=None):
+    """
+    Return the preprocessed frame from the columnar snapshot when the source CSVs
+    are unchanged, otherwise run the pandas preprocessing and refresh the snapshot
+    """
+    fingerprint = source_fingerprint()
+    df = load_snapshot(fingerprint, columns=columns)
+    if df is not None:
+        print(f"⚡ Loaded preprocessed snapshot {fingerprint}")
+        return df
+
+    from services.engine import select_engine
+    engine = select_engine("preprocess")
+    # Spark chỉ dùng cho các phép tổng hợp; frame đầy đủ được dựng bằng pandas hoặc DuckDB
+    df = preprocess_data(engine="duckdb" if engine == "duckdb" else "pandas")
+    save_snapshot(df, fingerprint)
+    return df[columns] if columns else df
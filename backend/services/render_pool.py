@@ -0,0 +1,201 @@
+# services/render_pool.py
+import importlib
+import os
+import shutil
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from services.charts import chart_digest, chart_image_path, store_chart_png
+
+# Tính và vẽ sẵn toàn bộ biểu đồ dashboard bằng một pool tiến trình: cả bước tính dữ liệu
+# (EDA, dự báo, chiến lược tồn kho) lẫn bước vẽ (mỗi worker có backend Agg riêng, nên không bị
+# giới hạn bởi GIL hay _render_lock của services.charts). Ảnh được lưu vào kho theo hash
+# (charts/cache) nên request chỉ còn đọc file đã vẽ xong.
+RENDER_WORKERS = int(os.getenv("CHART_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+# Chu kỳ vẽ lại định kỳ (phút); 0 = chỉ vẽ sau khi upload dữ liệu
+RENDER_INTERVAL_MIN = float(os.getenv("CHART_RENDER_INTERVAL_MIN", "0"))
+# Số danh mục của dashboard (giống mặc định của /forecast/demand/all và /reorder/charts/top-*)
+DASHBOARD_CATEGORIES = 15
+
+_render_state_lock = threading.Lock()
+# pending: có yêu cầu vẽ mới trong lúc đang vẽ (vd. upload lần lượt từng file CSV),
+# chạy lại một lần nữa khi lượt hiện tại xong để ảnh luôn ứng với dữ liệu cuối cùng
+_render_state = {"running": False, "pending": False, "last_run": None, "scheduler": None}
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _render_job(renderer, name, data, copy_to=None):
+    """
+    Worker: import the "module:function" renderer, draw `data` and store the PNG by digest;
+    `copy_to` also keeps a copy under its usual name in charts/
+    """
+    from utils.plot import fig_to_png
+
+    digest = chart_digest(name, data)
+    path = chart_image_path(digest)
+    if not os.path.exists(path):
+        module_name, func_name = renderer.split(":")
+        render = getattr(importlib.import_module(module_name), func_name)
+        store_chart_png(digest, fig_to_png(render(data)))
+    if copy_to:
+        os.makedirs(os.path.dirname(copy_to), exist_ok=True)
+        tmp_path = f"{copy_to}.{os.getpid()}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, copy_to)
+    return name, digest
+
+
+def _eda_jobs():
+    """
+    Worker: data of the 5 EDA charts (from the rollup) as render jobs
+    """
+    from services.eda import EDA_CHARTS
+
+    jobs = [
+        (f"services.eda:{render.__name__}", name, generate()["data"],
+         os.path.join("charts", "eda", f"{name.replace('-', '_')}.png"))
+        for name, (generate, render) in EDA_CHARTS.items()
+    ]
+    return jobs, None
+
+
+def _forecast_jobs():
+    """
+    Worker: the /forecast/demand/all forecasts (returned so the parent and the reorder step
+    reuse them) and the overall forecast chart as a render job
+    """
+    from services.forecast import forecast_all_categories
+
+    forecasts = forecast_all_categories(DASHBOARD_CATEGORIES)
+    overall = next((f for f in forecasts if f.get("category") == "Overall"), {})
+    jobs = []
+    if overall.get("status") == "success":
+        jobs.append(("services.forecast:render_forecast_chart", "forecast-overall", overall["chart_data"],
+                     os.path.join("charts", "forecast", "forecast_chart.png")))
+    return jobs, forecasts
+
+
+def _reorder_jobs(forecasts):
+    """
+    Worker: the 6 reorder top-N series, computed from the forecasts of _forecast_jobs,
+    as render jobs (the series are also returned for the parent's cache)
+    """
+    from services.forecast import all_categories_cache_key
+    from services.reorder import build_top_charts
+    from utils.cache import set_cache
+    from visualize_reorder import REORDER_CHARTS
+
+    set_cache(all_categories_cache_key(DASHBOARD_CATEGORIES), forecasts, ttl_seconds=60 * 60)
+    charts = build_top_charts(DASHBOARD_CATEGORIES)
+    jobs = [
+        ("visualize_reorder:render_reorder_chart", f"reorder-{key}",
+         {"chart": key, "rows": charts[key][:10]}, os.path.join("charts", "reorder", filename))
+        for key, (filename, _, _, _) in REORDER_CHARTS.items()
+    ]
+    return jobs, charts
+
+
+def prerender_dashboard_charts():
+    """
+    Compute and render every dashboard chart in worker processes; returns a short summary.
+
+    The data steps are pool tasks too: the EDA data and the all-category forecast run in
+    parallel, the reorder charts start as soon as the forecasts are ready, and every chart
+    is rendered by its own task as soon as its data is available.
+    """
+    from services.forecast import all_categories_cache_key
+    from utils.cache import set_cache
+
+    t0 = time.time()
+    print(f"🖼️ Pre-rendering dashboard charts with {RENDER_WORKERS} workers...")
+
+    rendered, failed = [], []
+    with ProcessPoolExecutor(max_workers=RENDER_WORKERS, initializer=_init_worker) as executor:
+        pending = {executor.submit(_eda_jobs): ("data", "eda"), executor.submit(_forecast_jobs): ("data", "forecast")}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"⚠️ Could not pre-render {name}: {str(e)}")
+                    failed.append(name)
+                    if name == "forecast":
+                        failed.append("reorder")
+                    continue
+
+                if kind == "render":
+                    rendered.append(result[0])
+                    continue
+                jobs, data = result
+                if name == "forecast":
+                    set_cache(all_categories_cache_key(DASHBOARD_CATEGORIES), data, ttl_seconds=60 * 60)
+                    pending[executor.submit(_reorder_jobs, data)] = ("data", "reorder")
+                elif name == "reorder":
+                    for cache_key, rows in data.items():
+                        set_cache(cache_key, rows, ttl_seconds=3600)
+                for job in jobs:
+                    pending[executor.submit(_render_job, *job)] = ("render", job[1])
+
+    summary = {"rendered": sorted(rendered), "failed": sorted(failed), "seconds": round(time.time() - t0, 3)}
+    print(f"✅ Pre-rendered {len(rendered)} charts in {summary['seconds']}s")
+    return summary
+
+
+def _run_prerender():
+    while True:
+        try:
+            summary = prerender_dashboard_charts()
+            with _render_state_lock:
+                _render_state["last_run"] = dict(summary, finished_at=time.time())
+        except Exception as e:
+            print(f"❌ Chart pre-rendering failed: {str(e)}")
+            traceback.print_exc()
+        with _render_state_lock:
+            if not _render_state["pending"]:
+                _render_state["running"] = False
+                return
+            _render_state["pending"] = False
+        print("🔁 Dataset changed during pre-rendering, rendering again...")
+
+
+def submit_prerender():
+    """
+    Start a pre-render in a background thread. When one is already running, mark it pending
+    so it runs once more after the current pass; returns whether a new thread started
+    """
+    with _render_state_lock:
+        if _render_state["running"]:
+            _render_state["pending"] = True
+            return False
+        _render_state["running"] = True
+        _render_state["pending"] = False
+    threading.Thread(target=_run_prerender, name="chart-prerender", daemon=True).start()
+    return True
+
+
+def start_render_schedule(interval_min=None):
+    """
+    Re-render the dashboard charts every `interval_min` minutes (CHART_RENDER_INTERVAL_MIN by default)
+    """
+    interval_min = RENDER_INTERVAL_MIN if interval_min is None else interval_min
+    if interval_min <= 0:
+        return None
+
+    def loop():
+        while True:
+            submit_prerender()
+            time.sleep(interval_min * 60)
+
+    with _render_state_lock:
+        if _render_state["scheduler"] is None:
+            print(f"⏰ Chart pre-rendering scheduled every {interval_min} min")
+            _render_state["scheduler"] = threading.Thread(target=loop, name="chart-schedule", daemon=True)
+            _render_state["scheduler"].start()
+        return _render_state["scheduler"]
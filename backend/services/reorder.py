@@ -1,7 +1,9 @@
 import pandas as pd
 import numpy as np
-from services.preprocess import preprocess_data, is_large_dataset
-from services.forecast import forecast_demand, forecast_demand_by_category
+from services.engine import select_engine
+from services.duckdb_engine import supplier_features_duckdb, seller_duration_counts_duckdb
+from services.dataset import get_dataset
+from services.forecast import forecast_demand, forecast_demand_by_category, forecast_all_categories
 from utils.cache import get_cache, set_cache
 from utils.currency import brl_to_vnd, format_vnd
 import os
@@ -13,42 +15,52 @@ from services.mongodb import (
     save_bottleneck_analysis,
 )
 
-def calculate_reorder_strategy():
+# Tham số chiến lược tồn kho: mức phục vụ 95% và chi phí lưu kho 2 BRL/đơn vị/tháng
+REORDER_Z_SCORE = 1.65
+HOLDING_COST_PER_UNIT_PER_MONTH_BRL = 2
+
+
+def load_category_forecasts():
+    """
+    Successful per-category forecasts keyed by category, from the /forecast/demand/all cache
+    (computed on demand when the cache is empty)
+    """
+    forecasts = forecast_all_categories(15)
+    if not forecasts:
+        print("❌ Forecasts not available. Stopping.")
+        return {}
+
+    return {f["category"]: f for f in forecasts if f["status"] == "success"}
+
+
+def calculate_reorder_strategy(engine=None):
     cache_key = "reorder_strategy"
     cached = get_cache(cache_key)
     if cached:
         return cached
 
-    # Check if Spark should be used
-    use_spark = is_large_dataset()
-    if use_spark:
+    # Choose the engine with the cost model unless the caller forces one
+    engine = engine or select_engine("reorder")
+    if engine == "spark":
         print("📊 Using Spark to calculate reorder strategy (large dataset)")
         from services.spark_analytics import calculate_reorder_strategy_spark
-        return calculate_reorder_strategy_spark()
-    
-    # If not using Spark, continue with current code
-    df = preprocess_data()
+        strategy = calculate_reorder_strategy_spark()
+        if strategy is not None:
+            set_cache(cache_key, strategy, ttl_seconds=3600)
+            save_reorder_strategy(strategy)
+            return strategy
+        print("⚠️ Spark reorder strategy failed, falling back to pandas")
+
+    df = get_dataset()
     categories = df["product_category_name"].dropna().unique()
 
-    forecast_cache_key = "forecast_all_categories_15"
-    cached_forecasts = get_cache(forecast_cache_key)
-
-    # 🔁 If no cache, call forecast_demand_all
-    if not cached_forecasts:
-        print("⚠️ Forecast cache not available, automatically calling forecast_demand_all...")
-        from routes.forecast import get_forecast_for_all_categories
-        response = get_forecast_for_all_categories()
-        cached_forecasts = response.get_json()
-
-    if not cached_forecasts:
-        print("❌ Forecast cache still not ready after call. Stopping.")
+    forecast_map = load_category_forecasts()
+    if not forecast_map:
         return []
 
-    forecast_map = {f["category"]: f for f in cached_forecasts if f["status"] == "success"}
-
-    z_score = 1.65
+    z_score = REORDER_Z_SCORE
     # Convert values from BRL to VND
-    holding_cost_per_unit_per_month = brl_to_vnd(2)  # Assume cost of 2 BRL/unit/month
+    holding_cost_per_unit_per_month = brl_to_vnd(HOLDING_COST_PER_UNIT_PER_MONTH_BRL)
     strategy = []
 
     for category in categories:
@@ -93,6 +105,43 @@ def calculate_reorder_strategy():
     return strategy
 
 
+# Cache key của từng biểu đồ top-N -> (cột của chiến lược, hàm định dạng giá trị)
+TOP_CHART_FIELDS = {
+    "top_reorder_points": ("reorder_point", lambda v: v),
+    "top_safety_stock": ("safety_stock", lambda v: v),
+    "top_lead_time": ("avg_lead_time_days", lambda v: round(v, 1)),
+    "top_optimal_inventory": ("optimal_inventory", lambda v: v),
+    "top_holding_cost": ("holding_cost", lambda v: v),
+}
+
+
+def build_top_charts(limit=15, engine=None):
+    """
+    Compute all six /reorder/charts/top-* series from one strategy result and cache each
+    of them, so the chart endpoints share a single strategy computation
+    """
+    strategy = calculate_reorder_strategy(engine=engine)
+
+    charts = {}
+    for cache_key, (field, fmt) in TOP_CHART_FIELDS.items():
+        top = sorted(strategy, key=lambda x: x[field], reverse=True)[:limit]
+        charts[cache_key] = [{"category": item["category"], "value": fmt(item[field])} for item in top]
+
+    recommendations_df = generate_optimization_recommendations(strategy, return_df=True)
+    if recommendations_df.empty or "potential_saving" not in recommendations_df.columns:
+        print("⚠️ Không có cột hoặc dữ liệu potential_saving.")
+        charts["top_potential_saving"] = []
+    else:
+        top_save = recommendations_df.sort_values("potential_saving", ascending=False).head(limit)
+        charts["top_potential_saving"] = [
+            {"category": row["category"], "value": row["potential_saving"]} for _, row in top_save.iterrows()
+        ]
+
+    for cache_key, data in charts.items():
+        set_cache(cache_key, data, ttl_seconds=3600)
+    return charts
+
+
 def generate_optimization_recommendations(strategy_data, return_df=False):
     recommendations = []
     
@@ -152,7 +201,46 @@ def generate_optimization_recommendations(strategy_data, return_df=False):
     return df if return_df else output_path
 
 
-def cluster_suppliers(n_clusters=3):
+def describe_cluster(avg_shipping_days, avg_freight):
+    """
+    Label a supplier cluster from its mean shipping days and mean freight (VND)
+    """
+    if avg_shipping_days < 15 and avg_freight < 500000:
+        return "Fast and Cheap"
+    elif avg_shipping_days < 15 and avg_freight >= 500000:
+        return "Fast but Expensive"
+    elif avg_shipping_days >= 15 and avg_freight < 500000:
+        return "Slow but Cheap"
+    else:
+        return "Slow and Expensive"
+
+
+# Mức độ nghiêm trọng theo tỷ lệ giao trễ (%): (0, 25] Mild, (25, 50] Moderate, (50, 75] Severe, > 75 Very Severe
+SEVERITY_BINS = [-np.inf, 25, 50, 75, np.inf]
+SEVERITY_LABELS = ["Mild", "Moderate", "Severe", "Very Severe"]
+
+
+def bottleneck_severity(late_percentage):
+    """
+    Severity label of each late percentage in a Series, binned in one pass
+    """
+    return pd.cut(late_percentage, bins=SEVERITY_BINS, labels=SEVERITY_LABELS).astype(object)
+
+
+def top_category_by_seller(df):
+    """
+    Most frequent product category of each seller, ties broken by name like pandas' mode().
+
+    Counts (seller, category) pairs once and takes the idxmax per seller instead of
+    running mode() per group; sellers without any category get "Unknown".
+    """
+    counts = df.groupby(["seller_id", "product_category_name"], observed=True).size()
+    top = counts.groupby(level="seller_id", observed=True).idxmax().str[1] if len(counts) else pd.Series(dtype=object)
+    sellers = df["seller_id"].drop_duplicates()
+    return pd.Series(sellers.map(top).fillna("Unknown").values, index=sellers.values)
+
+
+def cluster_suppliers(n_clusters=3, engine=None):
     """
     Cluster suppliers based on order volume, delivery time,
     and average shipping cost.
@@ -164,33 +252,37 @@ def cluster_suppliers(n_clusters=3):
         if cached:
             return cached
 
-        # Check if Spark should be used
-        use_spark = is_large_dataset()
-        if use_spark:
+        # Choose the engine with the cost model unless the caller forces one
+        engine = engine or select_engine("reorder")
+        if engine == "spark":
             print("📊 Using Spark for supplier clustering (large dataset)")
             from services.spark_analytics import cluster_suppliers_spark
             clusters = cluster_suppliers_spark(n_clusters)
-            
-            # Cache and save results
-            set_cache(cache_key, clusters, ttl_seconds=3600*24)
-            save_supplier_clusters(clusters)
-            
-            return clusters
-
-        # If not using Spark, continue with current code
-        df = preprocess_data()
-
-        supplier_df = df.groupby("seller_id").agg({
-            "order_id": "nunique",
-            "shipping_duration": "mean",
-            "shipping_charges": "mean"  # ✅ use correct column name
-        }).reset_index()
+            if clusters is not None:
+                # Cache and save results
+                set_cache(cache_key, clusters, ttl_seconds=3600*24)
+                save_supplier_clusters(clusters)
+                return clusters
+            print("⚠️ Spark clustering failed, falling back to pandas")
+            engine = "pandas"
+
+        if engine == "duckdb":
+            print("🦆 Aggregating supplier features with DuckDB")
+            supplier_df = supplier_features_duckdb()
+        else:
+            df = get_dataset()
+
+            supplier_df = df.groupby("seller_id", observed=True).agg({
+                "order_id": "nunique",
+                "shipping_duration": "mean",
+                "shipping_charges": "mean"  # ✅ use correct column name
+            }).reset_index()
 
         supplier_df.columns = ["seller_id", "total_orders", "avg_shipping_days", "avg_freight"]
         
         # Ensure data has correct format
         supplier_df["avg_shipping_days"] = supplier_df["avg_shipping_days"].fillna(0).astype(float)
-        supplier_df["avg_freight"] = supplier_df["avg_freight"].apply(lambda x: float(brl_to_vnd(x)) if pd.notnull(x) else 0)
+        supplier_df["avg_freight"] = brl_to_vnd(supplier_df["avg_freight"]).fillna(0).astype(float)
         supplier_df["total_orders"] = supplier_df["total_orders"].fillna(0).astype(int)
         
         # Filter suppliers with at least 5 orders
@@ -220,18 +312,10 @@ def cluster_suppliers(n_clusters=3):
             "total_orders": "mean"
         })
         
-        cluster_descriptions = {}
-        for cluster_id, stats in cluster_stats.iterrows():
-            if stats["avg_shipping_days"] < 15 and stats["avg_freight"] < 500000:
-                description = "Fast and Cheap"
-            elif stats["avg_shipping_days"] < 15 and stats["avg_freight"] >= 500000:
-                description = "Fast but Expensive"
-            elif stats["avg_shipping_days"] >= 15 and stats["avg_freight"] < 500000:
-                description = "Slow but Cheap"
-            else:
-                description = "Slow and Expensive"
-                
-            cluster_descriptions[cluster_id] = description
+        cluster_descriptions = {
+            cluster_id: describe_cluster(stats["avg_shipping_days"], stats["avg_freight"])
+            for cluster_id, stats in cluster_stats.iterrows()
+        }
             
         filtered_suppliers["cluster_description"] = filtered_suppliers["cluster"].map(cluster_descriptions)
 
@@ -252,52 +336,133 @@ def cluster_suppliers(n_clusters=3):
         return []
 
 
-def analyze_bottlenecks(threshold_days=20):
+DEFAULT_BOTTLENECK_THRESHOLD_DAYS = 20
+
+
+def _duration_histograms(counts, top_categories):
+    """
+    Per-seller arrays from a (seller_id, shipping_duration, n) histogram:
+
+    - late_counts[s, k]: orders of seller s shipped in at least min_day + k days
+      (the last column is 0), so the late count for any threshold is one column
+    - total_orders, duration_count, duration_sum and top_category per seller
+    """
+    counts = counts[counts["seller_id"].notna()]
+    codes, sellers = pd.factorize(counts["seller_id"].astype(str), sort=True)
+    n = counts["n"].to_numpy(dtype=np.int64)
+    days = counts["shipping_duration"].to_numpy(dtype=float)
+    known = ~np.isnan(days)
+
+    min_day = int(np.floor(days[known].min())) if known.any() else 0
+    offsets = (np.floor(days[known]) - min_day).astype(np.int64)
+    span = int(offsets.max()) + 1 if known.any() else 0
+    histogram = np.zeros((len(sellers), span + 1), dtype=np.int64)
+    np.add.at(histogram, (codes[known], offsets), n[known])
+
+    top = pd.Series(top_categories["top_category"].values, index=top_categories["seller_id"].astype(str).values)
+    return {
+        "sellers": np.asarray(sellers),
+        "min_day": min_day,
+        "late_counts": histogram[:, ::-1].cumsum(axis=1)[:, ::-1],
+        "total_orders": np.bincount(codes, weights=n, minlength=len(sellers)).astype(np.int64),
+        "duration_count": histogram.sum(axis=1),
+        "duration_sum": np.bincount(codes[known], weights=days[known] * n[known], minlength=len(sellers)),
+        "top_category": pd.Series(sellers).map(top).fillna("Unknown").to_numpy(),
+    }
+
+
+def seller_duration_histograms(engine=None):
+    """
+    Per-seller shipping-duration histograms, computed once per dataset (cached until the
+    next upload) and shared by every threshold of the bottleneck analysis
+    """
+    cache_key = "shipping_bottlenecks_histograms"
+    cached = get_cache(cache_key)
+    if cached is not None:
+        return cached
+
+    # Choose the engine with the cost model unless the caller forces one
+    engine = engine or select_engine("reorder")
+    source = None
+    if engine == "spark":
+        print("📊 Using Spark for shipping-duration histograms (large dataset)")
+        from services.spark_analytics import seller_duration_counts_spark
+        source = seller_duration_counts_spark()
+        if source is None:
+            print("⚠️ Spark histograms failed, falling back to pandas")
+    elif engine == "duckdb":
+        print("🦆 Aggregating shipping-duration histograms with DuckDB")
+        source = seller_duration_counts_duckdb()
+    if source is None:
+        df = get_dataset(["seller_id", "product_category_name", "shipping_duration"])
+        counts = df.groupby(["seller_id", "shipping_duration"], observed=True, dropna=False).size()
+        counts = counts[counts > 0].rename("n").reset_index()
+        top = top_category_by_seller(df)
+        source = counts, pd.DataFrame({"seller_id": top.index, "top_category": top.values})
+
+    histograms = _duration_histograms(*source)
+    set_cache(cache_key, histograms, ttl_seconds=3600*24)
+    return histograms
+
+
+def _late_column(histograms, threshold_days):
+    # Thời gian giao tính theo ngày nguyên: duration > threshold <=> duration >= floor(threshold) + 1
+    k = int(np.floor(threshold_days)) + 1 - histograms["min_day"]
+    return min(max(k, 0), histograms["late_counts"].shape[1] - 1)
+
+
+def bottleneck_threshold_sweep(thresholds, engine=None):
+    """
+    Overall late percentage and number of bottleneck sellers (>= 5 orders, late ratio above
+    the overall one) for each threshold, answered from the histograms without row data
+    """
+    histograms = seller_duration_histograms(engine)
+    total_orders = histograms["total_orders"]
+    columns = [_late_column(histograms, t) for t in thresholds]
+    late = histograms["late_counts"][:, columns]
+
+    overall = late.sum(axis=0) / max(total_orders.sum(), 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = late / total_orders[:, None]
+    bottleneck_sellers = ((ratios > overall) & (total_orders[:, None] >= 5)).sum(axis=0)
+
+    return [
+        {
+            "threshold_days": t,
+            "late_percentage": round(float(overall[i] * 100), 2),
+            "bottleneck_sellers": int(bottleneck_sellers[i]),
+        }
+        for i, t in enumerate(thresholds)
+    ]
+
+
+def analyze_bottlenecks(threshold_days=DEFAULT_BOTTLENECK_THRESHOLD_DAYS, engine=None):
     """
     Analyze shipping process bottlenecks, identify suppliers
     with high delivery delay rates
     """
     try:
         print("🚀 Starting shipping bottleneck analysis...")
-        cache_key = "shipping_bottlenecks"
+        cache_key = f"shipping_bottlenecks:{threshold_days}"
         cached = get_cache(cache_key)
         if cached:
             return cached
 
-        # Check if Spark should be used
-        use_spark = is_large_dataset()
-        if use_spark:
-            print("📊 Using Spark for bottleneck analysis (large dataset)")
-            from services.spark_analytics import analyze_bottlenecks_spark
-            bottlenecks = analyze_bottlenecks_spark(threshold_days)
-            
-            # Cache and save results
-            set_cache(cache_key, bottlenecks, ttl_seconds=3600*24)
-            save_bottleneck_analysis(bottlenecks)
-            
-            return bottlenecks
+        histograms = seller_duration_histograms(engine)
+        total_orders = histograms["total_orders"]
+        late = histograms["late_counts"][:, _late_column(histograms, threshold_days)]
 
-        # If not using Spark, continue with current code
-        df = preprocess_data()
-
-        # Identify delayed orders based on threshold
-        df["is_late"] = df["shipping_duration"] > threshold_days
-        
-        print("📦 Shipping duration statistics:")
-        print(df["shipping_duration"].describe())
-        
-        late_ratio_all = (df["is_late"].mean() * 100)
+        late_ratio_all = late.sum() / max(total_orders.sum(), 1) * 100
         print(f"⚠️ Overall order delay rate with {threshold_days} days threshold: {late_ratio_all:.2f}%")
 
-        # Analyze by supplier
-        bottlenecks = df.groupby("seller_id").agg({
-            "order_id": "count",
-            "is_late": "mean",
-            "product_category_name": lambda x: x.mode()[0] if not x.mode().empty else "Unknown",
-            "shipping_duration": "mean"
-        }).reset_index()
-
-        bottlenecks.columns = ["seller_id", "total_orders", "late_ratio", "top_category", "avg_delivery_time"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bottlenecks = pd.DataFrame({
+                "seller_id": histograms["sellers"],
+                "total_orders": total_orders,
+                "late_ratio": late / total_orders,
+                "top_category": histograms["top_category"],
+                "avg_delivery_time": histograms["duration_sum"] / histograms["duration_count"],
+            })
 
         # Only take sellers with at least 5 orders and delay rate higher than average
         bottlenecks = bottlenecks[(bottlenecks["total_orders"] >= 5) & 
@@ -307,17 +472,7 @@ def analyze_bottlenecks(threshold_days=20):
         bottlenecks["late_percentage"] = (bottlenecks["late_ratio"] * 100).round(1)
         
         # Add severity notes
-        def get_severity(row):
-            if row["late_percentage"] > 75:
-                return "Very Severe"
-            elif row["late_percentage"] > 50:
-                return "Severe"
-            elif row["late_percentage"] > 25:
-                return "Moderate"
-            else:
-                return "Mild"
-        
-        bottlenecks["severity"] = bottlenecks.apply(get_severity, axis=1)
+        bottlenecks["severity"] = bottleneck_severity(bottlenecks["late_percentage"])
         
         # Get top 10 problematic sellers
         top_bottlenecks = bottlenecks.sort_values("late_percentage", ascending=False).head(10)
@@ -325,9 +480,10 @@ def analyze_bottlenecks(threshold_days=20):
         # Prepare results
         top_bottlenecks_list = top_bottlenecks.to_dict(orient="records")
         
-        # Cache and save results
+        # Cache and save results (MongoDB keeps the analysis at the default threshold)
         set_cache(cache_key, top_bottlenecks_list, ttl_seconds=3600*24)
-        save_bottleneck_analysis(top_bottlenecks_list)
+        if threshold_days == DEFAULT_BOTTLENECK_THRESHOLD_DAYS:
+            save_bottleneck_analysis(top_bottlenecks_list)
         
         print(f"✅ Bottleneck analysis completed: {len(top_bottlenecks_list)} problematic sellers")
         return top_bottlenecks_list
@@ -0,0 +1,146 @@
+# services/smoothing.py
+import warnings
+import numpy as np
+
+# Exponential smoothing (SES, Holt, Holt-Winters cộng tính) cho nhiều chuỗi cùng lúc:
+# dữ liệu là ma trận (chuỗi × tháng), mọi tổ hợp tham số trong lưới được chạy song song
+# trên mảng (tham số × chuỗi), vòng lặp Python chỉ chạy theo thời gian.
+SEASON_LENGTH = 12
+ALPHAS = (0.1, 0.3, 0.5, 0.7, 0.9)
+BETAS = (0.05, 0.1, 0.2, 0.3)
+GAMMAS = (0.05, 0.1, 0.3, 0.5)
+SMOOTHING_METHODS = ("ses", "holt", "holt_winters")
+# Số chuỗi xử lý mỗi lần, để giới hạn bộ nhớ của mảng (tham số × chuỗi × mùa)
+CHUNK_SIZE = 2048
+
+
+def left_align(values):
+    """
+    Move the observed values of each row to the left (keeping their order);
+    returns (aligned matrix, NaN-padded on the right, and the number of values per row)
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    observed = ~np.isnan(values)
+    order = np.argsort(~observed, axis=1, kind="stable")
+    return np.take_along_axis(values, order, axis=1), observed.sum(axis=1)
+
+
+def _parameter_grid(method):
+    if method == "ses":
+        alpha, beta, gamma = np.array(ALPHAS), np.zeros(len(ALPHAS)), np.zeros(len(ALPHAS))
+    elif method == "holt":
+        alpha, beta = (grid.ravel() for grid in np.meshgrid(ALPHAS, BETAS, indexing="ij"))
+        gamma = np.zeros(len(alpha))
+    else:
+        alpha, beta, gamma = (grid.ravel() for grid in np.meshgrid(ALPHAS, BETAS, GAMMAS, indexing="ij"))
+    return alpha, beta, gamma
+
+
+def _smooth(values, lengths, method, eval_start, m):
+    """
+    Run one method for every parameter combination × series of a left-aligned chunk.
+    Returns the one-step-ahead squared / absolute error sums over t >= eval_start of each
+    (combination, series), and the final level, trend and seasonal states.
+    """
+    alpha, beta, gamma = (p[:, None] for p in _parameter_grid(method))
+    n_grid, (n_series, n_months) = len(alpha), values.shape
+    seasonal = method == "holt_winters"
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if seasonal:
+            level0 = np.nanmean(values[:, :m], axis=1) if n_months >= m else np.full(n_series, np.nan)
+            trend0 = (np.nanmean(values[:, m:2 * m], axis=1) - level0) / m if n_months >= 2 * m else np.full(n_series, np.nan)
+            season0 = values[:, :m] - level0[:, None] if n_months >= m else np.full((n_series, m), np.nan)
+            start, usable = m, lengths >= 2 * m
+        else:
+            level0 = values[:, 0]
+            trend0 = values[:, 1] - values[:, 0] if method == "holt" and n_months > 1 else np.zeros(n_series)
+            start, usable = 1, lengths >= (2 if method == "holt" else 1)
+
+    level = np.broadcast_to(level0, (n_grid, n_series)).copy()
+    trend = np.broadcast_to(trend0, (n_grid, n_series)).copy()
+    season = np.broadcast_to(season0, (n_grid, n_series, m)).copy() if seasonal else None
+    sse = np.zeros((n_grid, n_series))
+    sae = np.zeros((n_grid, n_series))
+
+    for t in range(start, n_months):
+        y = values[:, t]
+        active = t < lengths
+        counted = active & (t >= eval_start)
+        s_prev = season[:, :, t % m] if seasonal else 0.0
+
+        error = y - (level + trend + s_prev)
+        sse += np.where(counted, error ** 2, 0.0)
+        sae += np.where(counted, np.abs(error), 0.0)
+
+        new_level = alpha * (y - s_prev) + (1 - alpha) * (level + trend)
+        if method != "ses":
+            trend = np.where(active, beta * (new_level - level) + (1 - beta) * trend, trend)
+        if seasonal:
+            season[:, :, t % m] = np.where(active, gamma * (y - new_level) + (1 - gamma) * s_prev, s_prev)
+        level = np.where(active, new_level, level)
+
+    # Chuỗi quá ngắn cho phương pháp này thì không được chọn
+    sse[:, ~usable] = np.inf
+    return sse, sae, level, trend, season
+
+
+def _fit_chunk(values, lengths, periods, methods, m):
+    n_series = len(values)
+    # Cùng một cửa sổ đánh giá cho mọi phương pháp: từ sau mùa đầu tiên nếu đủ 2 mùa, ngược lại từ tháng thứ 3
+    eval_start = np.where(lengths >= 2 * m, m, 2) if "holt_winters" in methods else np.full(n_series, 2)
+    counts = np.maximum(lengths - eval_start, 0)
+    steps = np.arange(1, periods + 1)
+
+    best = {
+        "mse": np.full(n_series, np.inf), "mae": np.full(n_series, np.nan),
+        "forecast": np.full((n_series, periods), np.nan), "method": np.full(n_series, "", dtype=object),
+        "alpha": np.full(n_series, np.nan), "beta": np.full(n_series, np.nan), "gamma": np.full(n_series, np.nan),
+    }
+    for method in methods:
+        alpha, beta, gamma = _parameter_grid(method)
+        sse, sae, level, trend, season = _smooth(values, lengths, method, eval_start, m)
+        choice = np.argmin(sse, axis=0)
+        rows = np.arange(n_series)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mse = np.where(counts > 0, sse[choice, rows] / counts, np.where(np.isfinite(sse[choice, rows]), 0.0, np.inf))
+            mae = np.where(counts > 0, sae[choice, rows] / counts, 0.0)
+
+        forecast = level[choice, rows][:, None] + trend[choice, rows][:, None] * steps
+        if season is not None:
+            positions = (lengths[:, None] + steps - 1) % m
+            forecast = forecast + np.take_along_axis(season[choice, rows], positions, axis=1)
+
+        better = mse < best["mse"]
+        best["mse"] = np.where(better, mse, best["mse"])
+        best["mae"] = np.where(better, mae, best["mae"])
+        best["forecast"][better] = forecast[better]
+        best["method"][better] = method
+        for name, grid in (("alpha", alpha), ("beta", beta), ("gamma", gamma)):
+            best[name] = np.where(better, grid[choice], best[name])
+    return best
+
+
+def fit_exponential_smoothing(values, periods, methods=SMOOTHING_METHODS, season_length=SEASON_LENGTH):
+    """
+    Fit exponential smoothing to every row of a (series × months) matrix and forecast
+    `periods` months ahead.
+
+    For each series, every method in `methods` ("ses", "holt", "holt_winters") is run over
+    its parameter grid (ALPHAS / BETAS / GAMMAS) and the method and parameters with the
+    lowest one-step-ahead MSE are kept; Holt-Winters needs two full seasons. NaNs mark
+    missing months and are dropped (observed values are left-aligned).
+
+    Returns a dict of arrays: forecast (series × periods), method, alpha, beta, gamma,
+    and the in-sample mse / mae of the chosen model.
+    """
+    values, lengths = left_align(values)
+    results = [
+        _fit_chunk(values[i:i + CHUNK_SIZE], lengths[i:i + CHUNK_SIZE], periods, tuple(methods), season_length)
+        for i in range(0, len(values), CHUNK_SIZE)
+    ]
+    if not results:
+        return {name: np.empty((0, periods) if name == "forecast" else 0) for name in
+                ["forecast", "method", "alpha", "beta", "gamma", "mse", "mae"]}
+    return {name: np.concatenate([r[name] for r in results]) for name in results[0]}
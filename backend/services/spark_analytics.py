@@ -1,6 +1,7 @@
 # services/spark_analytics.py
-from pyspark.sql import SparkSession
-from pyspark.sql.functions import col, count, avg, date_format, to_date, datediff
+from pyspark.sql.functions import col, count, avg, date_format, to_date, datediff, coalesce, lit, when
+from pyspark.sql.functions import bround, countDistinct, row_number, sqrt, stddev_samp
+from pyspark.sql.functions import sum as _sum
 import pandas as pd
 import numpy as np
 import os
@@ -8,35 +9,53 @@ from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import matplotlib.pyplot as plt
 from utils.plot import fig_to_base64
-from utils.currency import brl_to_vnd
+from utils.currency import brl_to_vnd, get_exchange_rate
 from utils.cache import set_cache
 from services.mongodb import save_forecast_result
+from services.spark_session import get_spark, read_staged
+from services.aggregates import ROLLUP_KEYS
 import traceback
 
 def init_spark():
     """
-    Khởi tạo Spark Session với cấu hình tối ưu cho local mode
+    Lấy Spark Session dùng chung (services.spark_session), không tạo mới mỗi lần gọi
     """
     try:
-        spark = SparkSession.getActiveSession()
-        if spark is not None:
-            return spark
-            
-        # Cấu hình đơn giản hơn cho local mode
-        return SparkSession.builder \
-            .appName("SupplyChainAnalytics") \
-            .config("spark.executor.memory", "1g") \
-            .config("spark.driver.memory", "2g") \
-            .config("spark.driver.maxResultSize", "1g") \
-            .config("spark.python.worker.memory", "1g") \
-            .config("spark.sql.execution.arrow.pyspark.enabled", "true") \
-            .config("spark.sql.execution.arrow.maxRecordsPerBatch", "10000") \
-            .master("local[*]") \
-            .getOrCreate()
+        return get_spark()
     except Exception as e:
         print(f"❌ Error initializing Spark: {str(e)}")
         return None
 
+def build_rollup_spark():
+    """
+    Same rollup as services.aggregates.build_rollup, aggregated inside Spark.
+    Only the compact rollup table is collected to the driver (Arrow).
+    """
+    merged = read_staged(get_spark(), "merged",
+                         ROLLUP_KEYS + ["shipping_duration", "delivery_delay", "shipping_charges"])
+    duration = col("shipping_duration")
+    rollup = merged \
+        .withColumn("order_month", coalesce(col("order_month"), lit("NaT"))) \
+        .groupBy(*ROLLUP_KEYS) \
+        .agg(
+            count(lit(1)).alias("item_count"),
+            count(duration).alias("duration_count"),
+            coalesce(_sum(duration), lit(0)).cast("double").alias("duration_sum"),
+            coalesce(_sum(duration * duration), lit(0)).cast("double").alias("duration_sumsq"),
+            count(col("delivery_delay")).alias("delay_count"),
+            _sum(when(col("delivery_delay") > 0, 1).otherwise(0)).alias("delayed_count"),
+            coalesce(_sum(col("delivery_delay")), lit(0)).cast("double").alias("delay_sum"),
+            coalesce(_sum(col("delivery_delay") * col("delivery_delay")), lit(0)).cast("double").alias("delay_sumsq"),
+            count(col("shipping_charges")).alias("freight_count"),
+            coalesce(_sum(col("shipping_charges")), lit(0)).cast("double").alias("freight_sum"),
+            coalesce(_sum(col("shipping_charges") * col("shipping_charges")), lit(0)).cast("double").alias("freight_sumsq"),
+        ) \
+        .toPandas()
+
+    for column in ROLLUP_KEYS:
+        rollup[column] = rollup[column].astype("category")
+    return rollup
+
 def forecast_demand_spark(periods=6):
     """
     Dự báo demand sử dụng Spark SQL với thuật toán đơn giản
@@ -49,20 +68,8 @@ def forecast_demand_spark(periods=6):
             from services.forecast import forecast_demand
             return forecast_demand(periods)
 
-        # Tiền xử lý dữ liệu với Spark
-        from services.preprocess import UPLOAD_FOLDER
-        
-        # Đọc các file CSV
-        orders = spark.read.csv(os.path.join(UPLOAD_FOLDER, "df_Orders.csv"), 
-                              header=True, inferSchema=True)
-        
-        # Xử lý timestamps
-        orders = orders.withColumn("order_purchase_timestamp", 
-                                to_date(col("order_purchase_timestamp")))
-        
-        # Tính toán số lượng đơn theo tháng
-        orders = orders.withColumn("order_month", 
-                                date_format(col("order_purchase_timestamp"), "yyyy-MM"))
+        # Chỉ đọc cột order_month (bỏ qua phân vùng không có tháng) từ Parquet đã stage
+        orders = read_staged(spark, "orders", ["order_month"], col("order_month").isNotNull())
         
         # Group by month và đếm số lượng đơn hàng
         monthly_orders = orders.groupBy("order_month").count().orderBy("order_month")
@@ -71,14 +78,11 @@ def forecast_demand_spark(periods=6):
         monthly_orders_pd = monthly_orders.toPandas()
         monthly_orders_pd["order_month"] = pd.to_datetime(monthly_orders_pd["order_month"])
         
-        # Đóng Spark session
-        spark.stop()
-        
         # Sử dụng phương pháp đơn giản để dự báo
         monthly_series = monthly_orders_pd.set_index("order_month")["count"]
         
         # Đảm bảo dữ liệu đầy đủ các tháng
-        monthly_series = monthly_series.resample('MS').asfreq().fillna(method='ffill').fillna(0)
+        monthly_series = monthly_series.resample('MS').asfreq().ffill().fillna(0)
         
         # Dự báo đơn giản bằng cách sử dụng trung bình động
         last_values = monthly_series.tail(3)
@@ -105,7 +109,8 @@ def forecast_demand_spark(periods=6):
         forecast_df = pd.DataFrame({
             "month": [d.strftime("%Y-%m") for d in future_dates],
             "xgboost": forecast_xgb,
-            "arima": forecast_arima,
+            "stat": forecast_arima,
+            "arima": forecast_arima,  # deprecated alias của "stat"
         })
         
         # Tạo dữ liệu cho biểu đồ
@@ -113,7 +118,7 @@ def forecast_demand_spark(periods=6):
                      for date, val in monthly_series.items()]
         chart_data += [{"month": date.strftime("%Y-%m"), "orders": val, "type": "XGBoost"} 
                       for date, val in zip(future_dates, forecast_xgb)]
-        chart_data += [{"month": date.strftime("%Y-%m"), "orders": val, "type": "ARIMA"} 
+        chart_data += [{"month": date.strftime("%Y-%m"), "orders": val, "type": "Stat", "model": "ARIMA"} 
                       for date, val in zip(future_dates, forecast_arima)]
         
         # Vẽ biểu đồ
@@ -134,6 +139,7 @@ def forecast_demand_spark(periods=6):
             "forecast_table": forecast_df.to_dict(orient="records"),
             "mae_rmse_comparison": {
                 "xgboost": {"mae": 0, "rmse": 0},  # Không tính metrics thực tế
+                "stat": {"mae": 0, "rmse": 0},
                 "arima": {"mae": 0, "rmse": 0}
             }
         })
@@ -142,11 +148,13 @@ def forecast_demand_spark(periods=6):
         return {
             "status": "success",
             "category": "Tổng thể",
+            "stat_model": "ARIMA",
             "forecast_table": forecast_df.to_dict(orient="records"),
             "chart_data": chart_data,
             "chart": fig_to_base64(fig),
             "mae_rmse_comparison": {
                 "xgboost": {"mae": 0, "rmse": 0},
+                "stat": {"mae": 0, "rmse": 0},
                 "arima": {"mae": 0, "rmse": 0}
             }
         }
@@ -157,6 +165,115 @@ def forecast_demand_spark(periods=6):
         from services.forecast import forecast_demand
         return forecast_demand(periods)
 
+def _simple_forecast(monthly_series, periods=6):
+    """
+    Dự báo đơn giản cho một chuỗi theo tháng: tăng trưởng trung bình 3 tháng gần nhất (XGBoost)
+    và giá trị trung bình (ARIMA)
+    """
+    # Đảm bảo dữ liệu đầy đủ các tháng
+    monthly_series = monthly_series.resample('MS').asfreq().ffill().fillna(0)
+    
+    # Dự báo đơn giản bằng cách sử dụng trung bình động
+    last_values = monthly_series.tail(3)
+    avg_growth = last_values.pct_change().mean()
+    
+    if pd.isna(avg_growth) or abs(avg_growth) > 0.5:  # Nếu tăng trưởng bất thường
+        avg_growth = 0.05  # Giả định tăng trưởng 5%
+        
+    # Dự báo
+    last_value = monthly_series.iloc[-1]
+    forecast_xgb = []
+    
+    for i in range(1, periods + 1):
+        next_value = last_value * (1 + avg_growth)
+        forecast_xgb.append(int(max(0, next_value)))
+        last_value = next_value
+        
+    # Dự báo ARIMA đơn giản (sử dụng trung bình)
+    forecast_arima = [int(monthly_series.mean()) for _ in range(periods)]
+    
+    last_date = monthly_series.index[-1]
+    future_dates = [last_date + relativedelta(months=i) for i in range(1, periods + 1)]
+    return monthly_series, future_dates, forecast_xgb, forecast_arima
+
+def _category_forecast_result(category_name, monthly_series, future_dates, forecast_xgb, forecast_arima):
+    """
+    Tạo kết quả dự báo của một danh mục (bảng dự báo, dữ liệu biểu đồ, tồn kho) và lưu vào MongoDB
+    """
+    forecast_df = pd.DataFrame({
+        "month": [d.strftime("%Y-%m") for d in future_dates],
+        "xgboost": forecast_xgb,
+        "stat": forecast_arima,
+        "arima": forecast_arima,  # deprecated alias của "stat"
+    })
+    
+    # Tạo dữ liệu cho biểu đồ
+    chart_data = [{"month": date.strftime("%Y-%m"), "orders": int(val), "type": "Thực tế", "category": category_name} 
+                 for date, val in monthly_series.items()]
+    chart_data += [{"month": date.strftime("%Y-%m"), "orders": val, "type": "XGBoost", "category": category_name} 
+                  for date, val in zip(future_dates, forecast_xgb)]
+    chart_data += [{"month": date.strftime("%Y-%m"), "orders": val, "type": "Stat", "model": "ARIMA", "category": category_name} 
+                  for date, val in zip(future_dates, forecast_arima)]
+    
+    # Tính optimal inventory và holding cost
+    optimal_inventory = int(np.max(forecast_xgb)) if forecast_xgb else 0
+    unit_holding_cost = brl_to_vnd(5)
+    holding_cost = optimal_inventory * unit_holding_cost
+    
+    # Lưu kết quả vào MongoDB
+    save_forecast_result({
+        "category": category_name,
+        "model": "Spark (simplified)",
+        "forecast_table": forecast_df.to_dict(orient="records"),
+        "optimal_inventory": optimal_inventory,
+        "holding_cost": holding_cost,
+        "mae_rmse_comparison": {
+            "xgboost": {"mae": 0, "rmse": 0},
+            "stat": {"mae": 0, "rmse": 0},
+            "arima": {"mae": 0, "rmse": 0}
+        }
+    })
+    
+    # Trả về kết quả
+    return {
+        "status": "success",
+        "category": category_name,
+        "stat_model": "ARIMA",
+        "forecast_table": forecast_df.to_dict(orient="records"),
+        "chart_data": chart_data,
+        "optimal_inventory": optimal_inventory,
+        "holding_cost": holding_cost,
+        "mae_rmse_comparison": {
+            "xgboost": {"mae": 0, "rmse": 0},
+            "stat": {"mae": 0, "rmse": 0},
+            "arima": {"mae": 0, "rmse": 0}
+        }
+    }
+
+# Schema đầu ra của grouped-map UDF: mỗi dòng là một điểm (thực tế hoặc dự báo) của một danh mục
+CATEGORY_FORECAST_SCHEMA = "product_category_name string, month string, type string, orders long"
+
+# Danh mục có ít hơn số dòng này thì không dự báo bằng Spark (giống forecast_demand_by_category_spark)
+MIN_CATEGORY_ROWS = 10
+
+def _forecast_category_group(pdf, periods=6):
+    """
+    Grouped-map pandas UDF: nhận chuỗi (order_month, count) của một danh mục, trả về
+    các điểm thực tế + dự báo theo CATEGORY_FORECAST_SCHEMA
+    """
+    columns = ["product_category_name", "month", "type", "orders"]
+    category_name = pdf["product_category_name"].iloc[0]
+    if pdf["count"].sum() < MIN_CATEGORY_ROWS:
+        return pd.DataFrame(columns=columns)
+
+    monthly_series = pd.Series(pdf["count"].values, index=pd.to_datetime(pdf["order_month"])).sort_index()
+    monthly_series, future_dates, forecast_xgb, forecast_arima = _simple_forecast(monthly_series, periods)
+
+    rows = [(category_name, d.strftime("%Y-%m"), "Thực tế", int(v)) for d, v in monthly_series.items()]
+    rows += [(category_name, d.strftime("%Y-%m"), "XGBoost", int(v)) for d, v in zip(future_dates, forecast_xgb)]
+    rows += [(category_name, d.strftime("%Y-%m"), "ARIMA", int(v)) for d, v in zip(future_dates, forecast_arima)]
+    return pd.DataFrame(rows, columns=columns)
+
 def forecast_demand_by_category_spark(category_name, periods=6):
     """
     Dự báo nhu cầu theo danh mục sử dụng Spark SQL đơn giản
@@ -169,30 +286,11 @@ def forecast_demand_by_category_spark(category_name, periods=6):
             from services.forecast import forecast_demand_by_category
             return forecast_demand_by_category(category_name, periods)
 
-        # Tiền xử lý dữ liệu với Spark
-        from services.preprocess import UPLOAD_FOLDER
-        
-        # Đọc các file CSV
-        orders = spark.read.csv(os.path.join(UPLOAD_FOLDER, "df_Orders.csv"), 
-                              header=True, inferSchema=True)
-        order_items = spark.read.csv(os.path.join(UPLOAD_FOLDER, "df_OrderItems.csv"), 
-                                   header=True, inferSchema=True)
-        products = spark.read.csv(os.path.join(UPLOAD_FOLDER, "df_Products.csv"), 
-                                header=True, inferSchema=True)
-        
-        # Xử lý timestamps
-        orders = orders.withColumn("order_purchase_timestamp", 
-                                to_date(col("order_purchase_timestamp")))
-        
-        # Tính toán số lượng đơn theo tháng
-        orders = orders.withColumn("order_month", 
-                                date_format(col("order_purchase_timestamp"), "yyyy-MM"))
-        
-        # Join để lấy thông tin sản phẩm
-        df = order_items.join(orders, "order_id", "inner").join(products, "product_id", "left")
-        
-        # Lọc theo danh mục
-        df_cat = df.filter(col("product_category_name") == category_name)
+        # Lọc theo danh mục ngay khi đọc Parquet, chỉ lấy cột order_month
+        df_cat = read_staged(
+            spark, "merged", ["order_month"],
+            (col("product_category_name") == category_name) & col("order_month").isNotNull(),
+        )
         
         # Kiểm tra xem có đủ dữ liệu không
         if df_cat.count() < 10:
@@ -206,83 +304,10 @@ def forecast_demand_by_category_spark(category_name, periods=6):
         # Chuyển sang Pandas
         monthly_orders_pd = monthly_orders.toPandas()
         monthly_orders_pd["order_month"] = pd.to_datetime(monthly_orders_pd["order_month"])
-        
-        # Đóng Spark session
-        spark.stop()
-        
-        # Sử dụng phương pháp đơn giản để dự báo
         monthly_series = monthly_orders_pd.set_index("order_month")["count"]
-        
-        # Đảm bảo dữ liệu đầy đủ các tháng
-        monthly_series = monthly_series.resample('MS').asfreq().fillna(method='ffill').fillna(0)
-        
-        # Dự báo đơn giản bằng cách sử dụng trung bình động
-        last_values = monthly_series.tail(3)
-        avg_growth = last_values.pct_change().mean()
-        
-        if pd.isna(avg_growth) or abs(avg_growth) > 0.5:  # Nếu tăng trưởng bất thường
-            avg_growth = 0.05  # Giả định tăng trưởng 5%
-            
-        # Dự báo
-        last_value = monthly_series.iloc[-1]
-        forecast_xgb = []
-        
-        for i in range(1, periods + 1):
-            next_value = last_value * (1 + avg_growth)
-            forecast_xgb.append(int(max(0, next_value)))
-            last_value = next_value
-            
-        # Dự báo ARIMA đơn giản (sử dụng trung bình)
-        forecast_arima = [int(monthly_series.mean()) for _ in range(periods)]
-        
-        # Chuẩn bị dữ liệu kết quả
-        last_date = monthly_series.index[-1]
-        future_dates = [last_date + relativedelta(months=i) for i in range(1, periods + 1)]
-        forecast_df = pd.DataFrame({
-            "month": [d.strftime("%Y-%m") for d in future_dates],
-            "xgboost": forecast_xgb,
-            "arima": forecast_arima,
-        })
-        
-        # Tạo dữ liệu cho biểu đồ
-        chart_data = [{"month": date.strftime("%Y-%m"), "orders": int(val), "type": "Thực tế", "category": category_name} 
-                     for date, val in monthly_series.items()]
-        chart_data += [{"month": date.strftime("%Y-%m"), "orders": val, "type": "XGBoost", "category": category_name} 
-                      for date, val in zip(future_dates, forecast_xgb)]
-        chart_data += [{"month": date.strftime("%Y-%m"), "orders": val, "type": "ARIMA", "category": category_name} 
-                      for date, val in zip(future_dates, forecast_arima)]
-        
-        # Tính optimal inventory và holding cost
-        optimal_inventory = int(np.max(forecast_xgb)) if forecast_xgb else 0
-        unit_holding_cost = brl_to_vnd(5)
-        holding_cost = optimal_inventory * unit_holding_cost
-        
-        # Lưu kết quả vào MongoDB
-        save_forecast_result({
-            "category": category_name,
-            "model": "Spark (simplified)",
-            "forecast_table": forecast_df.to_dict(orient="records"),
-            "optimal_inventory": optimal_inventory,
-            "holding_cost": holding_cost,
-            "mae_rmse_comparison": {
-                "xgboost": {"mae": 0, "rmse": 0},
-                "arima": {"mae": 0, "rmse": 0}
-            }
-        })
-        
-        # Trả về kết quả
-        return {
-            "status": "success",
-            "category": category_name,
-            "forecast_table": forecast_df.to_dict(orient="records"),
-            "chart_data": chart_data,
-            "optimal_inventory": optimal_inventory,
-            "holding_cost": holding_cost,
-            "mae_rmse_comparison": {
-                "xgboost": {"mae": 0, "rmse": 0},
-                "arima": {"mae": 0, "rmse": 0}
-            }
-        }
+
+        monthly_series, future_dates, forecast_xgb, forecast_arima = _simple_forecast(monthly_series, periods)
+        return _category_forecast_result(category_name, monthly_series, future_dates, forecast_xgb, forecast_arima)
     except Exception as e:
         print(f"❌ Error in forecast_demand_by_category_spark({category_name}): {str(e)}")
         print(traceback.format_exc())
@@ -290,9 +315,10 @@ def forecast_demand_by_category_spark(category_name, periods=6):
         from services.forecast import forecast_demand_by_category
         return forecast_demand_by_category(category_name, periods)
 
-def forecast_all_categories_spark(limit=15):
+def forecast_all_categories_spark(limit=15, periods=6):
     """
-    Dự báo cho nhiều danh mục đồng thời sử dụng Spark SQL đơn giản
+    Dự báo cho nhiều danh mục trong một Spark job: dựng bảng danh mục × tháng một lần,
+    rồi chạy mô hình cho từng chuỗi song song bằng groupBy().applyInPandas
     """
     print(f"🚀 Starting Spark forecast for all categories (limit: {limit})...")
     try:
@@ -302,30 +328,48 @@ def forecast_all_categories_spark(limit=15):
             # Fallback to pandas
             return []
             
-        # Đọc các file CSV
-        from services.preprocess import UPLOAD_FOLDER
-        products = spark.read.csv(os.path.join(UPLOAD_FOLDER, "df_Products.csv"), 
-                                header=True, inferSchema=True)
-        
-        # Lấy danh sách các danh mục
-        categories = products.select("product_category_name").distinct().filter(col("product_category_name").isNotNull())
+        # Lấy danh sách các danh mục (chỉ đọc cột product_category_name)
+        categories = read_staged(
+            spark, "merged", ["product_category_name"], col("product_category_name").isNotNull()
+        ).distinct()
         categories_list = [row["product_category_name"] for row in categories.take(limit)]
         
-        # Đóng spark session
-        spark.stop()
+        # Bảng nhu cầu danh mục × tháng, dự báo tất cả các chuỗi trong một job
+        panel = read_staged(
+            spark, "merged", ["product_category_name", "order_month"],
+            col("product_category_name").isin(categories_list) & col("order_month").isNotNull(),
+        ).groupBy("product_category_name", "order_month").count()
+        points = panel.groupBy("product_category_name") \
+            .applyInPandas(lambda pdf: _forecast_category_group(pdf, periods), schema=CATEGORY_FORECAST_SCHEMA) \
+            .toPandas()
         
-        # Xử lý từng danh mục
+        # Ghép kết quả theo danh mục trên driver
         all_forecasts = []
+        grouped = dict(tuple(points.groupby("product_category_name", sort=False)))
         for category in categories_list:
             try:
-                result = forecast_demand_by_category_spark(category)
+                if category not in grouped:
+                    print(f"⚠️ Không đủ dữ liệu cho {category}, chuyển sang dữ liệu mẫu")
+                    from services.forecast import forecast_demand_by_category
+                    result = forecast_demand_by_category(category, periods)
+                else:
+                    category_points = grouped[category]
+                    history = category_points[category_points["type"] == "Thực tế"]
+                    xgb_points = category_points[category_points["type"] == "XGBoost"]
+                    arima_points = category_points[category_points["type"] == "ARIMA"]
+                    monthly_series = pd.Series(history["orders"].values, index=pd.to_datetime(history["month"]))
+                    future_dates = list(pd.to_datetime(xgb_points["month"]))
+                    result = _category_forecast_result(
+                        category, monthly_series, future_dates,
+                        xgb_points["orders"].astype(int).tolist(), arima_points["orders"].astype(int).tolist(),
+                    )
                 if result.get("status") == "success":
                     all_forecasts.append(result)
             except Exception as e:
                 print(f"❌ Error in Spark forecast for category {category}: {str(e)}")
                 
         # Thêm dự báo tổng thể
-        overall = forecast_demand_spark()
+        overall = forecast_demand_spark(periods)
         if overall.get("status") == "success":
             all_forecasts.insert(0, overall)
             
@@ -339,82 +383,162 @@ def forecast_all_categories_spark(limit=15):
 
 # Các hàm khác với logic đơn giản hơn
 def cluster_suppliers_spark(n_clusters=3):
-    """Phiên bản đơn giản hóa của phân cụm nhà cung cấp"""
+    """
+    Phân cụm nhà cung cấp bằng Spark: đặc trưng theo seller tính bằng Spark SQL,
+    chuẩn hóa bằng StandardScaler và phân cụm bằng KMeans của Spark ML.
+    Trả về None nếu lỗi để services.reorder chuyển sang pandas.
+    """
     try:
-        from services.reorder import cluster_suppliers
-        return cluster_suppliers(n_clusters)
+        from pyspark.ml import Pipeline
+        from pyspark.ml.clustering import KMeans
+        from pyspark.ml.feature import StandardScaler, VectorAssembler
+        from services.reorder import describe_cluster
+
+        merged = read_staged(get_spark(), "merged", ["seller_id", "order_id", "shipping_duration", "shipping_charges"])
+        rate = get_exchange_rate("BRL", "VND")
+
+        # Đặc trưng theo seller (avg_freight đổi sang VND, làm tròn như brl_to_vnd)
+        suppliers = merged.groupBy("seller_id").agg(
+            countDistinct("order_id").alias("total_orders"),
+            avg("shipping_duration").alias("avg_shipping_days"),
+            avg("shipping_charges").alias("avg_freight"),
+        )
+        suppliers = suppliers \
+            .withColumn("avg_freight", bround(col("avg_freight") * lit(rate), 0)) \
+            .fillna(0, subset=["total_orders", "avg_shipping_days", "avg_freight"]) \
+            .withColumn("avg_shipping_days", col("avg_shipping_days").cast("double")) \
+            .withColumn("avg_freight", col("avg_freight").cast("double")) \
+            .withColumn("total_orders", col("total_orders").cast("int"))
+
+        # Filter suppliers with at least 5 orders
+        filtered = suppliers.filter(col("total_orders") >= 5).cache()
+        n_suppliers = filtered.count()
+        if n_suppliers < n_clusters:
+            print(f"⚠️ Not enough suppliers to form {n_clusters} clusters. Only {n_suppliers} sellers meet criteria.")
+            n_clusters = max(2, n_suppliers // 2)
+        print(f"ℹ️ Clustering {n_suppliers} suppliers into {n_clusters} groups with Spark ML")
+
+        pipeline = Pipeline(stages=[
+            VectorAssembler(inputCols=["total_orders", "avg_shipping_days", "avg_freight"], outputCol="features"),
+            StandardScaler(inputCol="features", outputCol="scaled_features", withMean=True, withStd=True),
+            KMeans(featuresCol="scaled_features", predictionCol="cluster", k=n_clusters, seed=42),
+        ])
+        clustered = pipeline.fit(filtered).transform(filtered) \
+            .select("seller_id", "total_orders", "avg_shipping_days", "avg_freight", "cluster")
+
+        # Mô tả cụm từ bảng thống kê nhỏ (k dòng) trên driver
+        cluster_stats = clustered.groupBy("cluster").agg(
+            avg("avg_shipping_days").alias("avg_shipping_days"),
+            avg("avg_freight").alias("avg_freight"),
+        ).collect()
+        descriptions = {
+            row["cluster"]: describe_cluster(row["avg_shipping_days"], row["avg_freight"])
+            for row in cluster_stats
+        }
+
+        result = clustered.orderBy("seller_id").toPandas()
+        filtered.unpersist()
+        result["cluster"] = result["cluster"].astype(int)
+        result["cluster_description"] = result["cluster"].map(descriptions)
+
+        clusters = result.to_dict(orient="records")
+        print(f"✅ Spark clustering completed: {len(clusters)} suppliers")
+        return clusters
     except Exception as e:
         print(f"❌ Error in cluster_suppliers_spark: {str(e)}")
-        return []
+        print(traceback.format_exc())
+        return None
 
-def analyze_bottlenecks_spark(threshold_days=20):
-    """Phiên bản đơn giản hóa của phân tích bottlenecks"""
+def seller_duration_counts_spark():
+    """
+    Histogram thời gian giao hàng theo seller (seller_id, shipping_duration, n; gồm cả NULL)
+    và danh mục phổ biến nhất của mỗi seller (window function), chỉ kết quả gộp về driver.
+    Trả về None nếu lỗi để services.reorder chuyển sang pandas.
+    """
     try:
-        from services.reorder import analyze_bottlenecks
-        return analyze_bottlenecks(threshold_days)
+        from pyspark.sql.window import Window
+
+        spark = get_spark()
+        counts = read_staged(spark, "merged", ["seller_id", "shipping_duration"], col("seller_id").isNotNull()) \
+            .groupBy("seller_id", "shipping_duration") \
+            .agg(count(lit(1)).alias("n")) \
+            .toPandas()
+
+        # Danh mục xuất hiện nhiều nhất của mỗi seller (hòa thì lấy theo tên, giống mode() của pandas)
+        category_counts = read_staged(
+            spark, "merged", ["seller_id", "product_category_name"], col("product_category_name").isNotNull()
+        ).groupBy("seller_id", "product_category_name").count()
+        ranking = Window.partitionBy("seller_id").orderBy(col("count").desc(), col("product_category_name"))
+        top_categories = category_counts \
+            .withColumn("rank", row_number().over(ranking)) \
+            .filter(col("rank") == 1) \
+            .select("seller_id", col("product_category_name").alias("top_category")) \
+            .toPandas()
+        return counts, top_categories
     except Exception as e:
-        print(f"❌ Error in analyze_bottlenecks_spark: {str(e)}")
-        return []
+        print(f"❌ Error in seller_duration_counts_spark: {str(e)}")
+        print(traceback.format_exc())
+        return None
 
 def calculate_reorder_strategy_spark():
-    """Phiên bản đơn giản hóa của calculate_reorder_strategy"""
+    """
+    Chiến lược tồn kho tính bằng Spark: lead time theo danh mục từ Parquet đã stage,
+    trung bình / độ lệch chuẩn nhu cầu từ dự báo, rồi safety stock, reorder point và
+    holding cost trong cùng một job. Trả về None nếu lỗi để services.reorder chuyển sang pandas.
+    """
     try:
-        from services.reorder import calculate_reorder_strategy
-        return calculate_reorder_strategy()
-    except Exception as e:
-        print(f"❌ Error in calculate_reorder_strategy_spark: {str(e)}")
-        return []
+        from services.reorder import load_category_forecasts, REORDER_Z_SCORE, HOLDING_COST_PER_UNIT_PER_MONTH_BRL
 
-# Các hàm helper cho charts
-def get_top_reorder_points_spark(limit=10):
-    result = calculate_reorder_strategy_spark()
-    if not result:
-        return []
-    top_reorder = sorted(result, key=lambda x: x['reorder_point'], reverse=True)[:limit]
-    return [{"category": item["category"], "value": item["reorder_point"]} for item in top_reorder]
+        forecast_map = load_category_forecasts()
+        if not forecast_map:
+            return []
 
-def get_top_safety_stock_spark(limit=10):
-    result = calculate_reorder_strategy_spark()
-    if not result:
-        return []
-    top_ss = sorted(result, key=lambda x: x['safety_stock'], reverse=True)[:limit]
-    return [{"category": item["category"], "value": item["safety_stock"]} for item in top_ss]
+        spark = get_spark()
 
-def get_top_lead_time_spark(limit=10):
-    result = calculate_reorder_strategy_spark()
-    if not result:
-        return []
-    top_lt = sorted(result, key=lambda x: x['avg_lead_time_days'], reverse=True)[:limit]
-    return [{"category": item["category"], "value": round(item["avg_lead_time_days"], 1)} for item in top_lt]
+        # Nhu cầu dự báo (XGBoost) theo danh mục
+        demand_rows = [
+            (category, int(row["xgboost"]))
+            for category, forecast in forecast_map.items()
+            for row in forecast["forecast_table"]
+        ]
+        demand = spark.createDataFrame(demand_rows, "category string, predicted_orders long") \
+            .groupBy("category") \
+            .agg(avg("predicted_orders").alias("avg_demand"), stddev_samp("predicted_orders").alias("demand_std"))
 
-def get_top_optimal_inventory_spark(limit=10):
-    result = calculate_reorder_strategy_spark()
-    if not result:
-        return []
-    top_inventory = sorted(result, key=lambda x: x['optimal_inventory'], reverse=True)[:limit]
-    return [{"category": item["category"], "value": item["optimal_inventory"]} for item in top_inventory]
+        lead_times = read_staged(
+            spark, "merged", ["product_category_name", "shipping_duration"],
+            col("product_category_name").isin(list(forecast_map)),
+        ).groupBy(col("product_category_name").alias("category")) \
+            .agg(avg("shipping_duration").alias("lead_time"))
 
-def get_top_holding_cost_spark(limit=10):
-    result = calculate_reorder_strategy_spark()
-    if not result:
-        return []
-    top_cost = sorted(result, key=lambda x: x['holding_cost'], reverse=True)[:limit]
-    return [{"category": item["category"], "value": item["holding_cost"]} for item in top_cost]
-
-def get_top_potential_saving_spark(limit=10):
-    # Fallback to non-Spark version
-    from services.reorder import generate_optimization_recommendations, calculate_reorder_strategy
-    strategy = calculate_reorder_strategy()
-    recommendations_df = generate_optimization_recommendations(strategy, return_df=True)
-    
-    if recommendations_df.empty or "potential_saving" not in recommendations_df.columns:
-        return []
-        
-    top_save = recommendations_df.sort_values("potential_saving", ascending=False).head(limit)
-    return [{"category": row["category"], "value": row["potential_saving"]} for _, row in top_save.iterrows()]
-
-def generate_optimization_recommendations_spark():
-    # Fallback to non-Spark version
-    from services.reorder import generate_optimization_recommendations, calculate_reorder_strategy
-    strategy = calculate_reorder_strategy()
-    return generate_optimization_recommendations(strategy)
\ No newline at end of file
+        holding_cost_per_unit_per_month = brl_to_vnd(HOLDING_COST_PER_UNIT_PER_MONTH_BRL)
+        lead_time_months = bround(col("lead_time") / 30, 2)
+        safety_stock = when(
+            col("lead_time") > 0,
+            (lit(REORDER_Z_SCORE) * col("demand_std") * sqrt(col("lead_time"))).cast("long"),
+        ).otherwise(lit(0).cast("long"))
+
+        strategy = lead_times.join(demand, "category") \
+            .filter(col("lead_time").isNotNull() & col("demand_std").isNotNull()) \
+            .withColumn("safety_stock", safety_stock) \
+            .withColumn("reorder_point", (col("avg_demand") * col("lead_time") + col("safety_stock")).cast("long")) \
+            .withColumn("optimal_inventory", col("reorder_point") + col("safety_stock")) \
+            .withColumn("holding_cost",
+                        (col("optimal_inventory") * lit(holding_cost_per_unit_per_month) * lead_time_months).cast("long")) \
+            .select(
+                "category",
+                bround(col("lead_time"), 2).alias("avg_lead_time_days"),
+                col("avg_demand").cast("long").alias("forecast_avg_demand"),
+                col("demand_std").cast("long").alias("demand_std"),
+                "safety_stock", "reorder_point", "optimal_inventory", "holding_cost",
+            ) \
+            .orderBy("category") \
+            .toPandas()
+
+        result = strategy.to_dict(orient="records")
+        print(f"✅ Spark reorder strategy computed for {len(result)} categories")
+        return result
+    except Exception as e:
+        print(f"❌ Error in calculate_reorder_strategy_spark: {str(e)}")
+        print(traceback.format_exc())
+        return None
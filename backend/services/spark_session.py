@@ -0,0 +1,196 @@
+# services/spark_session.py
+import atexit
+import csv
+import os
+import shutil
+import threading
+from services import preprocess
+
+# SparkSession dùng chung cho toàn process (khởi tạo một lần, dừng khi tắt server)
+# cùng thư mục Parquet đã stage của phiên bản dữ liệu hiện tại
+_spark_lock = threading.Lock()
+_spark_state = {"spark": None, "version": None, "staged": None}
+
+
+def get_spark():
+    """
+    Return the process-wide SparkSession, creating it on first use
+    """
+    from pyspark.sql import SparkSession
+
+    with _spark_lock:
+        if _spark_state["spark"] is None:
+            print("⚡ Starting shared Spark session...")
+            _spark_state["spark"] = SparkSession.builder \
+                .appName("SupplyChainAnalytics") \
+                .config("spark.executor.memory", "1g") \
+                .config("spark.driver.memory", "2g") \
+                .config("spark.driver.maxResultSize", "1g") \
+                .config("spark.python.worker.memory", "1g") \
+                .config("spark.sql.execution.arrow.pyspark.enabled", "true") \
+                .config("spark.sql.execution.arrow.maxRecordsPerBatch", "10000") \
+                .config("spark.sql.sources.partitionColumnTypeInference.enabled", "false") \
+                .master("local[*]") \
+                .getOrCreate()
+        return _spark_state["spark"]
+
+
+# Kiểu dữ liệu khai báo cho các cột của 4 bảng Olist (DDL của Spark), thay cho inferSchema.
+# Cột không có trong bảng này được đọc dưới dạng STRING.
+SPARK_COLUMN_TYPES = {
+    "customer_id": "STRING",
+    "customer_zip_code_prefix": "INT",
+    "customer_city": "STRING",
+    "customer_state": "STRING",
+    "order_id": "STRING",
+    "order_status": "STRING",
+    "order_purchase_timestamp": "TIMESTAMP",
+    "order_approved_at": "TIMESTAMP",
+    "order_delivered_timestamp": "TIMESTAMP",
+    "order_estimated_delivery_date": "TIMESTAMP",
+    "product_id": "STRING",
+    "seller_id": "STRING",
+    "price": "DOUBLE",
+    "shipping_charges": "DOUBLE",
+    "freight_value": "DOUBLE",
+    "product_category_name": "STRING",
+    "product_weight_g": "FLOAT",
+    "product_length_cm": "FLOAT",
+    "product_height_cm": "FLOAT",
+    "product_width_cm": "FLOAT",
+}
+
+# Bản Parquet của dữ liệu upload (phân vùng theo order_month), tạo một lần cho mỗi fingerprint
+SPARK_STAGING_DIRNAME = ".parquet"
+STAGING_MARKER = "_STAGED"
+
+
+def spark_schema(filename):
+    """
+    DDL schema for an upload CSV, in the column order of its header
+    """
+    with open(os.path.join(preprocess.UPLOAD_FOLDER, filename), encoding="utf-8", newline="") as f:
+        header = next(csv.reader(f), [])
+    return ", ".join(f"`{name}` {SPARK_COLUMN_TYPES.get(name, 'STRING')}" for name in header)
+
+
+def _read_csv(spark, filename):
+    return spark.read.csv(
+        os.path.join(preprocess.UPLOAD_FOLDER, filename),
+        header=True,
+        schema=spark_schema(filename),
+        timestampFormat="yyyy-MM-dd HH:mm:ss",
+    )
+
+
+def _build_frames(spark):
+    """
+    Build the orders and merged (orders × items × products × customers) DataFrames from the
+    CSVs with the same feature engineering as preprocess_data_pandas
+    """
+    from pyspark.sql.functions import col, datediff, date_format, to_date, lit
+    from utils.currency import get_exchange_rate
+
+    customers = _read_csv(spark, "df_Customers.csv")
+    orders = _read_csv(spark, "df_Orders.csv")
+    order_items = _read_csv(spark, "df_OrderItems.csv")
+    products = _read_csv(spark, "df_Products.csv")
+
+    # Convert timestamp data types
+    for column in ["order_purchase_timestamp", "order_delivered_timestamp", "order_estimated_delivery_date"]:
+        orders = orders.withColumn(column, to_date(col(column)))
+    orders = orders.withColumn("order_month", date_format(col("order_purchase_timestamp"), "yyyy-MM"))
+
+    # Currency conversion (e.g., price -> VND)
+    if "price" in order_items.columns:
+        order_items = order_items.withColumn("price", col("price") * lit(get_exchange_rate("BRL", "VND")))
+    if "freight_value" in order_items.columns and "shipping_charges" not in order_items.columns:
+        order_items = order_items.withColumnRenamed("freight_value", "shipping_charges")
+
+    merged = order_items.join(orders, "order_id", "inner") \
+        .join(products, "product_id", "left") \
+        .join(customers, "customer_id", "left")
+    merged = merged.withColumn("shipping_duration",
+                               datediff(col("order_delivered_timestamp"), col("order_purchase_timestamp")))
+    merged = merged.withColumn("delivery_delay",
+                               datediff(col("order_delivered_timestamp"), col("order_estimated_delivery_date")))
+
+    return {"orders": orders, "merged": merged}
+
+
+def staging_dir(fingerprint):
+    return os.path.join(preprocess.UPLOAD_FOLDER, SPARK_STAGING_DIRNAME, fingerprint)
+
+
+def stage_parquet(spark):
+    """
+    Convert the uploads into Parquet partitioned by order_month, once per source fingerprint.
+    Returns the staging directory; staging of older data is removed.
+    """
+    fingerprint = preprocess.source_fingerprint()
+    target = staging_dir(fingerprint)
+    if os.path.exists(os.path.join(target, STAGING_MARKER)):
+        return target
+
+    print("📦 Staging uploads as partitioned Parquet for Spark...")
+    shutil.rmtree(target, ignore_errors=True)
+    for name, frame in _build_frames(spark).items():
+        frame.write.mode("overwrite").partitionBy("order_month").parquet(os.path.join(target, name))
+    open(os.path.join(target, STAGING_MARKER), "w").close()
+
+    root = os.path.dirname(target)
+    for name in os.listdir(root):
+        if name != fingerprint:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    return target
+
+
+def staged_dir(spark):
+    """
+    Staging directory of the current dataset version, staged on first use
+    """
+    version = preprocess.dataset_version()
+    with _spark_lock:
+        if _spark_state["staged"] is None or _spark_state["version"] != version:
+            _spark_state["staged"] = stage_parquet(spark)
+            _spark_state["version"] = version
+        return _spark_state["staged"]
+
+
+def read_staged(spark, name, columns=None, where=None):
+    """
+    Read a staged table ("orders" or "merged") with only the `columns` and rows (`where`)
+    a job needs: Spark reads just those Parquet columns, pushes the filter down to the
+    row groups and skips order_month partitions ruled out by the predicate
+    """
+    frame = spark.read.parquet(os.path.join(staged_dir(spark), name))
+    if where is not None:
+        frame = frame.where(where)
+    if columns:
+        frame = frame.select(*columns)
+    return frame
+
+
+def release_spark_staging():
+    """
+    Forget the staged directory (dataset changed); the session itself stays up
+    """
+    with _spark_lock:
+        _spark_state["staged"] = None
+        _spark_state["version"] = None
+
+
+def stop_spark():
+    """
+    Stop the shared session (server shutdown)
+    """
+    with _spark_lock:
+        _spark_state["staged"] = None
+        spark = _spark_state["spark"]
+        _spark_state["spark"] = None
+    if spark is not None:
+        print("🛑 Stopping shared Spark session")
+        spark.stop()
+
+
+atexit.register(stop_spark)
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+from services.horizon import HORIZON_FEATURES, recursive_forecast
+
+
+class RecordingModel:
+    """predict giả: trả về giá trị cố định và ghi lại ma trận feature của từng bước"""
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = []
+
+    def predict(self, features):
+        self.calls.append(features.copy())
+        return np.full(len(features), self.value)
+
+
+def column(features, name):
+    return features[:, HORIZON_FEATURES.index(name)]
+
+
+def training_features(values, months):
+    """Feature của tháng kế tiếp tính bằng pandas, giống df_features lúc huấn luyện"""
+    y = pd.Series(list(values) + [np.nan], index=pd.date_range(months[0], periods=len(values) + 1, freq="MS"))
+    return {
+        "lag_1": y.shift(1).iloc[-1], "lag_2": y.shift(2).iloc[-1], "lag_3": y.shift(3).iloc[-1],
+        "rolling_mean_3": y.rolling(3).mean().shift(1).iloc[-1],
+        "rolling_std_3": y.rolling(3).std().shift(1).iloc[-1],
+    }
+
+
+def test_first_step_matches_training_features():
+    values = np.array([120.0, 80.0, 150.0, 95.0, 130.0])
+    months = pd.date_range("2018-01-01", periods=len(values), freq="MS")
+    model = RecordingModel(100)
+    recursive_forecast(model.predict, [values], [months[-1]], [len(values)], 1)
+
+    expected = training_features(values, months)
+    for name, value in expected.items():
+        np.testing.assert_allclose(column(model.calls[0], name), [value], err_msg=name)
+
+
+def test_rolling_std_is_the_sample_std():
+    model = RecordingModel(0)
+    recursive_forecast(model.predict, [[1.0, 2.0, 6.0]], ["2018-03-01"], [3], 1)
+    np.testing.assert_allclose(column(model.calls[0], "rolling_std_3"), [np.std([1, 2, 6], ddof=1)])
+
+
+def test_forecasts_feed_the_next_lags():
+    model = RecordingModel(50)
+    recursive_forecast(model.predict, [[10.0, 20.0, 30.0]], ["2018-03-01"], [3], 3)
+    second, third = model.calls[1], model.calls[2]
+    np.testing.assert_array_equal([column(second, f"lag_{i}")[0] for i in (1, 2, 3)], [50, 30, 20])
+    np.testing.assert_array_equal([column(third, f"lag_{i}")[0] for i in (1, 2, 3)], [50, 50, 30])
+    np.testing.assert_allclose(column(third, "rolling_mean_3"), [130 / 3])
+
+
+def test_calendar_features_wrap_the_year():
+    model = RecordingModel(0)
+    recursive_forecast(model.predict, [[1.0, 2.0, 3.0]], ["2018-11-01"], [23], 3)
+    assert [column(f, "month")[0] for f in model.calls] == [12, 1, 2]
+    assert [column(f, "quarter")[0] for f in model.calls] == [4, 1, 1]
+    assert [column(f, "trend")[0] for f in model.calls] == [23, 24, 25]
+
+
+def test_series_run_in_lock_step():
+    model = RecordingModel(7)
+    forecasts = recursive_forecast(
+        model.predict, [[1.0, 2.0, 3.0], [5.0, 6.0, 7.0]], ["2018-03-01", "2018-06-01"], [3, 10], 4,
+    )
+    assert forecasts.shape == (2, 4)
+    assert len(model.calls) == 4 and all(len(f) == 2 for f in model.calls)
+    np.testing.assert_array_equal(column(model.calls[0], "month"), [4, 7])
+
+
+def test_floor_and_int_truncation():
+    assert recursive_forecast(lambda f: np.full(len(f), -3.7), [[1.0, 2.0, 3.0]], ["2018-03-01"], [3], 2).tolist() == [[0, 0]]
+    assert recursive_forecast(lambda f: np.full(len(f), 7.9), [[1.0, 2.0, 3.0]], ["2018-03-01"], [3], 2).tolist() == [[7, 7]]
+    assert recursive_forecast(lambda f: np.full(len(f), 40.0), [[1.0, 2.0, 3.0]], ["2018-03-01"], [3], 1, floor=100).tolist() == [[100]]
+
+
+def test_short_history_is_rejected():
+    with pytest.raises(ValueError):
+        recursive_forecast(lambda f: f[:, 0], [[1.0, 2.0]], ["2018-02-01"], [2], 3)
+    with pytest.raises(ValueError):
+        recursive_forecast(lambda f: f[:, 0], [[np.nan, 1.0, 2.0]], ["2018-03-01"], [2], 3)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
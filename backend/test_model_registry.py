@@ -0,0 +1,81 @@
+import os
+import pandas as pd
+import pytest
+import services.model_registry as model_registry
+from services.model_registry import entry_key, entry_path, lookup_model, save_model
+
+CONFIG = {"features": ["lag_1", "lag_2", "lag_3"], "max_depth": 4}
+
+
+@pytest.fixture(autouse=True)
+def registry_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(model_registry, "MODEL_REGISTRY_DIR", str(tmp_path))
+    return tmp_path
+
+
+def monthly(values, start="2018-01-01"):
+    return pd.Series(values, index=pd.date_range(start, periods=len(values), freq="MS"), dtype=float)
+
+
+def save_with_file(kind, series_id, series, config, meta):
+    """Giống fit_xgb_model: ghi file mô hình tại entry_path(key, ...) trước rồi mới save_model"""
+    with open(entry_path(entry_key(kind, series_id, series, config), ".ubj"), "w") as f:
+        f.write("booster")
+    return save_model(kind, series_id, series, config, meta)
+
+
+def test_unknown_series_is_a_miss():
+    assert lookup_model("xgboost", "toys", monthly([1, 2, 3]), CONFIG) == (None, None)
+
+
+def test_same_series_is_reused():
+    series = monthly([10, 20, 30, 40])
+    key = save_model("xgboost", "toys", series, CONFIG, {"rounds": 100})
+
+    status, entry = lookup_model("xgboost", "toys", monthly([10, 20, 30, 40]), CONFIG)
+    assert status == "reuse"
+    assert entry["key"] == key and entry["rounds"] == 100
+
+
+def test_appended_months_warm_start_from_the_latest_entry():
+    key = save_model("arima", "toys", monthly([10, 20, 30, 40]), CONFIG, {"params": [0.5, 0.1]})
+
+    status, entry = lookup_model("arima", "toys", monthly([10, 20, 30, 40, 50, 60]), CONFIG)
+    assert status == "warm"
+    assert entry["key"] == key and entry["params"] == [0.5, 0.1]
+
+
+def test_changed_history_or_config_is_a_miss():
+    save_model("xgboost", "toys", monthly([10, 20, 30, 40]), CONFIG, {"rounds": 100})
+    assert lookup_model("xgboost", "toys", monthly([10, 25, 30, 40, 50]), CONFIG) == (None, None)
+    assert lookup_model("xgboost", "toys", monthly([10, 20, 30, 40], start="2018-02-01"), CONFIG) == (None, None)
+    assert lookup_model("xgboost", "toys", monthly([10, 20, 30, 40]), dict(CONFIG, max_depth=6)) == (None, None)
+    assert lookup_model("arima", "toys", monthly([10, 20, 30, 40]), CONFIG) == (None, None)
+
+
+def test_replaced_entry_is_evicted(registry_dir):
+    old_key = save_with_file("xgboost", "toys", monthly([10, 20, 30, 40]), CONFIG, {"rounds": 100})
+    new_key = save_with_file("xgboost", "toys", monthly([10, 20, 30, 40, 50]), CONFIG, {"rounds": 120})
+
+    files = set(os.listdir(registry_dir))
+    assert not any(name.startswith(old_key) for name in files)
+    assert {f"{new_key}.json", f"{new_key}.ubj"} <= files
+    status, entry = lookup_model("xgboost", "toys", monthly([10, 20, 30, 40, 50]), CONFIG)
+    assert status == "reuse" and entry["rounds"] == 120
+
+
+def test_series_ids_with_the_same_history_have_separate_entries(registry_dir):
+    history = [10, 20, 30, 40]
+    toys_key = save_with_file("xgboost", "toys", monthly(history), CONFIG, {"rounds": 100})
+    games_key = save_with_file("xgboost", "games", monthly(history), CONFIG, {"rounds": 100})
+    assert toys_key != games_key
+
+    # Warm start của "toys" thay entry của toys, không đụng tới entry của "games"
+    save_with_file("xgboost", "toys", monthly(history + [50]), CONFIG, {"rounds": 120})
+    assert f"{games_key}.ubj" in os.listdir(registry_dir)
+    status, entry = lookup_model("xgboost", "games", monthly(history), CONFIG)
+    assert status == "reuse" and entry["key"] == games_key
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import services.forecast as forecast
+import services.panel_forecast as panel_forecast
+from utils.cache import clear_cache
+
+# Danh mục có quy mô chênh nhau ~500 lần (giống dữ liệu thật: toys vs danh mục nhỏ)
+CATEGORY_LEVELS = {"tiny": 40, "small": 400, "medium": 4000, "large": 20000}
+MONTHS = pd.date_range("2017-01-01", periods=24, freq="MS")
+
+
+def synthetic_counts():
+    rng = np.random.default_rng(7)
+    t = np.arange(len(MONTHS))
+    return {
+        category: np.round(level * (1 + 0.02 * t + 0.2 * np.sin(2 * np.pi * t / 12)) * rng.normal(1, 0.05, len(t))).astype(int)
+        for category, level in CATEGORY_LEVELS.items()
+    }
+
+
+def install_dataset(monkeypatch, tmp_path):
+    counts = synthetic_counts()
+    months = [m.strftime("%Y-%m") for m in MONTHS]
+    rollup = pd.DataFrame([
+        {"product_category_name": category, "order_month": month, "item_count": int(n)}
+        for category, values in counts.items() for month, n in zip(months, values)
+    ])
+    dataset = pd.DataFrame({
+        "product_category_name": np.repeat(rollup["product_category_name"].to_numpy(), rollup["item_count"].to_numpy()),
+        "order_month": np.repeat(rollup["order_month"].to_numpy(), rollup["item_count"].to_numpy()),
+    })
+    monkeypatch.setattr(panel_forecast, "get_rollup", lambda: rollup)
+    monkeypatch.setattr(forecast, "get_dataset", lambda columns=None: dataset)
+    monkeypatch.setattr(forecast, "save_forecast_result", lambda result: None)
+    monkeypatch.chdir(tmp_path)  # model registry trong thư mục tạm
+    clear_cache(["forecast_"])
+    return counts
+
+
+def test_panel_and_category_forecasts_agree_in_magnitude(monkeypatch, tmp_path):
+    counts = install_dataset(monkeypatch, tmp_path)
+    categories = list(CATEGORY_LEVELS)
+
+    panel = {r["category"]: r for r in panel_forecast.forecast_categories_panel(categories, stat_model="ets")}
+    for category in categories:
+        per_category = forecast.forecast_demand_by_category(category, stat_model="ets")
+        assert panel[category]["status"] == "success" and per_category["status"] == "success"
+
+        panel_mean = np.mean([row["xgboost"] for row in panel[category]["forecast_table"]])
+        category_mean = np.mean([row["xgboost"] for row in per_category["forecast_table"]])
+        recent_mean = counts[category][-3:].mean()
+        assert 1 / 3 < panel_mean / category_mean < 3, (category, panel_mean, category_mean)
+        assert 1 / 3 < panel_mean / recent_mean < 3, (category, panel_mean, recent_mean)
+
+
+def test_series_scale_ignores_padding():
+    values = np.array([[np.nan, 10.0, 20.0], [np.nan, np.nan, np.nan], [0.2, 0.4, 0.6]])
+    np.testing.assert_allclose(panel_forecast.series_scale(values), [15.0, 1.0, 1.0])
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
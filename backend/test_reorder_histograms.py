@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+from services.reorder import _duration_histograms, _late_column
+
+THRESHOLDS = [-5, 0, 2.5, 3, 7, 20, 100]
+
+
+def synthetic_orders():
+    rng = np.random.default_rng(11)
+    n = 400
+    df = pd.DataFrame({
+        "seller_id": rng.choice(["s1", "s2", "s3", "s4", None], n),
+        "shipping_duration": rng.integers(1, 25, n).astype(float),
+        "product_category_name": rng.choice(["toys", "games", "books"], n),
+    })
+    df.loc[rng.choice(n, 30, replace=False), "shipping_duration"] = np.nan
+    return df
+
+
+def histogram_source(df):
+    """Cùng dạng (counts, top_categories) như nhánh pandas của seller_duration_histograms"""
+    counts = df.groupby(["seller_id", "shipping_duration"], observed=True, dropna=False).size()
+    counts = counts[counts > 0].rename("n").reset_index()
+    top = pd.DataFrame({"seller_id": ["s1", "s2", "s3"], "top_category": ["toys", "games", "books"]})
+    return counts, top
+
+
+def test_histograms_match_row_level_aggregates():
+    df = synthetic_orders()
+    histograms = _duration_histograms(*histogram_source(df))
+    rows = df[df["seller_id"].notna()]
+
+    assert list(histograms["sellers"]) == ["s1", "s2", "s3", "s4"]
+    for i, seller in enumerate(histograms["sellers"]):
+        durations = rows.loc[rows["seller_id"] == seller, "shipping_duration"]
+        assert histograms["total_orders"][i] == len(durations)
+        assert histograms["duration_count"][i] == durations.notna().sum()
+        np.testing.assert_allclose(histograms["duration_sum"][i] / histograms["duration_count"][i], durations.mean())
+        for threshold in THRESHOLDS:
+            late = histograms["late_counts"][i, _late_column(histograms, threshold)]
+            assert late == (durations > threshold).sum(), (seller, threshold)
+
+
+def test_top_category_defaults_to_unknown():
+    histograms = _duration_histograms(*histogram_source(synthetic_orders()))
+    assert list(histograms["top_category"]) == ["toys", "games", "books", "Unknown"]
+
+
+def test_last_column_counts_no_late_orders():
+    histograms = _duration_histograms(*histogram_source(synthetic_orders()))
+    assert (histograms["late_counts"][:, -1] == 0).all()
+    assert (histograms["late_counts"][:, 0] == histograms["duration_count"]).all()
+
+
+def test_sellers_without_known_durations():
+    counts = pd.DataFrame({"seller_id": ["s1", "s1"], "shipping_duration": [np.nan, np.nan], "n": [3, 2]})
+    histograms = _duration_histograms(counts, pd.DataFrame({"seller_id": [], "top_category": []}))
+    assert histograms["total_orders"].tolist() == [5]
+    assert histograms["duration_count"].tolist() == [0]
+    assert histograms["late_counts"][0, _late_column(histograms, 20)] == 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
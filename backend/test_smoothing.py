@@ -0,0 +1,95 @@
+import numpy as np
+from services.smoothing import ALPHAS, fit_exponential_smoothing, left_align
+
+PERIODS = 6
+
+
+def sinusoid(n, level=100.0, amplitude=20.0, start=0):
+    t = np.arange(start, start + n)
+    return level + amplitude * np.sin(2 * np.pi * t / 12)
+
+
+def ses_sse(values, alpha, eval_start=2):
+    """SES một chuỗi bằng vòng lặp thường, để đối chiếu với bản vector hóa"""
+    level, sse = values[0], 0.0
+    for t in range(1, len(values)):
+        if t >= eval_start:
+            sse += (values[t] - level) ** 2
+        level = alpha * values[t] + (1 - alpha) * level
+    return sse
+
+
+def test_constant_series_is_reproduced_exactly():
+    fitted = fit_exponential_smoothing(np.full((1, 20), 42.0), PERIODS)
+    np.testing.assert_allclose(fitted["forecast"][0], np.full(PERIODS, 42.0))
+    assert fitted["mse"][0] == 0 and fitted["mae"][0] == 0
+    assert fitted["method"][0] == "ses"
+
+
+def test_linear_series_is_reproduced_exactly():
+    values = 10.0 + 3.0 * np.arange(20)
+    fitted = fit_exponential_smoothing(values[None, :], PERIODS)
+    np.testing.assert_allclose(fitted["forecast"][0], 10.0 + 3.0 * np.arange(20, 20 + PERIODS))
+    np.testing.assert_allclose(fitted["mse"][0], 0, atol=1e-18)
+    assert fitted["method"][0] == "holt"
+
+
+def test_sinusoidal_series_is_reproduced_exactly():
+    fitted = fit_exponential_smoothing(sinusoid(36)[None, :], PERIODS)
+    np.testing.assert_allclose(fitted["forecast"][0], sinusoid(PERIODS, start=36), atol=1e-9)
+    np.testing.assert_allclose(fitted["mse"][0], 0, atol=1e-18)
+    assert fitted["method"][0] == "holt_winters"
+
+
+def test_seasonal_index_follows_series_length():
+    # Độ dài không chia hết cho 12: dự báo phải nối tiếp đúng pha của chu kỳ
+    fitted = fit_exponential_smoothing(sinusoid(31)[None, :], PERIODS)
+    np.testing.assert_allclose(fitted["forecast"][0], sinusoid(PERIODS, start=31), atol=1e-9)
+
+
+def test_holt_winters_needs_two_seasons():
+    fitted = fit_exponential_smoothing(sinusoid(23)[None, :], PERIODS)
+    assert fitted["method"][0] != "holt_winters"
+    assert np.isfinite(fitted["forecast"][0]).all()
+
+
+def test_grid_selection_matches_a_plain_loop():
+    values = np.array([12.0, 15, 11, 19, 14, 22, 18, 17, 25, 21, 20, 27, 24, 23])
+    fitted = fit_exponential_smoothing(values[None, :], PERIODS, methods=("ses",))
+    sse = [ses_sse(values, alpha) for alpha in ALPHAS]
+    best = int(np.argmin(sse))
+    assert fitted["alpha"][0] == ALPHAS[best]
+    np.testing.assert_allclose(fitted["mse"][0], sse[best] / (len(values) - 2))
+
+
+def test_left_align_moves_observed_values_left():
+    aligned, lengths = left_align([[np.nan, 1.0, np.nan, 2.0], [3.0, 4.0, 5.0, 6.0]])
+    np.testing.assert_array_equal(aligned[0, :2], [1.0, 2.0])
+    assert np.isnan(aligned[0, 2:]).all()
+    np.testing.assert_array_equal(aligned[1], [3.0, 4.0, 5.0, 6.0])
+    np.testing.assert_array_equal(lengths, [2, 4])
+
+
+def test_nan_padding_matches_fitting_each_series_alone():
+    series = [sinusoid(36), 10.0 + 3.0 * np.arange(20), np.array([5.0, 9, 4, 8, 7, 6, 9, 5])]
+    matrix = np.full((len(series), 40), np.nan)
+    matrix[0, 4:] = series[0]           # NaN ở đầu (danh mục xuất hiện muộn)
+    matrix[1, :20] = series[1]          # NaN ở cuối
+    matrix[2, 10:18] = series[2]        # NaN cả hai phía
+    batched = fit_exponential_smoothing(matrix, PERIODS)
+
+    for i, values in enumerate(series):
+        alone = fit_exponential_smoothing(values[None, :], PERIODS)
+        np.testing.assert_allclose(batched["forecast"][i], alone["forecast"][0])
+        np.testing.assert_allclose(batched["mse"][i], alone["mse"][0])
+        assert batched["method"][i] == alone["method"][0]
+
+
+def test_empty_matrix():
+    fitted = fit_exponential_smoothing(np.empty((0, 12)), PERIODS)
+    assert fitted["forecast"].shape == (0, PERIODS)
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
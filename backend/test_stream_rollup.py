@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+import services.preprocess as preprocess
+from services.aggregates import ROLLUP_KEYS, ROLLUP_MEASURES, build_rollup
+
+N_ORDERS = 60
+
+
+def write_dataset(folder):
+    """4 file CSV nhỏ theo schema Olist, có cả dữ liệu thiếu (chưa giao, thiếu sản phẩm / khách hàng)"""
+    rng = np.random.default_rng(3)
+    purchase = pd.Timestamp("2018-01-01") + pd.to_timedelta(rng.integers(0, 300, N_ORDERS), unit="D")
+    delivered = purchase + pd.to_timedelta(rng.integers(1, 30, N_ORDERS), unit="D")
+    orders = pd.DataFrame({
+        "order_id": [f"o{i}" for i in range(N_ORDERS)],
+        "customer_id": [f"c{i % 25}" for i in range(N_ORDERS)],
+        "order_status": "delivered",
+        "order_purchase_timestamp": purchase,
+        "order_delivered_timestamp": delivered.where(rng.random(N_ORDERS) > 0.1),
+        "order_estimated_delivery_date": purchase + pd.Timedelta(days=15),
+    })
+    n_items = 150
+    items = pd.DataFrame({
+        "order_id": [f"o{i}" for i in rng.integers(0, N_ORDERS + 5, n_items)],  # vài item không có order
+        "product_id": [f"p{i}" for i in rng.integers(0, 22, n_items)],
+        "seller_id": [f"s{i}" for i in rng.integers(0, 6, n_items)],
+        "price": rng.uniform(10, 200, n_items).round(2),
+        "shipping_charges": rng.uniform(5, 40, n_items).round(2),
+    })
+    items.loc[::13, "shipping_charges"] = np.nan
+    products = pd.DataFrame({
+        "product_id": [f"p{i}" for i in range(20)],
+        "product_category_name": [["toys", "games", "books", "garden"][i % 4] for i in range(20)],
+        "product_weight_g": 500.0, "product_length_cm": 10.0, "product_height_cm": 10.0, "product_width_cm": 10.0,
+    })
+    customers = pd.DataFrame({
+        "customer_id": [f"c{i}" for i in range(22)],
+        "customer_zip_code_prefix": 1000,
+        "customer_city": "sao paulo",
+        "customer_state": [["SP", "RJ", "MG"][i % 3] for i in range(22)],
+    })
+    for name, frame in [("df_Orders.csv", orders), ("df_OrderItems.csv", items),
+                        ("df_Products.csv", products), ("df_Customers.csv", customers)]:
+        frame.to_csv(folder / name, index=False)
+
+
+def normalized(rollup):
+    rollup = rollup.copy()
+    for key in ROLLUP_KEYS:
+        rollup[key] = rollup[key].astype(object).where(rollup[key].notna(), None).astype(str)
+    return rollup.sort_values(ROLLUP_KEYS).reset_index(drop=True)[ROLLUP_KEYS + ROLLUP_MEASURES]
+
+
+@pytest.mark.parametrize("chunksize", [7, 40, 1000])
+def test_stream_rollup_matches_the_in_memory_rollup(monkeypatch, tmp_path, chunksize):
+    write_dataset(tmp_path)
+    monkeypatch.setattr(preprocess, "UPLOAD_FOLDER", str(tmp_path))
+
+    expected = normalized(build_rollup(preprocess.preprocess_data_pandas()))
+    streamed = normalized(preprocess.stream_rollup(chunksize))
+
+    assert expected["item_count"].sum() > 0
+    pd.testing.assert_frame_equal(streamed, expected, check_dtype=False)
+
+
+def test_streamed_chunks_cover_every_merged_row(monkeypatch, tmp_path):
+    write_dataset(tmp_path)
+    monkeypatch.setattr(preprocess, "UPLOAD_FOLDER", str(tmp_path))
+
+    merged = preprocess.preprocess_data_pandas()
+    chunks = list(preprocess.iter_preprocessed_chunks(chunksize=25))
+    assert len(chunks) > 1
+    assert sum(len(chunk) for chunk in chunks) == len(merged)
+    np.testing.assert_allclose(sum(chunk["price"].sum() for chunk in chunks), merged["price"].sum())
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
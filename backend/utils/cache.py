@@ -15,3 +15,14 @@ def get_cache(key):
         else:
             del _cache_store[key]
     return None
+
+def delete_cache(key):
+    _cache_store.pop(key, None)
+
+def clear_cache(prefixes=None):
+    """
+    Xóa các cache key bắt đầu bằng một trong các prefix (xóa tất cả nếu prefixes=None)
+    """
+    for key in list(_cache_store.keys()):
+        if prefixes is None or key.startswith(tuple(prefixes)):
+            del _cache_store[key]
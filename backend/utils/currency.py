@@ -1,34 +1,88 @@
 # utils/currency.py
+import os
+import numpy as np
+import pandas as pd
 
 # Tỷ giá cố định để chuyển đổi từ BRL sang VND
 BRL_TO_VND_RATE = 5200  # 1 BRL = 5,200 VND
 
+# Bảng tỷ giá: (tiền nguồn, tiền đích) -> số đơn vị tiền đích cho 1 đơn vị tiền nguồn
+# Có thể ghi đè tỷ giá BRL -> VND bằng biến môi trường BRL_TO_VND_RATE
+EXCHANGE_RATES = {
+    ("BRL", "VND"): float(os.getenv("BRL_TO_VND_RATE", BRL_TO_VND_RATE)),
+}
+
+def set_exchange_rate(source, target, rate):
+    """
+    Cập nhật tỷ giá trong bảng EXCHANGE_RATES
+    """
+    EXCHANGE_RATES[(source.upper(), target.upper())] = float(rate)
+
+def get_exchange_rate(source, target):
+    """
+    Lấy tỷ giá từ bảng EXCHANGE_RATES (tự suy ra chiều ngược lại nếu cần)
+    """
+    source, target = source.upper(), target.upper()
+    if source == target:
+        return 1.0
+    if (source, target) in EXCHANGE_RATES:
+        return EXCHANGE_RATES[(source, target)]
+    if (target, source) in EXCHANGE_RATES:
+        return 1.0 / EXCHANGE_RATES[(target, source)]
+    raise KeyError(f"No exchange rate configured for {source} -> {target}")
+
+def convert_currency(amount, source="BRL", target="VND"):
+    """
+    Chuyển đổi tiền tệ, làm tròn đến đơn vị (round-half-even như round() của Python)
+
+    Args:
+        amount: Số tiền đơn lẻ, hoặc mảng NumPy / pandas Series cần chuyển đổi cả cột
+
+    Returns:
+        int cho số đơn lẻ; Series / ndarray cùng hình dạng cho mảng
+        (giữ int64 khi không có giá trị thiếu, ngược lại float với NaN)
+    """
+    if amount is None:
+        return None
+
+    rate = get_exchange_rate(source, target)
+    if np.isscalar(amount):
+        return round(amount * rate)
+
+    if isinstance(amount, pd.Series):
+        converted = (amount.astype("float64") * rate).round()
+        return converted if converted.isna().any() else converted.astype("int64")
+
+    converted = np.round(np.asarray(amount, dtype="float64") * rate)
+    return converted if np.isnan(converted).any() else converted.astype("int64")
+
 def brl_to_vnd(amount_brl):
     """
     Chuyển đổi số tiền từ BRL sang VND
-    
+
     Args:
-        amount_brl (float): Số tiền BRL cần chuyển đổi
-        
+        amount_brl (float | Series | ndarray): Số tiền BRL cần chuyển đổi
+
     Returns:
-        float: Số tiền tương ứng bằng VND
+        float: Số tiền tương ứng bằng VND (cùng hình dạng nếu đầu vào là mảng)
     """
-    if amount_brl is None:
-        return None
-    
-    return round(amount_brl * BRL_TO_VND_RATE)
+    return convert_currency(amount_brl, "BRL", "VND")
 
 def format_vnd(amount_vnd):
     """
     Format số tiền VND theo định dạng tiền tệ Việt Nam
-    
+
     Args:
-        amount_vnd (float): Số tiền VND cần format
-        
+        amount_vnd (float | Series): Số tiền VND cần format
+
     Returns:
-        str: Chuỗi tiền tệ đã được format
+        str: Chuỗi tiền tệ đã được format (Series chuỗi nếu đầu vào là Series)
     """
+    if isinstance(amount_vnd, (pd.Series, np.ndarray)):
+        amounts = pd.Series(amount_vnd).fillna(0).astype("int64").astype(str)
+        return amounts.str.replace(r"\B(?=(\d{3})+(?!\d))", ".", regex=True) + " ₫"
+
     if amount_vnd is None:
         return "0 ₫"
-    
-    return f"{int(amount_vnd):,} ₫".replace(",", ".")
\ No newline at end of file
+
+    return f"{int(amount_vnd):,} ₫".replace(",", ".")
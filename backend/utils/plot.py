@@ -2,10 +2,14 @@ import matplotlib.pyplot as plt
 import io
 import base64
 
-def fig_to_base64(fig):
+def fig_to_png(fig):
+    """
+    Render a figure to PNG bytes and close it
+    """
     buf = io.BytesIO()
     fig.savefig(buf, format='png', bbox_inches='tight')
-    buf.seek(0)
-    base64_img = base64.b64encode(buf.read()).decode('utf-8')
     plt.close(fig)
-    return base64_img
+    return buf.getvalue()
+
+def fig_to_base64(fig):
+    return base64.b64encode(fig_to_png(fig)).decode('utf-8')
@@ -3,94 +3,70 @@ import matplotlib.pyplot as plt
 from services.reorder import calculate_reorder_strategy, generate_optimization_recommendations
 import os
 
-# Tính toán chiến lược
-strategy = calculate_reorder_strategy()
-df = pd.DataFrame(strategy)
-
 # Tạo thư mục con cho Reorder charts
 CHART_DIR = os.path.join("charts", "reorder")
-os.makedirs(CHART_DIR, exist_ok=True)
 
-# Xuất bảng Excel
-df.to_excel(os.path.join(CHART_DIR, "reorder_strategy.xlsx"), index=False)
+# Biểu đồ top 10 theo từng chỉ số (key của services.reorder.build_top_charts):
+# (tên file, nhãn trục x, tiêu đề, màu)
+REORDER_CHARTS = {
+    "top_reorder_points": ("reorder_top10.png", "Reorder Point",
+                           "Top 10 danh mục có Reorder Point cao nhất", None),
+    "top_safety_stock": ("reorder_safety_stock_top10.png", "Safety Stock",
+                         "Top 10 danh mục có Safety Stock cao nhất", "orange"),
+    "top_lead_time": ("reorder_lead_time_top10.png", "Average Lead Time (days)",
+                      "Top 10 danh mục có Lead Time dài nhất", "green"),
+    "top_optimal_inventory": ("reorder_optimal_inventory_top10.png", "Optimal Inventory",
+                              "Top 10 danh mục có Optimal Inventory cao nhất", "purple"),
+    "top_holding_cost": ("reorder_holding_cost_top10.png", "Holding Cost",
+                         "Top 10 danh mục có Holding Cost cao nhất", "red"),
+    "top_potential_saving": ("reorder_potential_saving_top10.png", "Potential Saving (₫)",
+                             "Top 10 danh mục có tiềm năng tiết kiệm chi phí cao nhất", "crimson"),
+}
+
+
+def render_reorder_chart(data):
+    """
+    Horizontal bar chart of one top-N series: data = {"chart": <key of REORDER_CHARTS>, "rows": [{category, value}]}
+    """
+    _, xlabel, title, color = REORDER_CHARTS[data["chart"]]
+    rows = pd.DataFrame(data["rows"], columns=["category", "value"])
 
-# ===================== 🔹 Biểu đồ 1: Reorder Point cao nhất
-top10_reorder = df.sort_values("reorder_point", ascending=False).head(10)
-plt.figure(figsize=(12, 6))
-plt.barh(top10_reorder["category"], top10_reorder["reorder_point"])
-plt.xlabel("Reorder Point")
-plt.title("Top 10 danh mục có Reorder Point cao nhất")
-plt.gca().invert_yaxis()
-plt.grid(True)
-plt.tight_layout()
-plt.savefig(os.path.join(CHART_DIR, "reorder_top10.png"))
+    fig = plt.figure(figsize=(12, 6))
+    bars = plt.barh(rows["category"], rows["value"], color=color)
+    plt.xlabel(xlabel)
+    plt.title(title)
+    plt.gca().invert_yaxis()
+    plt.grid(True)
 
-# ===================== 🔹 Biểu đồ 2: Safety Stock cao nhất
-top10_ss = df.sort_values("safety_stock", ascending=False).head(10)
-plt.figure(figsize=(12, 6))
-plt.barh(top10_ss["category"], top10_ss["safety_stock"], color="orange")
-plt.xlabel("Safety Stock")
-plt.title("Top 10 danh mục có Safety Stock cao nhất")
-plt.gca().invert_yaxis()
-plt.grid(True)
-plt.tight_layout()
-plt.savefig(os.path.join(CHART_DIR, "reorder_safety_stock_top10.png"))
+    # Gợi ý tối ưu hóa: ghi số tiền tiết kiệm cạnh mỗi cột
+    if data["chart"] == "top_potential_saving":
+        for bar in bars:
+            width = bar.get_width()
+            plt.text(width + 5000, bar.get_y() + bar.get_height() / 2,
+                     f"{int(width):,} ₫", va='center')
 
-# ===================== 🔹 Biểu đồ 3: Lead time dài nhất
-top10_lt = df.sort_values("avg_lead_time_days", ascending=False).head(10)
-plt.figure(figsize=(12, 6))
-plt.barh(top10_lt["category"], top10_lt["avg_lead_time_days"], color="green")
-plt.xlabel("Average Lead Time (days)")
-plt.title("Top 10 danh mục có Lead Time dài nhất")
-plt.gca().invert_yaxis()
-plt.grid(True)
-plt.tight_layout()
-plt.savefig(os.path.join(CHART_DIR, "reorder_lead_time_top10.png"))
+    plt.tight_layout()
+    return fig
 
-# ===================== 🔹 Biểu đồ 4: Optimal Inventory cao nhất
-top10_opt = df.sort_values("optimal_inventory", ascending=False).head(10)
-plt.figure(figsize=(12, 6))
-plt.barh(top10_opt["category"], top10_opt["optimal_inventory"], color="purple")
-plt.xlabel("Optimal Inventory")
-plt.title("Top 10 danh mục có Optimal Inventory cao nhất")
-plt.gca().invert_yaxis()
-plt.grid(True)
-plt.tight_layout()
-plt.savefig(os.path.join(CHART_DIR, "reorder_optimal_inventory_top10.png"))
 
-# ===================== 🔹 Biểu đồ 5: Holding Cost cao nhất
-unit_holding_cost = 10
-df["holding_cost"] = df["optimal_inventory"] * unit_holding_cost
-top10_holding_cost = df.sort_values("holding_cost", ascending=False).head(10)
-plt.figure(figsize=(12, 6))
-plt.barh(top10_holding_cost["category"], top10_holding_cost["holding_cost"], color="red")
-plt.xlabel("Holding Cost")
-plt.title("Top 10 danh mục có Holding Cost cao nhất")
-plt.gca().invert_yaxis()
-plt.grid(True)
-plt.tight_layout()
-plt.savefig(os.path.join(CHART_DIR, "reorder_holding_cost_top10.png"))
+if __name__ == "__main__":
+    from services.reorder import build_top_charts
 
-# ===================== ✅ Tính toán các đề xuất tối ưu hóa
-recommendations_df = generate_optimization_recommendations(df)
-recommendations_df.to_excel(os.path.join(CHART_DIR, "optimization_recommendations.xlsx"), index=False)
+    os.makedirs(CHART_DIR, exist_ok=True)
 
-# ===================== 🔹 Biểu đồ 6: Gợi ý tối ưu hóa - Potential Saving cao nhất
-top10_saving = recommendations_df.sort_values("potential_saving", ascending=False).head(10)
-plt.figure(figsize=(12, 6))
-bars = plt.barh(top10_saving["category"], top10_saving["potential_saving"], color="crimson")
-plt.xlabel("Potential Saving (₫)")
-plt.title("Top 10 danh mục có tiềm năng tiết kiệm chi phí cao nhất")
-plt.gca().invert_yaxis()
-plt.grid(True)
+    # Tính toán chiến lược và xuất bảng Excel
+    strategy = calculate_reorder_strategy()
+    df = pd.DataFrame(strategy)
+    df.to_excel(os.path.join(CHART_DIR, "reorder_strategy.xlsx"), index=False)
 
-for bar in bars:
-    width = bar.get_width()
-    plt.text(width + 5000, bar.get_y() + bar.get_height() / 2,
-             f"{int(width):,} ₫", va='center')
+    # ===================== ✅ Tính toán các đề xuất tối ưu hóa
+    recommendations_df = generate_optimization_recommendations(strategy, return_df=True)
+    recommendations_df.to_excel(os.path.join(CHART_DIR, "optimization_recommendations.xlsx"), index=False)
 
-plt.tight_layout()
-plt.savefig(os.path.join(CHART_DIR, "reorder_potential_saving_top10.png"))
+    # ===================== 🔹 6 biểu đồ top 10
+    charts = build_top_charts(10)
+    for key, (filename, _, _, _) in REORDER_CHARTS.items():
+        render_reorder_chart({"chart": key, "rows": charts[key]}).savefig(os.path.join(CHART_DIR, filename))
 
-# ✅ Nếu cần hiển thị trực tiếp:
-plt.show()
+    # ✅ Nếu cần hiển thị trực tiếp:
+    plt.show()
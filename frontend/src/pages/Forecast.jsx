@@ -71,13 +71,19 @@ const Forecast = () => {
 
   const historicalData = currentCategoryData?.chart_data.filter((item) => item.type === "Actual") || [];
   const forecastedXGB = currentCategoryData?.chart_data.filter((item) => item.type === "XGBoost") || [];
-  const forecastedARIMA = currentCategoryData?.chart_data.filter((item) => item.type === "ARIMA") || [];
+  // Dự báo thống kê nằm ở key "stat" / type "Stat" (kết quả cũ: "arima" / "ARIMA");
+  // stat_model cho biết mô hình thực sự dùng (ARIMA hoặc ETS)
+  const forecastedStat =
+    currentCategoryData?.chart_data.filter((item) => item.type === "Stat" || item.type === "ARIMA") || [];
+  const statModelLabel = currentCategoryData?.stat_model || "ARIMA";
+  const comparison = currentCategoryData?.mae_rmse_comparison || {};
+  const metrics = { xgboost: comparison.xgboost, stat: comparison.stat ?? comparison.arima };
 
   const currentForecast =
     selectedModel === "xgboost"
       ? forecastedXGB
-      : selectedModel === "arima"
-      ? forecastedARIMA
+      : selectedModel === "stat"
+      ? forecastedStat
       : [...forecastedXGB];
 
   const firstForecast = currentForecast[0];
@@ -144,7 +150,7 @@ const Forecast = () => {
           <label>Select Forecast Model: </label>
           <select value={selectedModel} onChange={(e) => setSelectedModel(e.target.value)}>
             <option value="xgboost">XGBoost</option>
-            <option value="arima">ARIMA</option>
+            <option value="stat">{statModelLabel}</option>
             <option value="both">Compare Both Models</option>
           </select>
         </div>
@@ -180,7 +186,7 @@ const Forecast = () => {
         </div>
         <div className="card-body">
           <ResponsiveContainer width="100%" height={400}>
-            <LineChart data={[...historicalData, ...forecastedXGB, ...forecastedARIMA]}>
+            <LineChart data={[...historicalData, ...forecastedXGB, ...forecastedStat]}>
               <CartesianGrid strokeDasharray="3 3" />
               <XAxis dataKey="month" allowDuplicatedCategory={false} tickFormatter={(value) => value.split("-")[1]} />
               <YAxis />
@@ -212,18 +218,18 @@ const Forecast = () => {
                   data={forecastedXGB}
                 />
               )}
-              {(selectedModel === "arima" || selectedModel === "both") && (
+              {(selectedModel === "stat" || selectedModel === "both") && (
                 <Line
                   type="monotone"
                   dataKey="orders"
                   stroke="#4caf50"
-                  name="ARIMA"
+                  name={statModelLabel}
                   strokeWidth={2}
                   strokeDasharray="6 3"
                   dot={{ r: 4 }}
                   connectNulls
                   animationDuration={1000}
-                  data={forecastedARIMA}
+                  data={forecastedStat}
                 />
               )}
             </LineChart>
@@ -281,25 +287,17 @@ const Forecast = () => {
           </tr>
         </thead>
         <tbody>
-  {["xgboost", "arima"].map((model) => {
-    const mae = currentCategoryData.mae_rmse_comparison[model].mae;
-    const rmse = currentCategoryData.mae_rmse_comparison[model].rmse;
-
-    const betterMaeModel =
-      currentCategoryData.mae_rmse_comparison.xgboost.mae <
-      currentCategoryData.mae_rmse_comparison.arima.mae
-        ? "xgboost"
-        : "arima";
-
-    const betterRmseModel =
-      currentCategoryData.mae_rmse_comparison.xgboost.rmse <
-      currentCategoryData.mae_rmse_comparison.arima.rmse
-        ? "xgboost"
-        : "arima";
+  {["xgboost", "stat"].map((model) => {
+    const mae = metrics[model].mae;
+    const rmse = metrics[model].rmse;
+
+    const betterMaeModel = metrics.xgboost.mae < metrics.stat.mae ? "xgboost" : "stat";
+
+    const betterRmseModel = metrics.xgboost.rmse < metrics.stat.rmse ? "xgboost" : "stat";
 
     return (
 <tr key={model}>
-  <td style={{ fontWeight: "600" }}>{model.toUpperCase()}</td>
+  <td style={{ fontWeight: "600" }}>{model === "stat" ? statModelLabel : model.toUpperCase()}</td>
 
   <td className={model === betterMaeModel ? "highlight-better" : "highlight-worse"}>
     {mae.toLocaleString()}
@@ -252,16 +252,34 @@ export const clearAllCache = () => {
   cacheKeys.forEach((key) => localStorage.removeItem(key))
 }
 
+// Trạng thái job xử lý file upload (chạy nền ở backend)
+export const getUploadStatus = (jobId) => api.get(`/upload/status/${jobId}`)
+
+// Chờ job upload xử lý xong trước khi tải trước dữ liệu
+const waitForUploadJob = async (jobId, interval = 1000) => {
+  for (;;) {
+    const { data } = await getUploadStatus(jobId)
+    if (data.status === "done") return data
+    if (data.status === "error") throw new Error(data.error || "Upload processing failed")
+    await new Promise((resolve) => setTimeout(resolve, interval))
+  }
+}
+
 // API cho upload file
-export const uploadFile = (file) => {
+export const uploadFile = async (file) => {
   const formData = new FormData()
   formData.append("file", file)
 
-  return api.post("/upload/", formData, {
+  const response = await api.post("/upload/", formData, {
     headers: {
       "Content-Type": "multipart/form-data",
     },
   })
+
+  if (response.data?.job_id) {
+    await waitForUploadJob(response.data.job_id)
+  }
+  return response
 }
 
 // Lưu thông tin về file đã upload